@@ -7,8 +7,20 @@ from ro2ya.gene import gene
 from ro2ya.flow import flow_vp
 from ro2ya.flow import flow_nlp
 from ro2ya.flow import flow_debug
+from ro2ya.flow import FlowPipeline
 
 from ro2ya.mind import mind
+from ro2ya.mind import mind_batch
+from ro2ya.mind import mind_session
+from ro2ya.mind import MindScorer
+from ro2ya.mind import MindAssessment
+from ro2ya.mind import MindService
+from ro2ya.mind import MindResultSink
+from ro2ya.mind import MindCohortStats
+from ro2ya.mind import export_results
+from ro2ya.mind import export_mind_bundle
+from ro2ya.mind import benchmark_mind
+from ro2ya.mind import profile_mind
 from ro2ya.roll import roll_processing
 from ro2ya.mars import mars_processing
 
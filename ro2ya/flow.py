@@ -1,23 +1,1626 @@
 from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from xml.sax.saxutils import escape as xml_escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
 from typing import Tuple, Iterable
+from types import SimpleNamespace
 import imageio_ffmpeg as ffmpeg
 from itertools import product
+from array import array
 from docx import Document
 from tqdm import tqdm
 import pandas as pd
+import numpy as np
 import warnings
 import openpyxl
 import requests
 import difflib
 import pickle
 import shutil
+import threading
+import subprocess
+import heapq
+import bisect
+import hashlib
+import gzip
+import sqlite3
+import socket
+import zipfile
+import queue
+import time
 import torch
 import json
 import csv
 import os
 import gc
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 import re
 
+class FlowManifest:
+    '''
+    The processed CSV manifest parsed once and indexed for O(1) lookups.
+
+    -- rows         = every manifest row as a dict, in CSV order.
+    -- course_rows  = Course_Name -> list of rows of that course.
+    -- video_ids    = (Course_Name, first 2 digits of Name) -> Id of the first matching row.
+    '''
+
+    def __init__(self, processed_csv_path, course_column = "Course_Name", video_column = "Name", id_column = "Id"):
+        self.path = processed_csv_path
+        self.course_column = course_column
+        self.video_column = video_column
+        self.id_column = id_column
+
+        self.rows = []
+        self.course_rows = {}
+        self.video_ids = {}
+
+        with open(processed_csv_path, mode="r", encoding="utf-8") as csv_file:
+            csv_reader = csv.DictReader(csv_file, delimiter=",")
+            self.columns = list(csv_reader.fieldnames or [])
+            for row in csv_reader:
+                self.add_row(row)
+
+    def add_row(self, row):
+        self.rows.append(row)
+        course_name = row.get(self.course_column)
+        self.course_rows.setdefault(course_name, []).append(row)
+
+        video_name = row.get(self.video_column) or ""
+        self.video_ids.setdefault((course_name, video_name[:2]), self.parse_id(row.get(self.id_column)))
+
+    @staticmethod
+    def parse_id(value):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+
+    def courses(self):
+        return list(self.course_rows.keys())
+
+    def rows_for_course(self, course_name):
+        return self.course_rows.get(course_name, [])
+
+    def video_id(self, course_name, sql_id):
+        return self.video_ids.get((course_name, str(sql_id).zfill(2)))
+
+    def has_video(self, course_name, sql_id):
+        return (course_name, str(sql_id).zfill(2)) in self.video_ids
+
+class PanelInventory:
+    '''
+    A snapshot of the panel_master tree built once with os.scandir and kept up to date
+    as the stages create, move or remove files, so that listing a folder on a mounted
+    Drive does not cost a network round trip per call.
+
+    -- root     = the scanned panel_master_path.
+    -- entries  = directory path -> {entry name: is_dir} for every directory under root.
+    -- mirror   = an optional ScratchMirror told about every folder, file, move & removal recorded here.
+    '''
+
+    def __init__(self, panel_master_path):
+        self.root = os.path.normpath(os.path.abspath(panel_master_path))
+        self.entries = {}
+        self.mirror = None
+        # Stages may record files from background threads (e.g. the AltTranscriptions writer)
+        self.lock = threading.RLock()
+        if os.path.isdir(self.root):
+            self.scan(self.root)
+
+    def scan(self, directory):
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            listing = {}
+            with os.scandir(current) as it:
+                for entry in it:
+                    is_dir = entry.is_dir()
+                    listing[entry.name] = is_dir
+                    if is_dir:
+                        pending.append(entry.path)
+            self.entries[current] = listing
+
+    def refresh(self, path):
+        # Re-scan a folder that other processes may have changed behind this snapshot
+        path = self.key(path)
+        if not self.covers(path):
+            return
+        with self.lock:
+            self.remove(path, publish=False)
+            if os.path.isdir(path):
+                self.add_dir(path)
+                self.scan(path)
+            elif os.path.exists(path):
+                self.add_file(path)
+
+    def key(self, path):
+        return os.path.normpath(os.path.abspath(path))
+
+    def covers(self, path):
+        path = self.key(path)
+        return path == self.root or path.startswith(self.root + os.sep)
+
+    def exists(self, path):
+        path = self.key(path)
+        if not self.covers(path):
+            return os.path.exists(path)
+        if path == self.root:
+            return path in self.entries
+        parent, name = os.path.split(path)
+        return name in self.entries.get(parent, {})
+
+    def isdir(self, path):
+        path = self.key(path)
+        if not self.covers(path):
+            return os.path.isdir(path)
+        return path in self.entries
+
+    def isfile(self, path):
+        return self.exists(path) and not self.isdir(path)
+
+    def listdir(self, path):
+        path = self.key(path)
+        if not self.covers(path):
+            return os.listdir(path)
+        if path not in self.entries:
+            raise FileNotFoundError(f"No such directory in the panel inventory: '{path}'")
+        return list(self.entries[path].keys())
+
+    def walk(self, path):
+        pending = [self.key(path)]
+        while pending:
+            current = pending.pop(0)
+            listing = self.entries.get(current, {})
+            dirs = [name for name, is_dir in listing.items() if is_dir]
+            files = [name for name, is_dir in listing.items() if not is_dir]
+            yield current, dirs, files
+            pending.extend(os.path.join(current, name) for name in dirs)
+
+    def add_dir(self, path, publish = True):
+        path = self.key(path)
+        with self.lock:
+            if not self.covers(path) or path in self.entries:
+                return
+            self.entries[path] = {}
+            if path != self.root:
+                parent, name = os.path.split(path)
+                self.add_dir(parent, publish)
+                self.entries[parent][name] = True
+            if publish and self.mirror is not None:
+                self.mirror.publish(path)
+
+    def add_file(self, path, publish = True):
+        path = self.key(path)
+        with self.lock:
+            if not self.covers(path) or path == self.root:
+                return
+            parent, name = os.path.split(path)
+            self.add_dir(parent, publish)
+            self.entries[parent][name] = False
+            if publish and self.mirror is not None:
+                self.mirror.publish(path)
+
+    def remove(self, path, publish = True):
+        path = self.key(path)
+        with self.lock:
+            if not self.covers(path):
+                return
+            for directory in [d for d in self.entries if d == path or d.startswith(path + os.sep)]:
+                del self.entries[directory]
+            parent, name = os.path.split(path)
+            self.entries.get(parent, {}).pop(name, None)
+            if publish and self.mirror is not None:
+                self.mirror.publish_remove(path)
+
+    def move(self, src, dst):
+        src, dst = self.key(src), self.key(dst)
+        with self.lock:
+            if self.isdir(dst):
+                dst = os.path.join(dst, os.path.basename(src))
+            was_dir = self.isdir(src)
+            moved = {d: listing for d, listing in self.entries.items() if d == src or d.startswith(src + os.sep)}
+            self.remove(src, publish=False)
+            if not self.covers(dst):
+                return
+
+            # The mirror replays the move itself instead of copying the moved entries again
+            if was_dir:
+                self.add_dir(dst, publish=False)
+                for directory, listing in moved.items():
+                    self.entries[dst + directory[len(src):]] = dict(listing)
+            else:
+                self.add_file(dst, publish=False)
+            if self.mirror is not None:
+                self.mirror.publish_move(src, dst)
+
+class ScratchMirror:
+    '''
+    Write-behind mirroring of a local scratch copy of panel_master back to the Drive mount.
+    The stages work on fast local disk and report what they write (through PanelInventory);
+    a background thread replays those writes, moves & removals on the mount in batches, so the compute
+    never waits on Drive latency. flush() waits for the backlog and verify() re-checks the tree.
+
+    -- scratch_root   = the local working copy the stages run on.
+    -- target_root    = the mounted panel_master_path it is mirrored to.
+    -- batch_size     = the most operations synced together; repeated writes of a file in a batch are synced once.
+    -- batch_seconds  = how long the syncer waits for a batch to fill up.
+    -- copy_workers   = how many files of a batch are copied to the mount at the same time.
+    '''
+
+    def __init__(self, scratch_root, target_root, batch_size = 64, batch_seconds = 2.0, copy_workers = 4):
+        self.scratch_root = os.path.normpath(os.path.abspath(scratch_root))
+        self.target_root = os.path.normpath(os.path.abspath(target_root))
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.copy_workers = copy_workers
+        self.pending = queue.Queue()
+        self.stats = {"batches": 0, "copied": 0, "bytes": 0, "moved": 0, "removed": 0, "errors": 0}
+        self.errors = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def target(self, path):
+        return os.path.join(self.target_root, os.path.relpath(os.path.abspath(path), self.scratch_root))
+
+    def publish(self, path):
+        # A file (re)written or a folder created under scratch_root
+        self.pending.put(("copy", os.path.abspath(path), None))
+
+    def publish_move(self, src, dst):
+        self.pending.put(("move", os.path.abspath(src), os.path.abspath(dst)))
+
+    def publish_remove(self, path):
+        self.pending.put(("remove", os.path.abspath(path), None))
+
+    @staticmethod
+    def copy_file(source, destination):
+        # Written aside and renamed so the other side never shows a half-copied file; the
+        # modification time is carried over so in_sync() can tell the two copies apart later
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(source, destination + ".sync.tmp")
+        stat = os.stat(source)
+        os.utime(destination + ".sync.tmp", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(destination + ".sync.tmp", destination)
+
+    @staticmethod
+    def in_sync(path, other_path, checksum = False, mtime_tolerance = 2.0):
+        '''
+        Whether other_path holds the same file as path: same size and modification time (within
+        mtime_tolerance seconds, for mounts that keep coarse times), and with checksum the same
+        sha256 of the contents too.
+        '''
+
+        try:
+            stat, other_stat = os.stat(path), os.stat(other_path)
+        except OSError:
+            return False
+        if stat.st_size != other_stat.st_size or abs(stat.st_mtime - other_stat.st_mtime) > mtime_tolerance:
+            return False
+        if not checksum:
+            return True
+        digests = []
+        for file_path in (path, other_path):
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+            digests.append(digest.digest())
+        return digests[0] == digests[1]
+
+    def run(self):
+        while True:
+            operation = self.pending.get()
+            if operation is None:
+                self.pending.task_done()
+                return
+            batch = [operation]
+            deadline = time.time() + self.batch_seconds
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self.pending.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            operations = batch[:-1] if stop else batch
+            try:
+                self.sync(operations)
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+            if stop:
+                return
+
+    def sync(self, operations):
+        # Copies between two moves or removals go out in parallel; those keep their place in the order
+        last_copy = {path: i for i, (kind, path, _) in enumerate(operations) if kind == "copy"}
+        copies = []
+        with ThreadPoolExecutor(max_workers=self.copy_workers) as executor:
+            for i, (kind, path, destination) in enumerate(operations):
+                if kind == "copy":
+                    if last_copy[path] == i:
+                        copies.append(path)
+                    continue
+                list(executor.map(self.copy, copies))
+                copies = []
+                if kind == "move":
+                    self.move(path, destination)
+                else:
+                    self.delete(path)
+            list(executor.map(self.copy, copies))
+        with self.lock:
+            self.stats["batches"] += 1
+
+    def failed(self, path, error):
+        with self.lock:
+            self.stats["errors"] += 1
+            self.errors.append((path, str(error)))
+
+    def copy(self, path):
+        target_path = self.target(path)
+        try:
+            if os.path.isdir(path):
+                os.makedirs(target_path, exist_ok=True)
+            elif os.path.isfile(path):
+                self.copy_file(path, target_path)
+                with self.lock:
+                    self.stats["copied"] += 1
+                    self.stats["bytes"] += os.path.getsize(path)
+        except OSError as e:
+            self.failed(path, e)
+
+    def move(self, src, dst):
+        target_src, target_dst = self.target(src), self.target(dst)
+        try:
+            if os.path.exists(target_src):
+                os.makedirs(os.path.dirname(target_dst), exist_ok=True)
+                shutil.move(target_src, target_dst)
+                with self.lock:
+                    self.stats["moved"] += 1
+            else:
+                # The source never reached the mount, so the moved copy is sent instead
+                self.copy(dst)
+        except OSError as e:
+            self.failed(src, e)
+
+    def delete(self, path):
+        target_path = self.target(path)
+        try:
+            if os.path.isdir(target_path) and not os.path.islink(target_path):
+                shutil.rmtree(target_path)
+            elif os.path.lexists(target_path):
+                os.remove(target_path)
+            else:
+                return
+            with self.lock:
+                self.stats["removed"] += 1
+        except OSError as e:
+            self.failed(path, e)
+
+    def flush(self):
+        self.pending.join()
+        return self.stats
+
+    def verify(self, repair = True, checksum = False):
+        '''
+        Compare every file under scratch_root with the mount (see in_sync(): size & modification
+        time, plus the contents with checksum) and return the paths that are missing or differ;
+        with repair they are synced again before returning.
+        '''
+
+        mismatches = []
+        for root, dirs, files in os.walk(self.scratch_root):
+            for name in files:
+                path = os.path.join(root, name)
+                target_path = self.target(path)
+                if not self.in_sync(path, target_path, checksum):
+                    mismatches.append(path)
+        if repair and mismatches:
+            for path in mismatches:
+                self.publish(path)
+            self.flush()
+        return mismatches
+
+    def close(self):
+        self.flush()
+        self.pending.put(None)
+        self.thread.join()
+
+class StreamingDocxWriter:
+    '''
+    A minimal .docx writer that streams the document XML straight into the zip package,
+    paragraph by paragraph, instead of building the whole python-docx object tree in memory.
+
+    Only plain paragraphs in the 'Normal' style are supported, which is all that the
+    AltTranscriptions review document needs; python-docx reads the result back as usual.
+    '''
+
+    W_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+    CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+        '</Types>'
+    )
+
+    PACKAGE_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+        '</Relationships>'
+    )
+
+    DOCUMENT_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    )
+
+    STYLES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<w:styles xmlns:w="{W_NAMESPACE}">'
+        '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+        '</w:styles>'
+    )
+
+    INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+    def __init__(self, docx_path):
+        self.docx_path = docx_path
+        self.package = zipfile.ZipFile(docx_path, "w", compression=zipfile.ZIP_DEFLATED)
+        self.package.writestr("[Content_Types].xml", self.CONTENT_TYPES)
+        self.package.writestr("_rels/.rels", self.PACKAGE_RELS)
+        self.package.writestr("word/_rels/document.xml.rels", self.DOCUMENT_RELS)
+        self.package.writestr("word/styles.xml", self.STYLES)
+
+        self.document = self.package.open("word/document.xml", "w")
+        self.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+        self.write(f'<w:document xmlns:w="{self.W_NAMESPACE}"><w:body>')
+
+    def write(self, xml):
+        self.document.write(xml.encode("utf-8"))
+
+    def add_paragraph(self, text):
+        text = xml_escape(self.INVALID_XML_CHARS.sub("", str(text)))
+        self.write(f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>')
+
+    def close(self):
+        self.write('<w:sectPr/></w:body></w:document>')
+        self.document.close()
+        self.package.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class WordTimingStore:
+    '''
+    The word-level timings of a course kept as parallel arrays per lecture instead of per-word
+    dicts: a token id (into one shared vocabulary of normalised words), a start and an end second
+    for every spoken word, plus the offset of the first word of every transcription segment.
+
+    -- vocabulary  = token id -> normalised word.
+    -- lectures    = sql_id -> (tokens, starts, ends, segment_offsets) arrays.
+    '''
+
+    NON_WORD_CHARS = re.compile(r"[^\w]")
+
+    def __init__(self):
+        self.vocabulary = []
+        self.token_ids = {}
+        self.lectures = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def normalise(cls, word):
+        return cls.NON_WORD_CHARS.sub("", word).lower()
+
+    def token_id(self, word):
+        word = self.normalise(word)
+        if word not in self.token_ids:
+            self.token_ids[word] = len(self.vocabulary)
+            self.vocabulary.append(word)
+        return self.token_ids[word]
+
+    def add_lecture(self, sql_id, segments):
+        # segments = [{'start', 'end', 'text', 'words': [(start, end, word), ...]}, ...]
+        with self.lock:
+            tokens, starts, ends, segment_offsets = [], [], [], []
+            for segment in segments:
+                segment_offsets.append(len(tokens))
+                for start, end, word in segment.get('words') or ():
+                    tokens.append(self.token_id(word))
+                    starts.append(start)
+                    ends.append(end)
+            self.lectures[int(sql_id)] = (np.array(tokens, dtype=np.uint32),
+                                          np.array(starts, dtype=np.float32),
+                                          np.array(ends, dtype=np.float32),
+                                          np.array(segment_offsets, dtype=np.uint32))
+
+    def has_lecture(self, sql_id):
+        return int(sql_id) in self.lectures and len(self.lectures[int(sql_id)][0]) > 0
+
+    def merge(self, other):
+        # Take over the lectures of other that this store does not have, re-mapping their tokens
+        with self.lock:
+            token_map = np.array([self.token_id(word) for word in other.vocabulary], dtype=np.uint32)
+            for sql_id, (tokens, starts, ends, segment_offsets) in other.lectures.items():
+                if sql_id not in self.lectures:
+                    self.lectures[sql_id] = (token_map[tokens] if len(tokens) else np.array([], dtype=np.uint32), starts, ends, segment_offsets)
+        return self
+
+    def save(self, path):
+        arrays = {"vocabulary": np.array(self.vocabulary, dtype=np.str_)}
+        for sql_id, (tokens, starts, ends, segment_offsets) in self.lectures.items():
+            arrays[f"{sql_id}_tokens"] = tokens
+            arrays[f"{sql_id}_starts"] = starts
+            arrays[f"{sql_id}_ends"] = ends
+            arrays[f"{sql_id}_segments"] = segment_offsets
+        # np.savez appends .npz to any other file name
+        with open(path, "wb") as file:
+            np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        store = cls()
+        with np.load(path, allow_pickle=False) as arrays:
+            store.vocabulary = arrays["vocabulary"].tolist()
+            store.token_ids = {word: token for token, word in enumerate(store.vocabulary)}
+            for name in arrays.files:
+                if name.endswith("_tokens"):
+                    sql_id = name[:-len("_tokens")]
+                    store.lectures[int(sql_id)] = (arrays[name], arrays[f"{sql_id}_starts"], arrays[f"{sql_id}_ends"], arrays[f"{sql_id}_segments"])
+        return store
+
+    def align_paragraphs(self, sql_id, paragraphs, lookahead = 32):
+        '''
+        Align the script paragraphs of a lecture (in script order) to its spoken words in a single
+        forward pass and return, per paragraph, its (startWord, endWord, startSecond, endSecond)
+        or None when no word of the paragraph was heard. startWord & endWord are the first and
+        last two script words of the aligned span.
+
+        Word trigrams that occur once in the script and once in the lecture are anchors; the
+        longest chain of anchors in order on both sides is kept (patience sorting, O(n log n)),
+        and between two anchors each script word takes the next equal spoken word at most
+        lookahead words ahead. There is no fuzzy diff, the whole pass is O(n log n + n x lookahead).
+        '''
+
+        tokens, starts, ends, _ = self.lectures[int(sql_id)]
+
+        # Every script word that can be matched, tagged with its paragraph & its position in it
+        script_tokens, script_words = [], []
+        for p, paragraph in enumerate(paragraphs):
+            for w, word in enumerate(paragraph.split()):
+                word = self.normalise(word)
+                if word:
+                    script_tokens.append(self.token_ids.get(word, -1))
+                    script_words.append((p, w))
+
+        spoken_tokens = tokens.tolist()
+
+        # Anchors: word trigrams found exactly once in the script and once in the lecture
+        def trigrams(sequence):
+            found = {}
+            for i in range(len(sequence) - 2):
+                found.setdefault(tuple(sequence[i:i + 3]), []).append(i)
+            return found
+
+        script_trigrams, spoken_trigrams = trigrams(script_tokens), trigrams(spoken_tokens)
+        anchors = sorted((script_positions[0], spoken_trigrams[trigram][0]) for trigram, script_positions in script_trigrams.items()
+                         if len(script_positions) == 1 and len(spoken_trigrams.get(trigram, ())) == 1)
+
+        # The longest chain of anchors in order on both sides (patience sorting, O(n log n))
+        tails, tail_anchors, previous = [], [], [None] * len(anchors)
+        for a, (_, spoken) in enumerate(anchors):
+            k = bisect.bisect_left(tails, spoken)
+            previous[a] = tail_anchors[k - 1] if k else None
+            if k == len(tails):
+                tails.append(spoken)
+                tail_anchors.append(a)
+            else:
+                tails[k] = spoken
+                tail_anchors[k] = a
+        chain = []
+        a = tail_anchors[-1] if tail_anchors else None
+        while a is not None:
+            chain.append(anchors[a])
+            a = previous[a]
+        chain.reverse()
+
+        # Between two anchors, each script word takes the next equal spoken word within lookahead
+        matches = []
+        script_pointer, spoken_pointer = 0, 0
+        for script_anchor, spoken_anchor in chain + [(len(script_tokens), len(spoken_tokens))]:
+            for i in range(script_pointer, script_anchor):
+                for spoken in range(spoken_pointer, min(spoken_pointer + lookahead, spoken_anchor)):
+                    if spoken_tokens[spoken] == script_tokens[i]:
+                        matches.append((i, spoken))
+                        spoken_pointer = spoken + 1
+                        break
+            script_pointer = max(script_pointer, script_anchor)
+            for d in range(3 if script_anchor < len(script_tokens) else 0):
+                if script_anchor + d >= script_pointer and spoken_anchor + d >= spoken_pointer:
+                    matches.append((script_anchor + d, spoken_anchor + d))
+                    script_pointer, spoken_pointer = script_anchor + d + 1, spoken_anchor + d + 1
+
+        # Matches are monotonic, so each paragraph maps to a contiguous span of words
+        spans = {}
+        for i, spoken in matches:
+            p, w = script_words[i]
+            first = spans[p][0] if p in spans else (w, spoken)
+            spans[p] = (first, (w, spoken))
+
+        alignments = []
+        for p, paragraph in enumerate(paragraphs):
+            if p not in spans:
+                alignments.append(None)
+                continue
+            (first_word, first_spoken), (last_word, last_spoken) = spans[p]
+            words = paragraph.split()
+            alignments.append((" ".join(words[first_word:first_word + 2]),
+                               " ".join(words[max(first_word, last_word - 1):last_word + 1]),
+                               int(starts[first_spoken]),
+                               int(ends[last_spoken])))
+        return alignments
+
+class LectureSegments:
+    '''
+    The transcription segments of one lecture kept as parallel arrays between transcription and
+    matching, instead of one nested backend dict per segment: the start & end second of every
+    segment and the offsets of its text inside one string of the whole lecture. Transcriptions.json
+    stores this compact form too; older files holding one backend entry per segment still load.
+
+    -- starts, ends = int seconds per segment.
+    -- offsets      = segment i is text[offsets[i]:offsets[i + 1]].
+    '''
+
+    __slots__ = ("sql_id", "video_id", "starts", "ends", "offsets", "text")
+
+    def __init__(self, sql_id, video_id = None):
+        self.sql_id = sql_id
+        self.video_id = video_id
+        self.starts = array("q")
+        self.ends = array("q")
+        self.offsets = array("q", [0])
+        self.text = ""
+
+    @classmethod
+    def from_segments(cls, sql_id, video_id, segments):
+        # segments = [{'start', 'end', 'text', ...}, ...] as returned by the transcription
+        return cls(sql_id, video_id).extend((segment['start'], segment['end'], segment['text']) for segment in segments)
+
+    def extend(self, segments):
+        # segments = (start, end, text) triples, e.g. another LectureSegments
+        texts = []
+        length = self.offsets[-1]
+        for start, end, text in segments:
+            self.starts.append(int(start))
+            self.ends.append(int(end))
+            length += len(text)
+            self.offsets.append(length)
+            texts.append(text)
+        self.text += "".join(texts)
+        return self
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        for i in range(len(self.starts)):
+            yield self.starts[i], self.ends[i], self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def to_json(self):
+        return {"videoId": self.video_id, "startSecond": self.starts.tolist(), "endSecond": self.ends.tolist(), "offsets": self.offsets.tolist(), "text": self.text}
+
+    @classmethod
+    def from_json(cls, sql_id, data):
+        lecture = cls(sql_id)
+        if isinstance(data, list):
+            # A Transcriptions.json written before the compact format: a list of backend entries
+            lecture.video_id = data[0]['videoId'] if data else None
+            return lecture.extend((entry['paragraphInfo']['startSecond'], entry['paragraphInfo']['endSecond'], entry['paragraphInfo']['paragraphDetails']) for entry in data)
+        lecture.video_id = data["videoId"]
+        lecture.starts = array("q", data["startSecond"])
+        lecture.ends = array("q", data["endSecond"])
+        lecture.offsets = array("q", data["offsets"])
+        lecture.text = data["text"]
+        return lecture
+
+    @classmethod
+    def save_course(cls, path, course_transcription):
+        # course_transcription = sql_id -> LectureSegments, written as compact JSON
+        with open(path, "w", encoding="utf-8") as json_file:
+            json.dump({str(sql_id): lecture.to_json() for sql_id, lecture in course_transcription.items()}, json_file, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load_course(cls, transcriptions_data):
+        # The parsed Transcriptions.json of a course (either format) -> sql_id key -> LectureSegments
+        return {sql_id: data if isinstance(data, cls) else cls.from_json(int(sql_id), data) for sql_id, data in transcriptions_data.items()}
+
+class CourseLeaseQueue:
+    '''
+    A course work queue kept in a SQLite file on the shared panel_master volume, so that any
+    number of worker processes or hosts can claim courses without trampling each other.
+
+    A claimed course is leased for lease_seconds and kept alive by heartbeats; when a worker
+    crashes its lease expires and the course goes back to the other workers.
+
+    -- queue_db_path      = the SQLite file shared by all the workers.
+    -- worker_id          = the name of this worker (host:pid by default).
+    -- lease_seconds      = how long a claim stays valid without a heartbeat.
+    -- heartbeat_seconds  = how often a held course renews its lease.
+    -- max_attempts       = how many claims a course gets before it is marked as failed.
+
+    A course whose worker raised goes back to pending with the error, and is marked as failed
+    once it used up its max_attempts claims.
+    '''
+
+    def __init__(self, queue_db_path, worker_id = None, lease_seconds = 600, heartbeat_seconds = 60, max_attempts = 3):
+        self.queue_db_path = queue_db_path
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_attempts = max_attempts
+
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS course_queue ("
+                "course TEXT PRIMARY KEY, status TEXT NOT NULL, worker TEXT, "
+                "lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, updated REAL, error TEXT)"
+            )
+            # Queues created before errors were kept
+            if "error" not in [column[1] for column in connection.execute("PRAGMA table_info(course_queue)")]:
+                connection.execute("ALTER TABLE course_queue ADD COLUMN error TEXT")
+
+    def connect(self):
+        # Autocommit mode so that every write takes its own explicit IMMEDIATE transaction
+        connection = sqlite3.connect(self.queue_db_path, timeout=60, isolation_level=None)
+        return closing(connection)
+
+    def add_courses(self, course_names):
+        # Courses offered again after they were done (new MP3s landed in them) go back to pending
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT INTO course_queue (course, status, updated) VALUES (?, 'pending', ?) "
+                "ON CONFLICT (course) DO UPDATE SET status = 'pending', attempts = 0, updated = excluded.updated "
+                "WHERE course_queue.status = 'done'",
+                [(course_name, now) for course_name in course_names],
+            )
+            connection.execute("COMMIT")
+
+    def claim(self):
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT course FROM course_queue "
+                "WHERE attempts < ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                "ORDER BY attempts, updated LIMIT 1",
+                (self.max_attempts, now),
+            ).fetchone()
+            if row is None:
+                # Courses whose leases expired too many times are given up on
+                connection.execute(
+                    "UPDATE course_queue SET status = 'failed', worker = NULL, updated = ? "
+                    "WHERE attempts >= ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))",
+                    (now, self.max_attempts, now),
+                )
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE course_queue SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE course = ?",
+                (self.worker_id, now + self.lease_seconds, now, row[0]),
+            )
+            connection.execute("COMMIT")
+        return row[0]
+
+    def heartbeat(self, course_name):
+        now = time.time()
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE course_queue SET lease_expires = ?, updated = ? "
+                "WHERE course = ? AND worker = ? AND status = 'leased'",
+                (now + self.lease_seconds, now, course_name, self.worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, course_name, done = True, error = None):
+        # Not done: back to pending, or failed when the course raised on its last allowed attempt
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE course_queue SET status = CASE WHEN ? THEN 'done' WHEN ? IS NOT NULL AND attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, worker = NULL, lease_expires = NULL, updated = ? "
+                "WHERE course = ? AND worker = ?",
+                (done, error, self.max_attempts, error, time.time(), course_name, self.worker_id),
+            )
+
+    def errors(self):
+        # course -> the last error of the courses that raised and are not done yet
+        with self.connect() as connection:
+            return dict(connection.execute("SELECT course, error FROM course_queue WHERE error IS NOT NULL AND status != 'done'").fetchall())
+
+    def status(self):
+        with self.connect() as connection:
+            return dict(connection.execute("SELECT status, COUNT(*) FROM course_queue GROUP BY status").fetchall())
+
+    @contextmanager
+    def hold(self, course_name):
+        '''
+        Keep the lease of a claimed course alive while the block runs, then release it as
+        done, or with the error when the block raises (see release()). The block gets an Event
+        that is set once the lease is lost; it must then stop before writing anything for the course.
+        '''
+
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def beat():
+            while not stop.wait(self.heartbeat_seconds):
+                if not self.heartbeat(course_name):
+                    print(f"Lost the lease of {course_name} held by {self.worker_id}")
+                    lost.set()
+                    break
+
+        heartbeat_thread = threading.Thread(target=beat, daemon=True)
+        heartbeat_thread.start()
+        try:
+            yield lost
+        except BaseException as e:
+            stop.set()
+            heartbeat_thread.join()
+            self.release(course_name, done=False, error=f"{type(e).__name__}: {e}")
+            raise
+        stop.set()
+        heartbeat_thread.join()
+        self.release(course_name, done=True)
+
+class ManifestLedger:
+    '''
+    The manifest rows already carried through the pipeline, kept in a SQLite file so that a new
+    CSV drop only yields its delta: the rows that are new, whose Mp3 URL or Id changed, or that
+    never got as far as a Final.json. A row is keyed by (Course_Name, Name); a row that comes back
+    with the Id of another row of its course under a new Name replaces it, and the lecture number
+    (sql_id) of the old Name is recorded as superseded so final_matching() can drop it.
+
+    -- ledger_path = the SQLite file, kept across CSV drops (e.g. on the panel_master volume).
+    '''
+
+    def __init__(self, ledger_path, mp3_column = "Mp3", course_column = "Course_Name", video_column = "Name", id_column = "Id"):
+        self.ledger_path = ledger_path
+        self.mp3_column = mp3_column
+        self.course_column = course_column
+        self.video_column = video_column
+        self.id_column = id_column
+
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS manifest_rows ("
+                "course TEXT NOT NULL, name TEXT NOT NULL, mp3_url TEXT, video_id INTEGER, "
+                "status TEXT NOT NULL, updated REAL, PRIMARY KEY (course, name))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS superseded_lectures ("
+                "course TEXT NOT NULL, sql_id INTEGER NOT NULL, PRIMARY KEY (course, sql_id))"
+            )
+
+    def connect(self):
+        connection = sqlite3.connect(self.ledger_path, timeout=60, isolation_level=None)
+        return closing(connection)
+
+    @staticmethod
+    def text(value):
+        # pandas hands missing cells over as NaN
+        return "" if value is None or value != value else str(value)
+
+    def row_key(self, row):
+        return (self.text(row.get(self.course_column)), self.text(row.get(self.video_column)),
+                self.text(row.get(self.mp3_column)), FlowManifest.parse_id(row.get(self.id_column)))
+
+    @staticmethod
+    def sql_id(name):
+        # The lecture number transcribe_lecture() reads from the "NN-Course.mp3" file name
+        try:
+            return int(name[:2])
+        except ValueError:
+            return None
+
+    def delta(self, rows):
+        '''
+        Return the rows (dicts in CSV order) that still need processing and record them as
+        pending; rows already processed with the same Mp3 URL and Id are left out.
+        '''
+
+        now = time.time()
+        delta_rows = []
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            known = {(course, name): (mp3_url, video_id, status) for course, name, mp3_url, video_id, status in
+                     connection.execute("SELECT course, name, mp3_url, video_id, status FROM manifest_rows")}
+            names_by_id = {(course, video_id): name for (course, name), (_, video_id, _) in known.items() if video_id is not None}
+            for row in rows:
+                course, name, mp3_url, video_id = self.row_key(row)
+                if known.get((course, name)) == (mp3_url, video_id, "done"):
+                    continue
+                delta_rows.append(row)
+
+                # The same video under a new Name: the old row (and its lecture number) is gone
+                old_name = names_by_id.get((course, video_id)) if video_id is not None else None
+                if old_name is not None and old_name != name:
+                    known.pop((course, old_name), None)
+                    connection.execute("DELETE FROM manifest_rows WHERE course = ? AND name = ?", (course, old_name))
+                    if self.sql_id(old_name) is not None:
+                        connection.execute("INSERT OR IGNORE INTO superseded_lectures (course, sql_id) VALUES (?, ?)", (course, self.sql_id(old_name)))
+                if video_id is not None:
+                    names_by_id[(course, video_id)] = name
+                known[(course, name)] = (mp3_url, video_id, "pending")
+                connection.execute(
+                    "INSERT OR REPLACE INTO manifest_rows (course, name, mp3_url, video_id, status, updated) "
+                    "VALUES (?, ?, ?, ?, 'pending', ?)",
+                    (course, name, mp3_url, video_id, now),
+                )
+            connection.execute("COMMIT")
+        return delta_rows
+
+    def pending_rows(self):
+        # Course_Name -> [(Name, updated), ...] of its pending rows, the snapshot mark_done() takes
+        pending = {}
+        with self.connect() as connection:
+            for course, name, updated in connection.execute("SELECT course, name, updated FROM manifest_rows WHERE status = 'pending' ORDER BY course, name"):
+                pending.setdefault(course, []).append((name, updated))
+        return pending
+
+    def mark_done(self, course_name, rows):
+        # Only the given (Name, updated) rows: a row a newer CSV drop made pending again stays pending
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            cursor = connection.executemany(
+                "UPDATE manifest_rows SET status = 'done', updated = ? "
+                "WHERE course = ? AND name = ? AND updated = ? AND status = 'pending'",
+                [(time.time(), course_name, name, updated) for name, updated in rows],
+            )
+            connection.execute("COMMIT")
+            return cursor.rowcount
+
+    def superseded_sql_ids(self, course_name):
+        # Lecture numbers of renamed rows that no current row of the course uses any more
+        with self.connect() as connection:
+            superseded = {sql_id for sql_id, in connection.execute("SELECT sql_id FROM superseded_lectures WHERE course = ?", (course_name,))}
+            live = {self.sql_id(name) for name, in connection.execute("SELECT name FROM manifest_rows WHERE course = ?", (course_name,))}
+        return superseded - live
+
+    def status(self):
+        with self.connect() as connection:
+            return dict(connection.execute("SELECT status, COUNT(*) FROM manifest_rows GROUP BY status").fetchall())
+
+class AudioBlobStore:
+    '''
+    A content-addressed store for the downloaded lecture audio. Every MP3 is kept once under its
+    SHA-256 and course folders only hold links to it named NN-Course.mp3, so a lecture that shows
+    up in several courses (by URL or by identical bytes) is fetched, stored and transcribed once.
+
+    -- root     = the store folder; objects/ holds the blobs, transcriptions/ the accepted segments.
+    -- session  = the requests session downloads go through.
+    -- index    = a SQLite file mapping URLs and course links to their checksums.
+
+    stats counts the downloads saved and how each course file was linked; "copied" links are full
+    copies made where the volume (e.g. a Drive mount) allows neither hard nor symbolic links.
+    '''
+
+    def __init__(self, root, session = None):
+        self.root = root
+        self.session = session or requests.Session()
+        for folder in ("objects", "transcriptions", "tmp"):
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+        self.index_path = os.path.join(root, "index.sqlite3")
+        self.stats = {"downloaded": 0, "same_url": 0, "same_bytes": 0, "hardlinked": 0, "symlinked": 0, "copied": 0}
+        self.lock = threading.Lock()
+
+        with self.connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, checksum TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS links (path TEXT PRIMARY KEY, checksum TEXT NOT NULL)")
+
+    def connect(self):
+        return closing(sqlite3.connect(self.index_path, timeout=60, isolation_level=None))
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def blob_path(self, checksum):
+        return os.path.join(self.root, "objects", checksum[:2], f"{checksum}.mp3")
+
+    def fetch(self, mp3_url, chunk_size = 1 << 20):
+        '''
+        Return the checksum of the audio at mp3_url, downloading it only when neither the URL nor
+        its bytes are in the store yet.
+        '''
+
+        with self.connect() as connection:
+            known = connection.execute("SELECT checksum FROM urls WHERE url = ?", (mp3_url,)).fetchone()
+        if known is not None and os.path.exists(self.blob_path(known[0])):
+            self.count("same_url")
+            return known[0]
+
+        # Hash while streaming to a temporary file, then move it under its checksum
+        temporary_path = os.path.join(self.root, "tmp", f"{os.getpid()}-{threading.get_ident()}.part")
+        digest = hashlib.sha256()
+        try:
+            with self.session.get(mp3_url, stream=True) as response:
+                response.raise_for_status()
+                with open(temporary_path, "wb") as mp3_file:
+                    for chunk in response.iter_content(chunk_size):
+                        digest.update(chunk)
+                        mp3_file.write(chunk)
+            checksum = digest.hexdigest()
+
+            blob_path = self.blob_path(checksum)
+            if os.path.exists(blob_path):
+                self.count("same_bytes")
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(temporary_path, blob_path)
+                self.count("downloaded")
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        with self.connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO urls (url, checksum) VALUES (?, ?)", (mp3_url, checksum))
+        return checksum
+
+    def link(self, checksum, mp3_drive_path):
+        # Hardlink when the volume allows it, else a symlink, else (e.g. on Drive mounts) a copy
+        mp3_drive_path = os.path.abspath(mp3_drive_path)
+        if os.path.lexists(mp3_drive_path):
+            if self.checksum_for(mp3_drive_path) == checksum:
+                return mp3_drive_path
+            os.remove(mp3_drive_path)
+
+        blob_path = self.blob_path(checksum)
+        try:
+            os.link(blob_path, mp3_drive_path)
+            self.count("hardlinked")
+        except OSError:
+            try:
+                os.symlink(blob_path, mp3_drive_path)
+                self.count("symlinked")
+            except OSError:
+                shutil.copyfile(blob_path, mp3_drive_path)
+                self.count("copied")
+
+        with self.connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO links (path, checksum) VALUES (?, ?)", (mp3_drive_path, checksum))
+        return mp3_drive_path
+
+    def forget(self, mp3_drive_path):
+        # The course file was replaced by something else than its blob
+        with self.connect() as connection:
+            connection.execute("DELETE FROM links WHERE path = ?", (os.path.abspath(mp3_drive_path),))
+
+    def checksum_for(self, mp3_drive_path):
+        with self.connect() as connection:
+            known = connection.execute("SELECT checksum FROM links WHERE path = ?", (os.path.abspath(mp3_drive_path),)).fetchone()
+        return known[0] if known is not None else None
+
+    def transcription_path(self, checksum):
+        return os.path.join(self.root, "transcriptions", f"{checksum}.json")
+
+    def load_transcription(self, checksum):
+        if not os.path.exists(self.transcription_path(checksum)):
+            return None
+        with open(self.transcription_path(checksum), "r", encoding="utf-8") as json_file:
+            return json.load(json_file)
+
+    def save_transcription(self, checksum, segments):
+        temporary_path = f"{self.transcription_path(checksum)}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as json_file:
+            json.dump(segments, json_file, ensure_ascii=False)
+        os.replace(temporary_path, self.transcription_path(checksum))
+
+class PromptStats:
+    '''
+    Which initial prompts pass the dialect check, per course and overall, persisted as JSON
+    between runs so every lecture starts with the prompt most likely to pass.
+
+    A prompt's pass rate in a course is shrunk towards its overall rate by course_weight
+    pseudo-attempts, so a course with few lectures still borrows from the others.
+
+    -- stats_path     = the JSON file; concurrent workers merge their counts into it on save,
+                        one at a time under a lock on the stats_path + ".lock" sidecar file.
+    -- course_weight  = how many attempts of the overall rate a course's own counts start from.
+    '''
+
+    def __init__(self, stats_path, course_weight = 5):
+        self.stats_path = stats_path
+        self.course_weight = course_weight
+        self.lock = threading.Lock()
+        # counts[course or None][prompt] = [attempts, passes]
+        self.counts = self.read()
+        self.unsaved = {}
+
+    def read(self):
+        counts = {None: {}}
+        if os.path.exists(self.stats_path):
+            with open(self.stats_path, "r", encoding="utf-8") as stats_file:
+                stored = json.load(stats_file)
+            counts[None] = stored.get("overall", {})
+            counts.update(stored.get("courses", {}))
+        return counts
+
+    def overall_rate(self, prompt):
+        attempts, passes = self.counts[None].get(prompt, (0, 0))
+        return (passes + 1) / (attempts + 2)
+
+    def pass_rate(self, course_name, prompt):
+        attempts, passes = self.counts.get(course_name, {}).get(prompt, (0, 0))
+        return (passes + self.course_weight * self.overall_rate(prompt)) / (attempts + self.course_weight)
+
+    def ranked(self, course_name, prompts):
+        # Most likely to pass first; ties keep the configured order
+        with self.lock:
+            return sorted(prompts, key=lambda prompt: -self.pass_rate(course_name, prompt))
+
+    def record(self, course_name, prompt, passed):
+        with self.lock:
+            for scope in (None, course_name):
+                for counts in (self.counts, self.unsaved):
+                    entry = counts.setdefault(scope, {}).setdefault(prompt, [0, 0])
+                    entry[0] += 1
+                    entry[1] += int(passed)
+            self.save()
+
+    @contextmanager
+    def file_lock(self):
+        # Serialises the read -> merge -> replace of save() across processes sharing stats_path
+        with open(f"{self.stats_path}.lock", "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        lock_file.seek(0)
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.05)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def save(self):
+        # Merge this worker's new counts into whatever the other workers saved meanwhile
+        with self.file_lock():
+            counts = self.read()
+            for scope, prompts in self.unsaved.items():
+                for prompt, (attempts, passes) in prompts.items():
+                    entry = counts.setdefault(scope, {}).setdefault(prompt, [0, 0])
+                    entry[0] += attempts
+                    entry[1] += passes
+
+            temporary_path = f"{self.stats_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as stats_file:
+                json.dump({"overall": counts.pop(None), "courses": counts}, stats_file, ensure_ascii=False, indent=4)
+            os.replace(temporary_path, self.stats_path)
+
+            self.counts = self.read()
+        self.unsaved = {}
+
+class TranscriptionScheduler:
+    '''
+    Longest-first scheduling of lecture transcriptions across workers. Audio durations are
+    probed from the MP3 headers up front, and every finished lecture is appended to a run report
+    (JSON lines) so later runs can estimate each file's transcription time from real ones.
+
+    -- report_path      = the JSON-lines run report, read at start and appended to per lecture.
+    -- realtime_factor  = transcription seconds per audio second assumed before any report exists.
+    '''
+
+    DURATION = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+    def __init__(self, report_path, realtime_factor = 0.15):
+        self.report_path = report_path
+        self.default_realtime_factor = realtime_factor
+        self.lock = threading.Lock()
+
+        # The latest report of every file, keyed by its path
+        self.reports = {}
+        if os.path.exists(report_path):
+            with open(report_path, "r", encoding="utf-8") as report_file:
+                for line in report_file:
+                    if line.strip():
+                        report = json.loads(line)
+                        self.reports[report["file"]] = report
+
+    @classmethod
+    def probe_duration(cls, mp3_path):
+        # ffmpeg only reads the headers to print the duration, nothing gets decoded
+        probe = subprocess.run([ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-i", mp3_path], capture_output=True, text=True, errors="replace")
+        match = cls.DURATION.search(probe.stderr)
+        if match is None:
+            return 0.0
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    def probe_durations(self, mp3_paths, probe_workers = 8):
+        with ThreadPoolExecutor(max_workers=probe_workers) as executor:
+            return dict(zip(mp3_paths, executor.map(self.probe_duration, mp3_paths)))
+
+    def realtime_factor(self):
+        audio_seconds = sum(report["audio_seconds"] for report in self.reports.values())
+        transcription_seconds = sum(report["transcription_seconds"] for report in self.reports.values())
+        if audio_seconds <= 0:
+            return self.default_realtime_factor
+        return transcription_seconds / audio_seconds
+
+    def estimate(self, mp3_path, audio_seconds):
+        # A file that was transcribed before is expected to take as long again (retries included)
+        report = self.reports.get(mp3_path)
+        if report is not None and abs(report["audio_seconds"] - audio_seconds) < 1:
+            return report["transcription_seconds"]
+        return audio_seconds * self.realtime_factor()
+
+    def schedule(self, mp3_paths, workers = 1):
+        '''
+        Return (mp3_paths longest-first, their estimated seconds, the projected seconds until the
+        last worker finishes) when the workers keep taking the next file off the ordered list.
+        '''
+
+        durations = self.probe_durations(mp3_paths)
+        estimates = {mp3_path: self.estimate(mp3_path, durations[mp3_path]) for mp3_path in mp3_paths}
+        ordered = sorted(mp3_paths, key=lambda mp3_path: estimates[mp3_path], reverse=True)
+
+        worker_loads = [0.0] * max(1, workers)
+        for mp3_path in ordered:
+            heapq.heappush(worker_loads, heapq.heappop(worker_loads) + estimates[mp3_path])
+        return ordered, {mp3_path: (durations[mp3_path], estimates[mp3_path]) for mp3_path in ordered}, max(worker_loads)
+
+    def record(self, mp3_path, course_name, audio_seconds, transcription_seconds):
+        report = {
+            "file": mp3_path,
+            "course": course_name,
+            "audio_seconds": round(audio_seconds, 2),
+            "transcription_seconds": round(transcription_seconds, 2),
+            "finished": time.time(),
+        }
+        with self.lock:
+            self.reports[mp3_path] = report
+            with open(self.report_path, "a", encoding="utf-8") as report_file:
+                report_file.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+class CatalogueDelivery:
+    '''
+    Streams videosScriptsInfo to the backend in gzip-compressed batches of at most max_batch_bytes
+    (uncompressed JSON) over one kept-alive HTTP session, instead of building and uploading one
+    giant post_request_json.
+
+    Every batch carries an Idempotency-Key derived from its course and content, so a retried or
+    re-run delivery can be de-duplicated by the backend. Connection errors, 429 and 5xx answers
+    are retried with exponential backoff (honouring Retry-After).
+
+    -- endpoint         = the URL every batch is POSTed to.
+    -- max_batch_bytes  = the size bound of one batch before compression.
+    -- max_retries      = how many times a batch is retried before the delivery fails.
+    -- headers          = extra headers sent with every batch (e.g. Authorization).
+    '''
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, endpoint, max_batch_bytes = 4 * 1024 * 1024, max_retries = 5, backoff_seconds = 1.0, timeout = 60, headers = None):
+        self.endpoint = endpoint
+        self.max_batch_bytes = max_batch_bytes
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        self.session.headers.update(headers or {})
+        self.stats = {"courses": 0, "batches": 0, "videos": 0, "bytes": 0, "compressed_bytes": 0, "retries": 0}
+
+    PAYLOAD_START = b'{"videosScriptsInfo": ['
+    PAYLOAD_END = b']}'
+
+    def batches(self, videos):
+        # Each video is serialised once; the bound covers the whole payload, only a video larger than it goes out alone
+        envelope = len(self.PAYLOAD_START) + len(self.PAYLOAD_END) - 1
+        batch, size = [], envelope
+        for video in videos:
+            encoded = json.dumps(video, ensure_ascii=False).encode("utf-8")
+            if batch and size + len(encoded) + 1 > self.max_batch_bytes:
+                yield batch
+                batch, size = [], envelope
+            batch.append(encoded)
+            size += len(encoded) + 1
+        if batch:
+            yield batch
+
+    def post(self, body, headers):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.endpoint, data=body, headers=headers, timeout=self.timeout)
+                if response.status_code not in self.RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                error = requests.HTTPError(f"{response.status_code} from {self.endpoint}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retry_after, error = None, e
+
+            if attempt == self.max_retries:
+                raise error
+            self.stats["retries"] += 1
+            delay = self.backoff_seconds * 2 ** attempt
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            time.sleep(delay)
+
+    def deliver(self, course_name, videos):
+        '''
+        Send the videos (any iterable, e.g. read lazily from a Final.json) of one course and
+        return the number of batches it took.
+        '''
+
+        course_digest = hashlib.sha256(course_name.encode("utf-8")).hexdigest()[:16]
+        batch_count = 0
+        for batch_index, batch in enumerate(self.batches(videos)):
+            payload = self.PAYLOAD_START + b",".join(batch) + self.PAYLOAD_END
+            body = gzip.compress(payload)
+            headers = {
+                "Idempotency-Key": f"{course_digest}-{batch_index}-{hashlib.sha256(payload).hexdigest()[:16]}",
+                "X-Course-Name": quote(course_name),
+                "X-Batch-Index": str(batch_index),
+            }
+            self.post(body, headers)
+
+            batch_count += 1
+            self.stats["batches"] += 1
+            self.stats["videos"] += len(batch)
+            self.stats["bytes"] += len(payload)
+            self.stats["compressed_bytes"] += len(body)
+        self.stats["courses"] += 1
+        return batch_count
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class CatalogueStandInServer:
+    '''
+    A local stand-in for the backend endpoint, to try CatalogueDelivery without the real system.
+    It gunzips every batch, keeps the videos of each new Idempotency-Key (repeats are answered
+    but not stored twice) along with the batch's uncompressed size in payload_sizes, and can fail
+    the first fail_first requests with a 503.
+    '''
+
+    def __init__(self, host = "127.0.0.1", port = 0, fail_first = 0):
+        self.videos = []
+        self.payload_sizes = []
+        self.keys = set()
+        self.requests = 0
+        self.fail_first = fail_first
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stand_in.lock:
+                    stand_in.requests += 1
+                    if stand_in.requests <= stand_in.fail_first:
+                        self.send_response(503)
+                        self.end_headers()
+                        return
+                    key = self.headers.get("Idempotency-Key")
+                    if key not in stand_in.keys:
+                        if self.headers.get("Content-Encoding") == "gzip":
+                            body = gzip.decompress(body)
+                        stand_in.videos.extend(json.loads(body)["videosScriptsInfo"])
+                        stand_in.payload_sizes.append(len(body))
+                        stand_in.keys.add(key)
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FlowPipeline:
+    '''
+    The warm state of a long-running flow_processing worker: the Whisper model, the HTTP session,
+    the parsed manifests, the panel inventories and the reference corpus stay loaded across every
+    job it runs, so uploads arriving through the day skip the cold start of a fresh run.
+    flow_processing() builds one, shares these caches with its stages and returns it.
+
+    -- panel_master_path   = the main folder the jobs run against.
+    -- processed_csv_path  = the processed CSV of a job that does not name its own.
+    -- steps               = the stages of flow_processing() the jobs go through (set by it).
+    -- reference_path      = the reference corpus of the dialect check.
+    -- model_loader        = builds the Whisper model from (model_size, num_workers); CUDA float16 by default.
+    '''
+
+    def __init__(self, panel_master_path, processed_csv_path, steps = None, reference_path = "/content/drive/MyDrive/Final_Automation/egy_reference/egy_reference.txt", model_loader = None):
+        self.panel_master_path = panel_master_path
+        self.processed_csv_path = processed_csv_path
+        self.steps = steps
+        self.reference_path = reference_path
+        self.model_loader = model_loader or self.load_whisper_model
+        # Kept-alive HTTP connections shared by every download
+        self.session = requests.Session()
+        self.manifests = {}
+        self.inventories = {}
+        self.reference_paragraphs = {}
+        self.models = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load_whisper_model(model_size = "large-v2", num_workers = 1):
+        # num_workers > 1 lets several threads call model.transcribe at the same time
+        return WhisperModel(model_size, device="cuda", compute_type="float16", num_workers=num_workers)
+
+    def load_manifest(self, processed_csv_path):
+        # A CSV rewritten behind the cache (e.g. between two jobs) is re-parsed
+        stat = os.stat(processed_csv_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if processed_csv_path not in self.manifests or self.manifests[processed_csv_path][0] != signature:
+                self.manifests[processed_csv_path] = (signature, FlowManifest(processed_csv_path))
+            return self.manifests[processed_csv_path][1]
+
+    def load_inventory(self, panel_master_path):
+        # One directory inventory per panel_master, scanned once and updated as files are written
+        key = os.path.normpath(os.path.abspath(panel_master_path))
+        with self.lock:
+            if key not in self.inventories:
+                self.inventories[key] = PanelInventory(key)
+            return self.inventories[key]
+
+    def load_reference_paragraph(self, file_path = None):
+        file_path = file_path or self.reference_path
+        with self.lock:
+            if file_path not in self.reference_paragraphs:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    self.reference_paragraphs[file_path] = file.read().replace("\n", ' ')
+            return self.reference_paragraphs[file_path]
+
+    def load_model(self, model_size = "large-v2", num_workers = 1):
+        # Loaded on the first job and kept for every later one
+        with self.lock:
+            if (model_size, num_workers) not in self.models:
+                self.models[(model_size, num_workers)] = self.model_loader(model_size, num_workers)
+            return self.models[(model_size, num_workers)]
+
+    def run_job(self, job, chunk_workers = 1, alt_docx = "inline", dedupe = False, segment_retries = False, below_threshold = "reject"):
+        '''
+        Run one job and return the course folders it transcribed & finalised.
+
+        -- {"manifest": csv_src_path, "processed_csv_path": optional}  -> Steps 01-04 for a new manifest.
+        -- {"course": folder_name, "processed_csv_path": optional}     -> Step 04 for one course folder.
+
+        -- below_threshold = "reject" or "accept" (see transcribe_lecture()); a job never asks on the
+                             console, so lectures failing the reference control do not stall the worker.
+        '''
+
+        if below_threshold == "ask":
+            raise ValueError("Pipeline jobs run unattended; below_threshold must be 'accept' or 'reject'")
+
+        steps = self.steps
+        panel_master_path = self.panel_master_path
+        job_csv_path = job.get("processed_csv_path", self.processed_csv_path)
+        inventory = self.load_inventory(panel_master_path)
+        paragraph = self.load_reference_paragraph()
+        model = self.load_model(num_workers = chunk_workers)
+        audio_store = steps.load_audio_store(panel_master_path) if dedupe else None
+
+        if "manifest" in job:
+            steps.process_csv(job["manifest"], job_csv_path)
+            steps.create_course_folders(job_csv_path, panel_master_path)
+            steps.download_and_rename_mp3(job_csv_path, panel_master_path, dedupe = dedupe)
+            manifest = self.load_manifest(job_csv_path)
+            course_names = set(manifest.courses())
+            folder_names = [folder_name for folder_name in inventory.listdir(panel_master_path) if folder_name in course_names]
+        else:
+            # The course folder was uploaded behind the inventory's back
+            inventory.refresh(os.path.join(panel_master_path, job["course"]))
+            manifest = self.load_manifest(job_csv_path)
+            folder_names = [job["course"]]
+
+        finalised = []
+        for folder_name in folder_names:
+            if inventory.isdir(os.path.join(panel_master_path, folder_name)):
+                if steps.transcribe_course(model, paragraph, manifest, inventory, panel_master_path, folder_name, chunk_workers, alt_docx, segment_retries, below_threshold, audio_store):
+                    finalised.append(folder_name)
+        steps.wait_for_alt_transcriptions()
+        return finalised
+
+    def serve(self, jobs_path, poll_seconds = 5, idle_exit_seconds = None, **job_options):
+        '''
+        Steps 01-04 (daemon): Long-Running Pipeline Worker over a Job Spool Folder
+        ــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Takes the job files dropped into jobs_path one at a time through run_job() (job_options are
+        its keyword arguments). A job file NAME.json is claimed by renaming it to NAME.json.running
+        and ends up as NAME.json.done or NAME.json.failed (with the error). Returns after
+        idle_exit_seconds without jobs, or never when idle_exit_seconds is None.
+        '''
+
+        if job_options.get("below_threshold", "reject") == "ask":
+            raise ValueError("serve() runs unattended; below_threshold must be 'accept' or 'reject'")
+
+        os.makedirs(jobs_path, exist_ok=True)
+        self.load_inventory(self.panel_master_path)
+        self.load_reference_paragraph()
+        self.load_model(num_workers = job_options.get("chunk_workers", 1))
+        print(f"Pipeline worker ready, watching {jobs_path}")
+
+        idle_since = time.time()
+        while idle_exit_seconds is None or time.time() - idle_since < idle_exit_seconds:
+            job_names = sorted(name for name in os.listdir(jobs_path) if name.endswith(".json"))
+            if not job_names:
+                time.sleep(poll_seconds)
+                continue
+
+            job_path = os.path.join(jobs_path, job_names[0])
+            try:
+                os.rename(job_path, job_path + ".running")
+            except OSError:
+                # Another worker claimed it first
+                continue
+
+            started = time.time()
+            try:
+                with open(job_path + ".running", "r", encoding="utf-8") as job_file:
+                    self.run_job(json.load(job_file), **job_options)
+            except Exception as e:
+                print(f"Job {job_names[0]} failed: {e}")
+                with open(job_path + ".running", "a", encoding="utf-8") as job_file:
+                    job_file.write(f"\n// {type(e).__name__}: {e}\n")
+                os.rename(job_path + ".running", job_path + ".failed")
+            else:
+                os.rename(job_path + ".running", job_path + ".done")
+                print(f"Job {job_names[0]} done in {time.time() - started:.1f}s")
+            idle_since = time.time()
+
 def flow_processing(csv_src_path, processed_csv_path, panel_master_path, intermediate_path, post_request_json):
     '''
     An automation script based on the Vs and Ps marks that you can use to transform the educational
@@ -29,12 +1632,114 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
     -- intermediate_path   = the intermediate folder that will contain all the final JSONs from the content.
     -- post_request_json   = the final JSON file that is going directly to the backend system.
 
+    Returns the FlowPipeline the stages share: its steps are the stages below (e.g.
+    steps.final_matching(panel_master_path)) and its serve() runs them as a long-running worker.
     '''
-    
-    def process_csv(csv_src_path, processed_csv_path, column_name = "Mp3", split_by = "/", replace_char = "_", new_column_name = "Course_Name"):
+
+    # The warm state (manifests, inventories, HTTP session, reference corpus, Whisper models) every stage below shares
+    pipeline = FlowPipeline(panel_master_path, processed_csv_path)
+    load_manifest = pipeline.load_manifest
+    load_inventory = pipeline.load_inventory
+    load_reference_paragraph = pipeline.load_reference_paragraph
+    http_session = pipeline.session
+
+    # The word timings of the lectures transcribed so far, per course folder, until it is finalised
+    word_timings = {}
+    word_timings_lock = threading.Lock()
+
+    def load_word_timings(full_folder_drive_path):
+        key = os.path.normpath(os.path.abspath(full_folder_drive_path))
+        with word_timings_lock:
+            if key not in word_timings:
+                word_timings[key] = WordTimingStore()
+            return word_timings[key]
+
+    # Files the workers of every host share through panel_master; open_scratch_workspace() leaves them on the mount
+    shared_state_files = ("course_queue.sqlite3", "prompt_stats.json", "transcription_runs.jsonl")
+
+    def shared_state_path(panel_master_path, file_name):
+        mirror = load_inventory(panel_master_path).mirror
+        root = mirror.target_root if mirror is not None else panel_master_path
+        return os.path.join(os.path.normpath(os.path.abspath(root)), file_name)
+
+    # Initial-prompt pass statistics, one JSON file per panel_master
+    prompt_stats = {}
+    prompt_stats_lock = threading.Lock()
+
+    def load_prompt_stats(panel_master_path):
+        key = shared_state_path(panel_master_path, "prompt_stats.json")
+        with prompt_stats_lock:
+            if key not in prompt_stats:
+                prompt_stats[key] = PromptStats(key)
+            return prompt_stats[key]
+
+    # Content-addressed audio stores, by default one next to each panel_master
+    audio_stores = {}
+    audio_stores_lock = threading.Lock()
+
+    def default_audio_store_path(panel_master_path):
+        panel_master_path = os.path.normpath(os.path.abspath(panel_master_path))
+        return os.path.join(os.path.dirname(panel_master_path), f"{os.path.basename(panel_master_path)}_audio_store")
+
+    def load_audio_store(panel_master_path, audio_store_path = None):
+        key = os.path.normpath(os.path.abspath(audio_store_path or default_audio_store_path(panel_master_path)))
+        with audio_stores_lock:
+            if key not in audio_stores:
+                audio_stores[key] = AudioBlobStore(key, http_session)
+            return audio_stores[key]
+
+    def forget_audio_link(mp3_drive_path):
+        # Drop the course file from every audio store that may still map it to a blob
+        default_path = default_audio_store_path(os.path.dirname(os.path.dirname(os.path.abspath(mp3_drive_path))))
+        if os.path.isdir(default_path):
+            load_audio_store(None, default_path)
+        for audio_store in list(audio_stores.values()):
+            audio_store.forget(mp3_drive_path)
+
+    def open_scratch_workspace(panel_master_path, scratch_path = "/content/scratch/panel_master", copy_workers = 8, batch_size = 64, batch_seconds = 2.0):
+        '''
+        Step 00: Opening a Local Scratch Workspace for a Drive-Mounted panel_master
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Copies panel_master (minus the archived lectures_folder MP3s) to fast local disk and
+        returns the scratch path to hand to the later steps instead of panel_master_path. What
+        they write is mirrored back to the mount in the background until close_scratch_workspace().
+
+        The state shared between hosts (the course queue, the prompt statistics and the transcription
+        run report, see shared_state_files) is not staged: the steps keep using it on the mount, so
+        workers on a scratch workspace still share it with the other hosts.
+        '''
+
+        panel_master_path = os.path.normpath(os.path.abspath(panel_master_path))
+        scratch_path = os.path.normpath(os.path.abspath(scratch_path))
+
+        copies = []
+        for root, dirs, files in os.walk(panel_master_path):
+            dirs[:] = [d for d in dirs if d != 'lectures_folder']
+            local_root = os.path.join(scratch_path, os.path.relpath(root, panel_master_path))
+            os.makedirs(local_root, exist_ok=True)
+            for name in files:
+                if root == panel_master_path and name.startswith(shared_state_files):
+                    continue
+                source, local = os.path.join(root, name), os.path.join(local_root, name)
+                # A file already copied by an earlier session (same size & time) is not fetched again
+                if not ScratchMirror.in_sync(source, local):
+                    copies.append((source, local))
+
+        with ThreadPoolExecutor(max_workers=copy_workers) as executor:
+            list(tqdm(executor.map(lambda copy: ScratchMirror.copy_file(*copy), copies), total=len(copies), desc="Staging panel_master locally", unit="File"))
+
+        pipeline.inventories.pop(scratch_path, None)
+        inventory = load_inventory(scratch_path)
+        inventory.mirror = ScratchMirror(scratch_path, panel_master_path, batch_size, batch_seconds)
+        print(f"Scratch workspace {scratch_path} mirrors {panel_master_path} ({len(copies)} files staged)")
+        return scratch_path
+
+    def process_csv(csv_src_path, processed_csv_path, column_name = "Mp3", split_by = "/", replace_char = "_", new_column_name = "Course_Name", ledger_path = None):
         '''
         Step 01: CSV File Editing & Panel Master Creating
         ــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        -- ledger_path = a ManifestLedger file; the processed CSV then only keeps the new or changed
+                         rows of this drop, so the later steps only touch the affected courses.
         '''
         
         # Step 3: Read the CSV file
@@ -47,10 +1752,17 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
             return info
     
         df[new_column_name] = df[column_name].apply(extract_info)
+
+        if ledger_path is not None:
+            ledger = ManifestLedger(ledger_path, mp3_column = column_name, course_column = new_column_name)
+            delta_rows = ledger.delta(df.to_dict("records"))
+            print(f"Manifest delta: {len(delta_rows)} of {len(df)} rows are new or changed")
+            df = pd.DataFrame(delta_rows, columns=df.columns)
     
         # Step 5: Save the updated DataFrame to a new CSV file
         df.to_csv(processed_csv_path, index=False)
-    
+        pipeline.manifests.pop(processed_csv_path, None)
+
         print(f"DataFrame saved to '{processed_csv_path}'.")
     
         # Step 6: Remove the original CSV file
@@ -67,283 +1779,848 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         '''
         
         # Check if panel_master directory exists
-        if not os.path.exists(panel_master_path):
+        inventory = load_inventory(panel_master_path)
+        if not inventory.exists(panel_master_path):
             print("Error: panel_master directory not found.")
             return
     
-        # Create a set to store unique course names
-        unique_course_names = set()
-    
-        # Read the CSV file and extract course names
-        with open(processed_csv_path, mode="r", encoding="utf-8") as csv_file:
-            csv_reader = csv.DictReader(csv_file, delimiter=",")
-            for row in csv_reader:
-                course_name = row['Course_Name']
-                unique_course_names.add(course_name)
-    
+        # Unique course names straight from the shared manifest index
+        unique_course_names = load_manifest(processed_csv_path).courses()
+
         # Create folders for unique course names
         for course_name in unique_course_names:
             course_folder_path = os.path.join(panel_master_path, course_name)
             os.makedirs(course_folder_path, exist_ok=True)
+            inventory.add_dir(course_folder_path)
             print(f"Created folder: {course_folder_path}")
     
-    def download_mp3(mp3_url, panel_master_path, video_name, course_name, pbar):
+    def download_mp3(mp3_url, panel_master_path, video_name, course_name, pbar, inventory = None, audio_store = None):
         '''
         Step 03.01: Downloading the initial MP3 Files
         ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        -- audio_store = an AudioBlobStore to fetch through; the course file is then a link to its blob.
+        '''
+    
+        try:
+            # Create the new file name based on the format: first 2 digits of "Video Name" - "Course_Name"
+            new_mp3_name = f"{video_name[:2]}-{course_name}.mp3"
+            mp3_drive_path = f"{panel_master_path}/{new_mp3_name}"
+
+            if audio_store is not None:
+                audio_store.link(audio_store.fetch(mp3_url), mp3_drive_path)
+            else:
+                response = http_session.get(mp3_url)
+                response.raise_for_status()
+
+                # A file an earlier dedupe run linked to a blob is replaced, never written through
+                if os.path.lexists(mp3_drive_path):
+                    forget_audio_link(mp3_drive_path)
+                with open(mp3_drive_path + ".part", "wb") as mp3_file:
+                    mp3_file.write(response.content)
+                os.replace(mp3_drive_path + ".part", mp3_drive_path)
+            if inventory is not None:
+                inventory.add_file(mp3_drive_path)
+    
+            pbar.update(1)  # Update the collective progress bar
+            return mp3_drive_path
+        except requests.RequestException as e:
+            print(f"Failed to download {mp3_url}. Error: {e}")
+            return None
+    
+    def download_and_rename_mp3(processed_csv_path, panel_master_path, mp3_column = "Mp3", course_column = "Course_Name", video_column = "Name", dedupe = False, audio_store_path = None):
+        '''
+        Step 03.02: Downloading the processed MP3 Files and Renaming them
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        -- dedupe            = fetch through the content-addressed audio store, so a lecture shared by
+                              several courses (same URL or same bytes) is downloaded & stored once.
+        -- audio_store_path  = the store folder; defaults to <panel_master>_audio_store next to panel_master.
+        '''
+        
+        # Check if the panel_master directory exists
+        inventory = load_inventory(panel_master_path)
+        if not inventory.exists(panel_master_path):
+            print(f"Error: {panel_master_path} directory not found in Google Drive.")
+            return
+    
+        # Rows come from the shared manifest instead of re-reading the CSV
+        manifest = load_manifest(processed_csv_path)
+
+        # Index the panel_master folders once by their lower-cased names
+        folder_names = inventory.listdir(panel_master_path)
+        folders_by_name = {}
+        for folder_name in folder_names:
+            folders_by_name.setdefault(folder_name.lower(), []).append(folder_name)
+
+        audio_store = load_audio_store(panel_master_path, audio_store_path) if dedupe else None
+
+        total_folders = len(folder_names)
+        with tqdm(total=total_folders, desc="MP3 Downloading", unit="Audio File") as pbar:
+            for row in manifest.rows:
+                mp3_url = row[mp3_column]
+                course_name_csv = row[course_column]
+                video_name_csv = row[video_column]
+
+                # Check if the course_name in the CSV file matches any of the folders in panel_master
+                for folder_name in folders_by_name.get(course_name_csv.lower(), []):
+                    full_panel_master_path = os.path.join(panel_master_path, folder_name)
+
+                    # Download the mp3 file into the respective folder with the new name in Google Drive
+                    download_mp3(mp3_url, full_panel_master_path, video_name_csv, course_name_csv, pbar, inventory, audio_store)
+
+        if audio_store is not None:
+            print(f"Audio store {audio_store.root}: {audio_store.stats}")
+    
+    # change egyption context among the new prompts, most likely to pass first (see PromptStats)
+    initial_prompt_options = [
+        'Transcribe this Egyptian speech into written text: هتشوف الحياة بطريقة مختلفة أوي عن الأول',
+        'Transcribe this Egyptian speech into written text: طب لو أنا عايز أخس يبقى إيه هي المكملات اللي هتفيدني',
+        ]
+
+    def is_sentence_matched(paragraph, sentence):
+        # Tokenize the paragraph and sentence into words
+        paragraph_tokens = paragraph.split()
+        sentence_tokens = sentence.split()
+
+        # Initialize a matcher using SequenceMatcher
+        matcher = difflib.SequenceMatcher(None, paragraph_tokens, sentence_tokens)
+
+        # Get matching blocks (sequences of matching words)
+        matching_blocks = matcher.get_matching_blocks()
+
+        # Calculate the total length of matching words
+        total_matched_length = sum(match.size for match in matching_blocks)
+
+        # Determine if the sentence is matched
+        sentence_length = len(sentence_tokens)
+        return total_matched_length / sentence_length
+
+    def load_whisper_model(model_size = "large-v2", num_workers = 1):
+        # Unlike pipeline.load_model(), a fresh model the caller releases when done with it
+        return FlowPipeline.load_whisper_model(model_size, num_workers)
+
+    def split_audio_at_silences(audio, sampling_rate = 16000, chunk_seconds = 600, min_silence_duration_ms = 2000):
+        '''
+        Step 04.00: Splitting a Long Lecture at its Long Silences
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Runs the VAD once and returns (start_sample, end_sample) chunks of about chunk_seconds
+        that cover the whole audio and are only ever cut in the middle of a silence.
+        '''
+
+        speech_chunks = get_speech_timestamps(audio, vad_options=VadOptions(min_silence_duration_ms=min_silence_duration_ms))
+        if not speech_chunks:
+            return [(0, len(audio))]
+
+        chunk_samples = int(chunk_seconds * sampling_rate)
+        boundaries = [0]
+        for previous, current in zip(speech_chunks[:-1], speech_chunks[1:]):
+            # Cut in the silence before the speech that would overflow the current chunk
+            if current['end'] - boundaries[-1] > chunk_samples:
+                boundaries.append((previous['end'] + current['start']) // 2)
+        boundaries.append(len(audio))
+
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def whisper_options(initial_prompt, **overrides):
+        transcribe_options = dict(vad_filter=True,
+                                  beam_size = 11,
+                                  best_of = 9,
+                                  word_timestamps = True,
+                                  no_speech_threshold = 0.2,
+                                  vad_parameters = dict(min_silence_duration_ms = 2000),
+                                  initial_prompt = initial_prompt
+                                  )
+        transcribe_options.update(overrides)
+        return transcribe_options
+
+    def collect_segments(segments_g, offset = 0.0):
+        segments = []
+        for segment in segments_g:
+            words = [(word.start + offset, word.end + offset, word.word) for word in segment.words or ()]
+            segments.append({'start': segment.start + offset, 'end': segment.end + offset, 'text': segment.text, 'words': words})
+        return segments
+
+    def run_transcription(model, full_file_drive_path, initial_prompt, chunk_workers = 1, long_lecture_seconds = 1200, sampling_rate = 16000, audio = None):
+        '''
+        Step 04.00: Transcribing one MP3 File, Chunk-Parallel for Long Lectures
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Lectures longer than long_lecture_seconds are split at long silences and the chunks are
+        transcribed by chunk_workers threads; segments come back with absolute start/end seconds.
+
+        -- audio = the file already decoded at sampling_rate, so retries of a lecture decode it once.
+        '''
+
+        transcribe_options = whisper_options(initial_prompt)
+
+        if chunk_workers <= 1:
+            segments_g, _ = model.transcribe(full_file_drive_path if audio is None else audio, **transcribe_options)
+            return collect_segments(segments_g)
+
+        if audio is None:
+            audio = decode_audio(full_file_drive_path, sampling_rate=sampling_rate)
+        duration = len(audio) / sampling_rate
+        if duration < long_lecture_seconds:
+            segments_g, _ = model.transcribe(audio, **transcribe_options)
+            return collect_segments(segments_g)
+
+        chunks = split_audio_at_silences(audio, sampling_rate, chunk_seconds = duration / chunk_workers)
+
+        def transcribe_chunk(chunk):
+            start_sample, end_sample = chunk
+            segments_g, _ = model.transcribe(audio[start_sample:end_sample], **transcribe_options)
+            return collect_segments(segments_g, offset = start_sample / sampling_rate)
+
+        with ThreadPoolExecutor(max_workers=chunk_workers) as executor:
+            chunk_segments = list(executor.map(transcribe_chunk, chunks))
+
+        # Chunks are disjoint and in time order, so stitching is a plain concatenation
+        return [segment for segments in chunk_segments for segment in segments]
+
+    def retranscribe_failing_segments(model, paragraph, full_file_drive_path, segments, alternate_prompts, threshold = 0.6, padding_seconds = 0.5, sampling_rate = 16000, audio = None):
+        '''
+        Step 04.00: Re-decoding only the Segments that Failed the Reference Control
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Segments scoring below threshold are grouped into time ranges between their passing
+        neighbours, and only those ranges are transcribed again, once per alternate prompt (then
+        once more without conditioning on previous text) until they pass. A range keeps its
+        best-scoring transcription and the segments come back merged in time order.
+
+        -- audio = the decoded file of the first transcription, reused instead of decoding it again.
+        '''
+
+        def score(range_segments):
+            if not range_segments:
+                return 0.0
+            return sum(is_sentence_matched(paragraph, segment['text']) for segment in range_segments) / len(range_segments)
+
+        # Runs of adjacent failing segments, each bounded by the passing segments around it
+        passing = [score([segment]) >= threshold for segment in segments]
+        ranges = []
+        for i, segment in enumerate(segments):
+            if passing[i]:
+                continue
+            if ranges and ranges[-1]['last'] == i - 1:
+                ranges[-1]['last'] = i
+            else:
+                ranges.append({'first': i, 'last': i})
+        if not ranges:
+            return segments
+
+        if audio is None:
+            audio = decode_audio(full_file_drive_path, sampling_rate=sampling_rate)
+        duration = len(audio) / sampling_rate
+        for time_range in ranges:
+            lower = segments[time_range['first'] - 1]['end'] if time_range['first'] > 0 else 0.0
+            upper = segments[time_range['last'] + 1]['start'] if time_range['last'] + 1 < len(segments) else duration
+            time_range['start'] = max(lower, segments[time_range['first']]['start'] - padding_seconds)
+            time_range['end'] = min(upper, segments[time_range['last']]['end'] + padding_seconds)
+            time_range['segments'] = segments[time_range['first']:time_range['last'] + 1]
+            time_range['score'] = score(time_range['segments'])
+
+        attempts = [(prompt, {}) for prompt in alternate_prompts]
+        attempts.append((alternate_prompts[0] if alternate_prompts else None, {"condition_on_previous_text": False, "temperature": (0.2, 0.4, 0.6)}))
+        for initial_prompt, overrides in attempts:
+            failing = [time_range for time_range in ranges if time_range['score'] < threshold]
+            if not failing:
+                break
+            for time_range in failing:
+                start_sample, end_sample = int(time_range['start'] * sampling_rate), int(time_range['end'] * sampling_rate)
+                segments_g, _ = model.transcribe(audio[start_sample:end_sample], **whisper_options(initial_prompt, **overrides))
+                candidate = collect_segments(segments_g, offset = time_range['start'])
+                if candidate and score(candidate) > time_range['score']:
+                    time_range['segments'], time_range['score'] = candidate, score(candidate)
+
+        retranscribed = [segment for segment, passed in zip(segments, passing) if passed]
+        for time_range in ranges:
+            retranscribed.extend(time_range['segments'])
+        redone_seconds = sum(time_range['end'] - time_range['start'] for time_range in ranges)
+        print(f"Re-decoded {len(ranges)} failing ranges ({redone_seconds:.0f}s of {duration:.0f}s) of {os.path.basename(full_file_drive_path)}")
+        return sorted(retranscribed, key=lambda segment: segment['start'])
+
+    def sort_mp3_files(mp3_files):
+        return sorted(mp3_files, key=lambda x: int(x.split("-")[0].strip()) if x.split("-")[0].strip().isdigit() else float('inf'))
+
+    def transcribe_lecture(model, paragraph, manifest, folder_name, full_file_drive_path, chunk_workers = 1, segment_retries = False, below_threshold = "ask", audio_store = None):
+        '''
+        Step 04.01: Transcribing one MP3 File with Reference Control
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Returns the (sql_id, LectureSegments) of the lecture, or None when it cannot be used.
+
+        -- segment_retries = when the first transcription fails, re-decode only its failing segments
+                             with the other prompts before falling back to whole-file retries.
+        -- below_threshold = what a failed reference control does: "ask" on the console whether to
+                             override it; or, once every prompt was tried, "accept" the best attempt
+                             or "reject" the lecture, for runs without anyone at the console.
+        -- audio_store     = the AudioBlobStore the course MP3s were linked from, if any; a lecture
+                             whose blob was already transcribed under another course is reused.
         '''
-    
+
+        if below_threshold not in ("ask", "accept", "reject"):
+            raise ValueError(f"below_threshold must be 'ask', 'accept' or 'reject', not {below_threshold!r}")
+
+        file_name = os.path.basename(full_file_drive_path)
+
         try:
-            response = requests.get(mp3_url)
-            response.raise_for_status()
-    
-            # Create the new file name based on the format: first 2 digits of "Video Name" - "Course_Name"
-            new_mp3_name = f"{video_name[:2]}-{course_name}.mp3"
-            mp3_drive_path = f"{panel_master_path}/{new_mp3_name}"
-    
-            with open(mp3_drive_path, "wb") as mp3_file:
-                mp3_file.write(response.content)
-    
-            pbar.update(1)  # Update the collective progress bar
-        except requests.RequestException as e:
-            print(f"Failed to download {mp3_url}. Error: {e}")
-    
-    def download_and_rename_mp3(processed_csv_path, panel_master_path, mp3_column = "Mp3", course_column = "Course_Name", video_column = "Name"):
+            sql_id = int(file_name[:2])
+        except ValueError:
+            print(f"Error extracting SQL ID from {file_name}")
+            return None
+        print(f"Extracted SQL ID {sql_id} from {file_name}")
+
+        course_name_parts = folder_name.split("-")
+        course_name = course_name_parts[1].strip() if len(course_name_parts) > 1 else folder_name.strip()
+
+        if manifest.has_video(course_name, sql_id):
+            video_id = manifest.video_id(course_name, sql_id)
+            print(f"Matched video ID {video_id} for SQL ID {sql_id} in {course_name}")
+        else:
+            video_id = None
+            print(f"No matching video ID found for SQL ID {sql_id} in {course_name}")
+
+        # A lecture already accepted under another course (same bytes) is not transcribed again
+        checksum = audio_store.checksum_for(full_file_drive_path) if audio_store is not None else None
+        segments = audio_store.load_transcription(checksum) if checksum is not None else None
+        if segments is not None:
+            print(f"Reusing the transcription of {checksum[:12]} for {file_name}")
+
+        panel_master_path = os.path.dirname(os.path.dirname(os.path.abspath(full_file_drive_path)))
+        stats = load_prompt_stats(panel_master_path)
+        prompt_order = stats.ranked(course_name, initial_prompt_options)
+        attempt = 0
+        best_attempt = None
+
+        # Decoded once for every prompt tried and for the segment retries
+        audio = decode_audio(full_file_drive_path, sampling_rate=16000) if segments is None else None
+
+        flag = segments is None
+        while flag:
+            initial_prompt = prompt_order[attempt % len(prompt_order)]
+            segments = run_transcription(model, full_file_drive_path, initial_prompt, chunk_workers, audio = audio)
+            if not segments:
+                break
+
+            ## if avg prob of segment matched egyption more than 50% will sucessed.
+            summation_prob = 0
+            for segment in segments:
+                summation_prob += is_sentence_matched(paragraph, segment['text'])
+            avg_prob = summation_prob / len(segments)
+
+            if avg_prob < 0.6 and segment_retries and attempt == 0:
+                segments = retranscribe_failing_segments(model, paragraph, full_file_drive_path, segments, [prompt for prompt in prompt_order if prompt != initial_prompt], audio = audio)
+                avg_prob = sum(is_sentence_matched(paragraph, segment['text']) for segment in segments) / len(segments)
+            # Recorded after the segment retries, so a prompt whose lecture they rescued is credited
+            stats.record(course_name, initial_prompt, avg_prob >= 0.6)
+
+            if avg_prob >= 0.6:
+                print(f"\nSuccessful initial sentence: {segments[0]['text']} of video_{sql_id} has avg_prob = {int(avg_prob*100)}%")
+                print(f"The initial prompt is: [ {initial_prompt} ]")
+                flag = False
+            else:
+                print(f"FAILED at the initial sentence {segments[0]['text']} with avg_prob = {int(avg_prob * 100)}%")
+                print(f"The initial prompt is: [ {initial_prompt} ]")
+
+                if below_threshold == "ask":
+                    # Condition override technique
+                    user_input = input(f"\nDo you want to override and accept this as 0.6 matching? (y/n): ")
+                    if user_input.lower() == 'y':
+                        flag = False
+                else:
+                    if best_attempt is None or avg_prob > best_attempt[0]:
+                        best_attempt = (avg_prob, segments)
+                    if attempt + 1 >= len(prompt_order):
+                        if below_threshold == "reject":
+                            print(f"Rejected {file_name}: no prompt passed the reference control")
+                            return None
+                        avg_prob, segments = best_attempt
+                        print(f"Accepted the best attempt of {file_name} with avg_prob = {int(avg_prob * 100)}%")
+                        flag = False
+
+            attempt += 1
+
+        if not segments:
+            print(f"No segments/transcriptions found for {file_name}")
+            return None
+
+        if checksum is not None:
+            audio_store.save_transcription(checksum, segments)
+        load_word_timings(os.path.dirname(full_file_drive_path)).add_lecture(sql_id, segments)
+
+        return sql_id, LectureSegments.from_segments(sql_id, video_id, segments)
+
+    # Background writers for the AltTranscriptions review documents
+    docx_jobs = []
+    docx_executor = ThreadPoolExecutor(max_workers=1)
+
+    def write_alt_transcriptions(inventory, folder_name, merged_docx_drive_path, videos):
+        # videos = [(sql_id, (startSecond, endSecond, paragraphDetails) triples e.g. a LectureSegments), ...]
+        with StreamingDocxWriter(merged_docx_drive_path) as merged_doc:
+            for sql_id, paragraphs in videos:
+                merged_doc.add_paragraph(f"[V{sql_id}]")
+                for start_second, end_second, paragraph_details in paragraphs:
+                    merged_doc.add_paragraph(f"Start: {start_second:.2f}s,  End: {end_second:.2f}s")
+                    merged_doc.add_paragraph(paragraph_details)
+        inventory.add_file(merged_docx_drive_path)
+        print(f"Saved transcriptions for {folder_name} to {merged_docx_drive_path}")
+
+    def wait_for_alt_transcriptions():
+        # Surface any error of the background writers before the step returns
+        while docx_jobs:
+            docx_jobs.pop(0).result()
+
+    def finalise_course(inventory, folder_name, full_folder_drive_path, course_transcription, alt_docx = "inline"):
         '''
-        Step 03.02: Downloading the processed MP3 Files and Renaming them
-        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Step 04.02: Saving the Course Transcriptions & Archiving its MP3 Files
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        -- alt_docx = "inline" writes the AltTranscriptions.docx right away, "background" hands it to
+                      a writer thread off the transcription loop, and "off" skips it altogether.
         '''
-        
-        # Check if the panel_master directory exists
-        if not os.path.exists(panel_master_path):
-            print(f"Error: {panel_master_path} directory not found in Google Drive.")
-            return
-    
-        # Read the CSV file
-        with open(processed_csv_path, mode="r", encoding="utf-8") as csv_file:
-            csv_reader = csv.DictReader(csv_file, delimiter=",")
-    
-            total_folders = len(os.listdir(panel_master_path))
-            with tqdm(total=total_folders, desc="MP3 Downloading", unit="Audio File") as pbar:
-                for row in csv_reader:
-                    mp3_url = row[mp3_column]
-                    course_name_csv = row[course_column]
-                    video_name_csv = row[video_column]
-    
-                    # Check if the course_name in the CSV file matches any of the folders in panel_master
-                    for folder_name in os.listdir(panel_master_path):
-                        if course_name_csv.lower() == folder_name.lower():
-                            full_panel_master_path = os.path.join(panel_master_path, folder_name)
-    
-                            # Download the mp3 file into the respective folder with the new name in Google Drive
-                            download_mp3(mp3_url, full_panel_master_path, video_name_csv, course_name_csv, pbar)
-    
-    # change egyption context among the new prompts
-    idx = 0
-    initial_prompt_options = [
-        'Transcribe this Egyptian speech into written text: هتشوف الحياة بطريقة مختلفة أوي عن الأول',
-        'Transcribe this Egyptian speech into written text: طب لو أنا عايز أخس يبقى إيه هي المكملات اللي هتفيدني',
-        ]
-    
-    def transcribe_mp3_files_faster_whisper(panel_master_path, processed_csv_path):
+
+        def has_transcription_json(folder_path):
+            for filename in inventory.listdir(folder_path):
+                if filename.endswith('Transcriptions.json'):
+                    return True
+            return False
+
+        # Lectures transcribed by an earlier run (e.g. before a manifest delta) are kept, the new ones win
+        course_json_drive_path = os.path.join(full_folder_drive_path, f"{folder_name} Transcriptions.json")
+        if inventory.exists(course_json_drive_path):
+            with open(course_json_drive_path, "r", encoding="utf-8") as json_file:
+                earlier_transcription = LectureSegments.load_course(json.load(json_file))
+            earlier_transcription = {int(sql_id): lecture for sql_id, lecture in earlier_transcription.items()}
+            earlier_transcription.update(course_transcription)
+            course_transcription = dict(sorted(earlier_transcription.items()))
+
+        if alt_docx != "off":
+            videos = []
+            for sql_id, lecture in course_transcription.items():
+                videos.append((sql_id, lecture))
+
+            merged_docx_drive_path = os.path.join(full_folder_drive_path, f"{folder_name} AltTranscriptions.docx")
+            if alt_docx == "background":
+                docx_jobs.append(docx_executor.submit(write_alt_transcriptions, inventory, folder_name, merged_docx_drive_path, videos))
+            else:
+                write_alt_transcriptions(inventory, folder_name, merged_docx_drive_path, videos)
+
+        LectureSegments.save_course(course_json_drive_path, course_transcription)
+        inventory.add_file(course_json_drive_path)
+        print(f"Saved JSON for {folder_name} to {course_json_drive_path}")
+
+        with word_timings_lock:
+            course_word_timings = word_timings.pop(os.path.normpath(os.path.abspath(full_folder_drive_path)), None)
+        if course_word_timings is not None and course_word_timings.lectures:
+            word_timings_drive_path = os.path.join(full_folder_drive_path, f"{folder_name} WordTimings.npz")
+            if inventory.exists(word_timings_drive_path):
+                course_word_timings.merge(WordTimingStore.load(word_timings_drive_path))
+            course_word_timings.save(word_timings_drive_path)
+            inventory.add_file(word_timings_drive_path)
+
+        if has_transcription_json(full_folder_drive_path):
+            lectures_folder_path = os.path.join(full_folder_drive_path, 'lectures_folder')
+            if not inventory.exists(lectures_folder_path):
+                os.mkdir(lectures_folder_path)
+                inventory.add_dir(lectures_folder_path)
+            for filename in inventory.listdir(full_folder_drive_path):
+                file_path = os.path.join(full_folder_drive_path, filename)
+                if filename.endswith('.mp3'):
+                    shutil.move(file_path, os.path.join(lectures_folder_path, filename))
+                    inventory.move(file_path, os.path.join(lectures_folder_path, filename))
+
+    def transcribe_mp3_files_faster_whisper(panel_master_path, processed_csv_path, chunk_workers = 1, alt_docx = "inline", segment_retries = False, dedupe = False, audio_store_path = None):
         '''
         Step 04: Debugging Mode for Transcription with Reference Control
         ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        -- dedupe = the MP3s were downloaded with dedupe; a lecture whose audio store blob was already
+                    transcribed is reused (audio_store_path as in download_and_rename_mp3()).
         '''
-    
-        def is_sentence_matched(paragraph, sentence):
-              # Tokenize the paragraph and sentence into words
-              paragraph_tokens = paragraph.split()
-              sentence_tokens = sentence.split()
-    
-              # Initialize a matcher using SequenceMatcher
-              matcher = difflib.SequenceMatcher(None, paragraph_tokens, sentence_tokens)
-    
-              # Get matching blocks (sequences of matching words)
-              matching_blocks = matcher.get_matching_blocks()
-    
-              # Calculate the total length of matching words
-              total_matched_length = sum(match.size for match in matching_blocks)
-    
-              # Determine if the sentence is matched
-              sentence_length = len(sentence_tokens)
-              return total_matched_length / sentence_length
-    
-        file_path = "/content/drive/MyDrive/Final_Automation/egy_reference/egy_reference.txt"
-        with open(file_path, 'r', encoding='utf-8') as file:
-            paragraph = file.read().replace("\n", ' ')
-    
-        global idx
-        # Load CSV file to get the total file count
-        df = pd.read_csv(processed_csv_path)
-        if 'Course_Name' not in df.columns:
+
+        audio_store = load_audio_store(panel_master_path, audio_store_path) if dedupe else None
+        paragraph = load_reference_paragraph()
+
+        # Load the shared manifest to get the total file count
+        manifest = load_manifest(processed_csv_path)
+        if 'Course_Name' not in manifest.columns:
             print("Error: 'Course_Name' column missing in CSV!")
             return
-        total_files = int(df['Course_Name'].nunique())
+        total_files = len(manifest.courses())
         print(f"Total unique courses in CSV: {total_files}")
-    
-        def has_transcription_json(folder_path):
-            for filename in os.listdir(folder_path):
-                if filename.endswith('Transcriptions.json'):
-                    return True
-            return False
-    
-        for folder_name in os.listdir(panel_master_path):
+
+        inventory = load_inventory(panel_master_path)
+
+        for folder_name in inventory.listdir(panel_master_path):
             full_folder_drive_path = os.path.join(panel_master_path, folder_name)
-    
+
             if full_folder_drive_path.endswith('.docx') or full_folder_drive_path.endswith('.txt') or full_folder_drive_path.endswith('.csv') or full_folder_drive_path.endswith(".ipynb_checkpoints"):
                 continue
-    
-            mp3_files = [f for f in os.listdir(full_folder_drive_path) if f.lower().endswith('.mp3')]
+            if not inventory.isdir(full_folder_drive_path):
+                continue
+
+            mp3_files = [f for f in inventory.listdir(full_folder_drive_path) if f.lower().endswith('.mp3')]
             if len(mp3_files) == 0:
                 print(f"No MP3 files found in {folder_name}")
                 continue
-    
-            mp3_files.sort(key=lambda x: int(x.split("-")[0].strip()) if x.split("-")[0].strip().isdigit() else float('inf'))
+
+            mp3_files = sort_mp3_files(mp3_files)
             print(f"Found {len(mp3_files)} MP3 files in {folder_name}")
-    
+
             # Initialize the model and load weights before processing MP3 files
-            model_size = "large-v2"
-            model = WhisperModel(model_size, device="cuda", compute_type="float16")
-    
+            model = load_whisper_model(num_workers = chunk_workers)
+
             mp3_files_progress = tqdm(mp3_files, desc=f"\nTranscribing {folder_name}", unit="File")
             course_transcription = {}
-    
+
             for file_name in mp3_files_progress:
                 full_file_drive_path = os.path.join(full_folder_drive_path, file_name)
-    
-                try:
-                    sql_id = int(file_name[:2])
-                except ValueError:
-                    print(f"Error extracting SQL ID from {file_name}")
-                    continue
-                print(f"Extracted SQL ID {sql_id} from {file_name}")
-    
-                course_name_parts = folder_name.split("-")
-                course_name = course_name_parts[1].strip() if len(course_name_parts) > 1 else folder_name.strip()
-    
-                matching_rows = df[(df['Course_Name'] == course_name) & (df['Name'].str[:2] == str(sql_id).zfill(2))]
-                if not matching_rows.empty:
-                    video_id = int(matching_rows['Id'].values[0])
-                    print(f"Matched video ID {video_id} for SQL ID {sql_id} in {course_name}")
-                else:
-                    video_id = None
-                    print(f"No matching video ID found for SQL ID {sql_id} in {course_name}")
-                flag = True
-                while flag:
-                    segments_g, _ = model.transcribe(full_file_drive_path,
-                                                  vad_filter=True,
-                                                  beam_size = 11,
-                                                  best_of = 9,
-                                                  word_timestamps = True,
-                                                  no_speech_threshold = 0.2,
-                                                  vad_parameters = dict(min_silence_duration_ms = 2000),
-                                                  initial_prompt = initial_prompt_options[idx % len(initial_prompt_options)]
-                                                  )
-    
-                    segments = []
-                    segment_id = 0
-                    for segment in segments_g:
-                        segments.append({})
-                        segments[segment_id]['start'] = segment.start
-                        segments[segment_id]['end'] = segment.end
-                        segments[segment_id]['text'] = segment.text
-                        segment_id += 1
-    
-                    ## if avg prob of segment matched egyption more than 50% will sucessed.
-                    summation_prob = 0
-                    for segment in segments:
-                        summation_prob += is_sentence_matched(paragraph, segment['text'])
-                    avg_prob = summation_prob / len(segments)
-    
-                    if avg_prob >= 0.6:
-                        print(f"\nSuccessful initial sentence: {segments[0]['text']} of video_{sql_id} has avg_prob = {int(avg_prob*100)}%")
-                        print(f"The initial prompt is: [ {initial_prompt_options[idx % len(initial_prompt_options)]} ]")
-                        flag = False
-                    else:
-                        print(f"FAILED at the initial sentence {segments[0]['text']} with avg_prob = {int(avg_prob * 100)}%")
-                        print(f"The initial prompt is: [ {initial_prompt_options[idx % len(initial_prompt_options)]} ]")
-    
-                        # Condition override technique
-                        user_input = input(f"\nDo you want to override and accept this as 0.6 matching? (y/n): ")
-                        if user_input.lower() == 'y':
-                            flag = False
-    
-                    idx += 1
-    
-                if not segments:
-                    print(f"No segments/transcriptions found for {file_name}")
+
+                result = transcribe_lecture(model, paragraph, manifest, folder_name, full_file_drive_path, chunk_workers, segment_retries, audio_store = audio_store)
+                if result is None:
                     continue
-    
-                entry_list = []
-                view_index = 1
-                for segment in segments:
-                    entry = {
-                        "videoId": video_id,
-                        "sqlId": sql_id,
-                        "paragraphInfo": {
-                            "id": "",
-                            "viewIndex": view_index,
-                            "startWord": "",
-                            "endWord": "",
-                            "startSecond": int(segment['start']),
-                            "endSecond": int(segment['end']),
-                            "paragraphDetails": segment['text'],
-                            "objectiveId": "",
-                            "skillsInfo": [
-                                {
-                                    "skillId": ""
-                                }
-                            ]
-                        }
-                    }
-                    entry_list.append(entry)
-                    view_index += 1
-    
+                sql_id, lecture = result
+
                 if sql_id not in course_transcription:
-                    course_transcription[sql_id] = []
-                course_transcription[sql_id].extend(entry_list)
-    
+                    course_transcription[sql_id] = LectureSegments(sql_id, lecture.video_id)
+                course_transcription[sql_id].extend(lecture)
+
             mp3_files_progress.close()
-    
+
             # Release model memory and clear GPU cache
             gc.collect()
             del model
             torch.cuda.empty_cache()
-    
+
             if not course_transcription:
                 print(f"No transcriptions generated for {folder_name}")
                 continue
-    
-            merged_doc = Document()
-            for sql_id, entries in course_transcription.items():
-                video_id_str = f"[V{sql_id}]"
-                merged_doc.add_paragraph(video_id_str, style='Normal')
-                for entry in entries:
-                    timestamp = f"Start: {entry['paragraphInfo']['startSecond']:.2f}s,  End: {entry['paragraphInfo']['endSecond']:.2f}s"
-                    merged_doc.add_paragraph(timestamp, style='Normal')
-                    merged_doc.add_paragraph(entry['paragraphInfo']['paragraphDetails'])
-    
-            merged_docx_drive_path = os.path.join(full_folder_drive_path, f"{folder_name} AltTranscriptions.docx")
-            merged_doc.save(merged_docx_drive_path)
-            print(f"Saved transcriptions for {folder_name} to {merged_docx_drive_path}")
-    
-            course_json_drive_path = os.path.join(full_folder_drive_path, f"{folder_name} Transcriptions.json")
-            with open(course_json_drive_path, "w", encoding="utf-8") as json_file:
-                json.dump(course_transcription, json_file, ensure_ascii=False, indent=4)
-            print(f"Saved JSON for {folder_name} to {course_json_drive_path}")
-    
-            if has_transcription_json(full_folder_drive_path):
-                lectures_folder_path = os.path.join(full_folder_drive_path, 'lectures_folder')
-                if not os.path.exists(lectures_folder_path):
-                    os.mkdir(lectures_folder_path)
-                for filename in os.listdir(full_folder_drive_path):
-                    file_path = os.path.join(full_folder_drive_path, filename)
-                    if filename.endswith('.mp3'):
-                        shutil.move(file_path, os.path.join(lectures_folder_path, filename))
-    
+
+            finalise_course(inventory, folder_name, full_folder_drive_path, course_transcription, alt_docx)
+
+        wait_for_alt_transcriptions()
         print(f"Transcriptions for all courses completed successfully")
+
+    def download_and_transcribe_pipelined(processed_csv_path, panel_master_path, download_workers = 4, transcription_workers = 1, queue_size = 8, chunk_workers = 1, alt_docx = "inline", mp3_column = "Mp3", course_column = "Course_Name", video_column = "Name", dedupe = False, audio_store_path = None, segment_retries = False):
+        '''
+        Step 03 + 04: Pipelined Downloading & Transcription
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Finished downloads go into a bounded queue that the transcription workers drain at once,
+        and each course is saved & archived as soon as its last lecture lands.
+        '''
+
+        inventory = load_inventory(panel_master_path)
+        if not inventory.exists(panel_master_path):
+            print(f"Error: {panel_master_path} directory not found in Google Drive.")
+            return
+
+        manifest = load_manifest(processed_csv_path)
+        paragraph = load_reference_paragraph()
+        audio_store = load_audio_store(panel_master_path, audio_store_path) if dedupe else None
+
+        folders_by_name = {}
+        for folder_name in inventory.listdir(panel_master_path):
+            folders_by_name.setdefault(folder_name.lower(), []).append(folder_name)
+
+        # Every (row, folder) pair is one expected lecture of that folder
+        jobs = []
+        pending_lectures = {}
+        for row in manifest.rows:
+            for folder_name in folders_by_name.get(row[course_column].lower(), []):
+                jobs.append((row, folder_name))
+                pending_lectures[folder_name] = pending_lectures.get(folder_name, 0) + 1
+
+        course_transcriptions = {folder_name: {} for folder_name in pending_lectures}
+        ready_lectures = queue.Queue(maxsize=queue_size)
+        lock = threading.Lock()
+
+        def download_job(row, folder_name, pbar):
+            full_panel_master_path = os.path.join(panel_master_path, folder_name)
+            mp3_drive_path = None
+            try:
+                mp3_drive_path = download_mp3(row[mp3_column], full_panel_master_path, row[video_column], row[course_column], pbar, inventory, audio_store)
+            finally:
+                # A failed download still counts towards its course so the course can be finalised
+                ready_lectures.put((folder_name, mp3_drive_path))
+
+        def lecture_landed(folder_name, result):
+            with lock:
+                if result is not None:
+                    sql_id, lecture = result
+                    course_transcriptions[folder_name].setdefault(sql_id, LectureSegments(sql_id, lecture.video_id)).extend(lecture)
+                pending_lectures[folder_name] -= 1
+                if pending_lectures[folder_name] > 0:
+                    return
+                course_transcription = dict(sorted(course_transcriptions.pop(folder_name).items()))
+
+            full_folder_drive_path = os.path.join(panel_master_path, folder_name)
+            if not course_transcription:
+                print(f"No transcriptions generated for {folder_name}")
+                return
+            finalise_course(inventory, folder_name, full_folder_drive_path, course_transcription, alt_docx)
+
+        def transcription_worker():
+            model = load_whisper_model(num_workers = chunk_workers)
+            try:
+                while True:
+                    item = ready_lectures.get()
+                    if item is None:
+                        break
+                    folder_name, mp3_drive_path = item
+                    result = None
+                    # A failing lecture must still land, or the downloads block on the full queue
+                    # and its course is never finalised
+                    try:
+                        if mp3_drive_path is not None:
+                            result = transcribe_lecture(model, paragraph, manifest, folder_name, mp3_drive_path, chunk_workers, segment_retries, audio_store = audio_store)
+                    except Exception as e:
+                        print(f"Failed to transcribe {mp3_drive_path}. Error: {e!r}")
+                    try:
+                        lecture_landed(folder_name, result)
+                    except Exception as e:
+                        print(f"Failed to finalise {folder_name}. Error: {e!r}")
+            finally:
+                # Release model memory and clear GPU cache
+                gc.collect()
+                del model
+                torch.cuda.empty_cache()
+
+        workers = [threading.Thread(target=transcription_worker, daemon=True) for _ in range(transcription_workers)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            with tqdm(total=len(jobs), desc="MP3 Downloading", unit="Audio File") as pbar:
+                with ThreadPoolExecutor(max_workers=download_workers) as executor:
+                    for future in [executor.submit(download_job, row, folder_name, pbar) for row, folder_name in jobs]:
+                        future.result()
+        finally:
+            # Even when a download raised, the workers are stopped (releasing their models) and the writers awaited
+            for _ in workers:
+                ready_lectures.put(None)
+            for worker in workers:
+                worker.join()
+            wait_for_alt_transcriptions()
+
+        if audio_store is not None:
+            print(f"Audio store {audio_store.root}: {audio_store.stats}")
+        print(f"Pipelined downloads & transcriptions for all courses completed successfully")
     
+    def transcribe_with_course_queue(panel_master_path, processed_csv_path, queue_db_path = None, worker_id = None, lease_seconds = 600, heartbeat_seconds = 60, chunk_workers = 1, alt_docx = "inline", segment_retries = False, dedupe = False, audio_store_path = None):
+        '''
+        Step 04 (sharded): Transcription Worker on a Shared Course Queue
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Any number of processes or hosts can run this against the same panel_master; each one
+        claims a course, transcribes & finalises it, and releases it before claiming the next.
+
+        -- dedupe = the MP3s were downloaded with dedupe; a lecture whose audio store blob was already
+                    transcribed is reused (audio_store_path as in download_and_rename_mp3()).
+        '''
+
+        audio_store = load_audio_store(panel_master_path, audio_store_path) if dedupe else None
+
+        if queue_db_path is None:
+            queue_db_path = shared_state_path(panel_master_path, "course_queue.sqlite3")
+        course_queue = CourseLeaseQueue(queue_db_path, worker_id, lease_seconds, heartbeat_seconds)
+
+        paragraph = load_reference_paragraph()
+        manifest = load_manifest(processed_csv_path)
+        inventory = load_inventory(panel_master_path)
+
+        # Every worker offers the courses with unarchived MP3s; done ones among them are queued again
+        course_folders = []
+        for folder_name in inventory.listdir(panel_master_path):
+            full_folder_drive_path = os.path.join(panel_master_path, folder_name)
+            if inventory.isdir(full_folder_drive_path) and any(f.lower().endswith('.mp3') for f in inventory.listdir(full_folder_drive_path)):
+                course_folders.append(folder_name)
+        course_queue.add_courses(course_folders)
+
+        model = None
+        while True:
+            folder_name = course_queue.claim()
+            if folder_name is None:
+                break
+            print(f"{course_queue.worker_id} claimed {folder_name}")
+
+            # A course that raises goes back to the queue with its error (see CourseLeaseQueue.release)
+            # and this worker carries on with the next one, keeping its model
+            try:
+                with course_queue.hold(folder_name) as lease_lost:
+                    full_folder_drive_path = os.path.join(panel_master_path, folder_name)
+
+                    # Another worker may have touched this course since the inventory was scanned
+                    inventory.refresh(full_folder_drive_path)
+                    if not inventory.isdir(full_folder_drive_path):
+                        continue
+
+                    mp3_files = sort_mp3_files([f for f in inventory.listdir(full_folder_drive_path) if f.lower().endswith('.mp3')])
+                    if len(mp3_files) == 0:
+                        print(f"No MP3 files found in {folder_name}")
+                        continue
+
+                    # The model is loaded once per worker and kept across the claimed courses
+                    if model is None:
+                        model = load_whisper_model(num_workers = chunk_workers)
+
+                    course_transcription = {}
+                    for file_name in tqdm(mp3_files, desc=f"\nTranscribing {folder_name}", unit="File"):
+                        if lease_lost.is_set():
+                            break
+                        result = transcribe_lecture(model, paragraph, manifest, folder_name, os.path.join(full_folder_drive_path, file_name), chunk_workers, segment_retries, audio_store = audio_store)
+                        if result is None:
+                            continue
+                        sql_id, lecture = result
+                        course_transcription.setdefault(sql_id, LectureSegments(sql_id, lecture.video_id)).extend(lecture)
+
+                    # A course reclaimed by another worker is left to it, nothing is written
+                    if lease_lost.is_set() or not course_queue.heartbeat(folder_name):
+                        print(f"{course_queue.worker_id} lost {folder_name} to another worker, not finalising it")
+                        continue
+
+                    if not course_transcription:
+                        print(f"No transcriptions generated for {folder_name}")
+                        continue
+
+                    finalise_course(inventory, folder_name, full_folder_drive_path, course_transcription, alt_docx)
+            except Exception as e:
+                print(f"{course_queue.worker_id} failed on {folder_name}. Error: {e!r}")
+
+        if model is not None:
+            # Release model memory and clear GPU cache
+            gc.collect()
+            del model
+            torch.cuda.empty_cache()
+
+        wait_for_alt_transcriptions()
+        print(f"{course_queue.worker_id} found no more courses to claim: {course_queue.status()}")
+
+    def transcribe_longest_first(panel_master_path, processed_csv_path, transcription_workers = 1, chunk_workers = 1, alt_docx = "inline", report_path = None, segment_retries = False, dedupe = False, audio_store_path = None):
+        '''
+        Step 04 (scheduled): Duration-Aware Transcription, Longest Lectures First
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Every lecture of every course is probed and queued longest-first across the transcription
+        workers, with a projected finish time printed before starting; each course is saved &
+        archived as soon as its last lecture lands.
+
+        -- dedupe = the MP3s were downloaded with dedupe; a lecture whose audio store blob was already
+                    transcribed is reused (audio_store_path as in download_and_rename_mp3()).
+        '''
+
+        audio_store = load_audio_store(panel_master_path, audio_store_path) if dedupe else None
+
+        if report_path is None:
+            report_path = shared_state_path(panel_master_path, "transcription_runs.jsonl")
+        scheduler = TranscriptionScheduler(report_path)
+
+        paragraph = load_reference_paragraph()
+        manifest = load_manifest(processed_csv_path)
+        inventory = load_inventory(panel_master_path)
+
+        course_of = {}
+        pending_lectures = {}
+        for folder_name in inventory.listdir(panel_master_path):
+            full_folder_drive_path = os.path.join(panel_master_path, folder_name)
+            if not inventory.isdir(full_folder_drive_path) or folder_name.endswith(".ipynb_checkpoints"):
+                continue
+            for file_name in sort_mp3_files([f for f in inventory.listdir(full_folder_drive_path) if f.lower().endswith('.mp3')]):
+                course_of[os.path.join(full_folder_drive_path, file_name)] = folder_name
+                pending_lectures[folder_name] = pending_lectures.get(folder_name, 0) + 1
+
+        if not course_of:
+            print(f"No MP3 files found in {panel_master_path}")
+            return
+
+        ordered, estimates, projected_seconds = scheduler.schedule(list(course_of), transcription_workers)
+        print(f"Scheduled {len(ordered)} lectures of {len(pending_lectures)} courses "
+              f"({sum(audio_seconds for audio_seconds, _ in estimates.values()) / 3600:.1f} hours of audio) "
+              f"on {transcription_workers} workers at {scheduler.realtime_factor():.3f}x real time")
+        print(f"Projected finish: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + projected_seconds))} "
+              f"({projected_seconds / 60:.1f} minutes)")
+
+        course_transcriptions = {folder_name: {} for folder_name in pending_lectures}
+        scheduled_lectures = queue.Queue()
+        for mp3_drive_path in ordered:
+            scheduled_lectures.put(mp3_drive_path)
+        lock = threading.Lock()
+        pbar = tqdm(total=len(ordered), desc="Transcribing longest first", unit="File")
+
+        def lecture_landed(folder_name, result):
+            with lock:
+                pbar.update(1)
+                if result is not None:
+                    sql_id, lecture = result
+                    course_transcriptions[folder_name].setdefault(sql_id, LectureSegments(sql_id, lecture.video_id)).extend(lecture)
+                pending_lectures[folder_name] -= 1
+                if pending_lectures[folder_name] > 0:
+                    return
+                course_transcription = dict(sorted(course_transcriptions.pop(folder_name).items()))
+
+            if not course_transcription:
+                print(f"No transcriptions generated for {folder_name}")
+                return
+            finalise_course(inventory, folder_name, os.path.join(panel_master_path, folder_name), course_transcription, alt_docx)
+
+        def transcription_worker():
+            model = load_whisper_model(num_workers = chunk_workers)
+            try:
+                while True:
+                    try:
+                        mp3_drive_path = scheduled_lectures.get_nowait()
+                    except queue.Empty:
+                        break
+                    folder_name = course_of[mp3_drive_path]
+                    started = time.time()
+                    result = None
+                    try:
+                        result = transcribe_lecture(model, paragraph, manifest, folder_name, mp3_drive_path, chunk_workers, segment_retries, audio_store = audio_store)
+                        scheduler.record(mp3_drive_path, folder_name, estimates[mp3_drive_path][0], time.time() - started)
+                    except Exception as e:
+                        print(f"Failed to transcribe {mp3_drive_path}. Error: {e!r}")
+                    try:
+                        lecture_landed(folder_name, result)
+                    except Exception as e:
+                        print(f"Failed to finalise {folder_name}. Error: {e!r}")
+            finally:
+                # Release model memory and clear GPU cache
+                gc.collect()
+                del model
+                torch.cuda.empty_cache()
+
+        workers = [threading.Thread(target=transcription_worker, daemon=True) for _ in range(transcription_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        pbar.close()
+
+        wait_for_alt_transcriptions()
+        print(f"Longest-first transcriptions for all courses completed successfully")
+
+    def transcribe_course(model, paragraph, manifest, inventory, panel_master_path, folder_name, chunk_workers = 1, alt_docx = "inline", segment_retries = False, below_threshold = "ask", audio_store = None):
+        '''
+        Step 04.03: Transcribing & Finalising one Course Folder with an Already Loaded Model
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Returns True when the course was saved & archived.
+
+        -- below_threshold = see transcribe_lecture(); "accept" or "reject" never waits on the console.
+        -- audio_store     = see transcribe_lecture().
+        '''
+
+        full_folder_drive_path = os.path.join(panel_master_path, folder_name)
+        mp3_files = sort_mp3_files([f for f in inventory.listdir(full_folder_drive_path) if f.lower().endswith('.mp3')])
+        if len(mp3_files) == 0:
+            print(f"No MP3 files found in {folder_name}")
+            return False
+
+        course_transcription = {}
+        for file_name in tqdm(mp3_files, desc=f"\nTranscribing {folder_name}", unit="File"):
+            result = transcribe_lecture(model, paragraph, manifest, folder_name, os.path.join(full_folder_drive_path, file_name), chunk_workers, segment_retries, below_threshold, audio_store)
+            if result is None:
+                continue
+            sql_id, lecture = result
+            course_transcription.setdefault(sql_id, LectureSegments(sql_id, lecture.video_id)).extend(lecture)
+
+        if not course_transcription:
+            print(f"No transcriptions generated for {folder_name}")
+            return False
+
+        finalise_course(inventory, folder_name, full_folder_drive_path, course_transcription, alt_docx)
+        return True
+
     def move_files_to_folders(content_directory, panel_master_path, file_extensions = ['.xlsx', '.docx']):
         '''
         Step 05: Looping on content_files and restructure panel_master
@@ -352,6 +2629,7 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         
         # Get a list of files in the source directory
         files_to_move = os.listdir(content_directory)
+        inventory = load_inventory(panel_master_path)
     
         # Loop through files and move them
         for filename in files_to_move:
@@ -364,13 +2642,15 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
                 expected_folder_name = os.path.join(panel_master_path, file_base_name)
     
                 # Check if the folder with the same name exists in the destination directory
-                if os.path.exists(expected_folder_name):
+                if inventory.exists(expected_folder_name):
                     # Move the file to the corresponding folder
                     shutil.move(os.path.join(content_directory, filename), expected_folder_name)
                 else:
                     # If the folder doesn't exist, create it and then move the file
                     os.makedirs(expected_folder_name)
+                    inventory.add_dir(expected_folder_name)
                     shutil.move(os.path.join(content_directory, filename), expected_folder_name)
+                inventory.add_file(os.path.join(expected_folder_name, filename))
     
         # Provide a summary and handle any potential errors
         print("File move operation completed successfully!")
@@ -432,18 +2712,21 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         ــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
         '''
         
-        for folder_name in os.listdir(panel_master_path):
+        inventory = load_inventory(panel_master_path)
+
+        for folder_name in inventory.listdir(panel_master_path):
             full_folder_drive_path = os.path.join(panel_master_path, folder_name)
     
             # Check if the folder contains a .docx file with the folder's name
             docx_file_path = os.path.join(full_folder_drive_path, f"{folder_name}.docx")
-            if os.path.isfile(docx_file_path):
+            if inventory.isfile(docx_file_path):
                 script_result = pyillam_script_final(docx_file_path)
     
                 # Save as a JSON file
                 json_file_path = os.path.join(full_folder_drive_path, f"{folder_name} Script.json")
                 with open(json_file_path, "w", encoding="utf-8") as json_file:
                     json.dump(script_result, json_file, ensure_ascii=False, indent=4)
+                inventory.add_file(json_file_path)
     
     def extract_number(text):
         match = re.search(r'\d+', str(text))
@@ -474,11 +2757,13 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
         '''
     
-        for folder in os.listdir(panel_master_path):
+        inventory = load_inventory(panel_master_path)
+
+        for folder in inventory.listdir(panel_master_path):
             full_folder_drive_path = os.path.join(panel_master_path, folder)
     
-            if os.path.isdir(full_folder_drive_path):
-                for file in os.listdir(full_folder_drive_path):
+            if inventory.isdir(full_folder_drive_path):
+                for file in inventory.listdir(full_folder_drive_path):
                     if file.endswith('.xlsx'):
                         full_xlsx_path = os.path.join(full_folder_drive_path, file)
                         with warnings.catch_warnings():
@@ -615,6 +2900,7 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
                             json_file_path = os.path.join(full_folder_drive_path, json_file_name)
                             with open(json_file_path, 'w', encoding='utf-8') as json_file:
                                 json_file.write(json_data)
+                            inventory.add_file(json_file_path)
     
     def extract_skills_objectives(panel_master_path):
         '''
@@ -622,14 +2908,16 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
         '''
         
-        for folder in os.listdir(panel_master_path):
+        inventory = load_inventory(panel_master_path)
+
+        for folder in inventory.listdir(panel_master_path):
             full_folder_drive_path = os.path.join(panel_master_path, folder)
     
-            if os.path.isdir(full_folder_drive_path):
+            if inventory.isdir(full_folder_drive_path):
                 map_objective_item = {}
                 map_S_item = {}
     
-                for file in os.listdir(full_folder_drive_path):
+                for file in inventory.listdir(full_folder_drive_path):
                     if file.endswith('.xlsx'):
                         full_xlsx_path = os.path.join(full_folder_drive_path, file)
                         df = pd.read_excel(full_xlsx_path, sheet_name=1)
@@ -661,6 +2949,9 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
     
                 with open(objectives_json_filename, 'w') as objectives_json_file:
                     json.dump(map_objective_item, objectives_json_file, indent=4)
+
+                inventory.add_file(skills_json_filename)
+                inventory.add_file(objectives_json_filename)
     
     def update_questions_with_skills_objectives(panel_master_path):
         '''
@@ -668,7 +2959,9 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
         '''
         
-        for root, _, files in os.walk(panel_master_path):
+        inventory = load_inventory(panel_master_path)
+
+        for root, _, files in inventory.walk(panel_master_path):
             for file in files:
                 if file.endswith('Quiz.json'):
                     quiz_file_path = os.path.join(root, file)
@@ -681,7 +2974,7 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
                     skills_file_path = os.path.join(root, folder_name + ' Skills.json')
                     objectives_file_path = os.path.join(root, folder_name + ' Objectives.json')
     
-                    if os.path.exists(skills_file_path):
+                    if inventory.exists(skills_file_path):
                         with open(skills_file_path, 'r', encoding='utf-8') as skills_file:
                             skills_data = json.load(skills_file)
     
@@ -689,7 +2982,7 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
                             str(skill_id): skill_name for skill_id, skill_name in skills_data.items()
                         })
     
-                    if os.path.exists(objectives_file_path):
+                    if inventory.exists(objectives_file_path):
                         with open(objectives_file_path, 'r', encoding='utf-8') as objectives_file:
                             objectives_data = json.load(objectives_file)
     
@@ -713,6 +3006,7 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
     
                     with open(output_file_path, 'w', encoding='utf-8') as updated_quiz_file:
                         json.dump(quiz_data, updated_quiz_file, ensure_ascii=False, indent=4)
+                    inventory.add_file(output_file_path)
     
                     print(f"Updated Questions JSON for {folder_name} saved to {output_file_path}")
     
@@ -725,15 +3019,21 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
     
                     with open(combined_mappings_file_path, 'w', encoding='utf-8') as combined_mappings_file:
                         json.dump(combined_mappings, combined_mappings_file, ensure_ascii=False, indent=4)
+                    inventory.add_file(combined_mappings_file_path)
     
                     print(f"Combined mappings for {folder_name} saved to {combined_mappings_file_path}")
     
         print("Processing completed.")
     
-    def transform_data_to_desired_format(script_data, transcriptions_data, questions_data, sim_percentage = 0.7):
+    def transform_data_to_desired_format(script_data, transcriptions_data, questions_data, sim_percentage = 0.7, word_timings = None):
         '''
         Step 10.01: Final NLP Matching for transforming data into the desired format
         ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        -- word_timings = the WordTimingStore of the course; lectures found in it take their exact
+                          startWord/endWord/startSecond/endSecond from a word alignment of the
+                          script, the others fall back to matching whole transcription segments.
+        -- transcriptions_data = the parsed Transcriptions.json, compact or in the older entry-list
+                                 shape, or sql_id -> LectureSegments straight from transcription.
         '''
         
         def is_sentence_matched(paragraph, sentence):
@@ -756,14 +3056,20 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
     
         final_result = []
     
-        for video_key, transcriptions in transcriptions_data.items():
+        for video_key, transcriptions in LectureSegments.load_course(transcriptions_data).items():
             video_title = next((video['video_title'] for video in script_data if video['videoId'] == int(video_key)), 'Default Video Title')
             video_data = {
-                "videoId": transcriptions[0]['videoId'],
+                "videoId": transcriptions.video_id,
                 "video_title": video_title,
                 "sqlId": 1,
                 "paragraphInfo": []
             }
+
+            alignments = None
+            if word_timings is not None and word_timings.has_lecture(video_key):
+                script_paragraphs = [paragraph_data['paragraphDetails'] for paragraph_info in script_data if paragraph_info['videoId'] == int(video_key) for paragraph_data in paragraph_info['paragraphInfo']]
+                alignments = word_timings.align_paragraphs(video_key, script_paragraphs)
+            paragraph_number = 0
     
             for paragraph_info in script_data:
                 if paragraph_info['videoId'] == int(video_key):
@@ -782,18 +3088,23 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
                         }
     
                         # print("Actual Paragraph:", paragraph_data['paragraphDetails'])
-                        for transcription in transcriptions:
-                            sentence = transcription['paragraphInfo']['paragraphDetails']
-                            l = len(sentence)
-                            if is_sentence_matched(paragraph_data['paragraphDetails'], sentence) >= sim_percentage:
-                                start_second = transcription['paragraphInfo']['startSecond']
-                                end_second = transcription['paragraphInfo']['endSecond']
-    
-                                if updated_paragraph_data['startSecond'] is None or updated_paragraph_data['startSecond'] > start_second:
-                                    updated_paragraph_data['startSecond'] = start_second
-    
-                                if updated_paragraph_data['endSecond'] is None or updated_paragraph_data['endSecond'] < end_second:
-                                    updated_paragraph_data['endSecond'] = end_second
+                        if alignments is None:
+                            for start_second, end_second, sentence in transcriptions:
+                                if is_sentence_matched(paragraph_data['paragraphDetails'], sentence) >= sim_percentage:
+                                    if updated_paragraph_data['startSecond'] is None or updated_paragraph_data['startSecond'] > start_second:
+                                        updated_paragraph_data['startSecond'] = start_second
+    
+                                    if updated_paragraph_data['endSecond'] is None or updated_paragraph_data['endSecond'] < end_second:
+                                        updated_paragraph_data['endSecond'] = end_second
+                        else:
+                            alignment = alignments[paragraph_number]
+                            if alignment is not None:
+                                start_word, end_word, start_second, end_second = alignment
+                                updated_paragraph_data['startWord'] = start_word
+                                updated_paragraph_data['endWord'] = end_word
+                                updated_paragraph_data['startSecond'] = start_second
+                                updated_paragraph_data['endSecond'] = end_second
+                        paragraph_number += 1
     
                         for question_info in questions_data['questionsInfo']:
                             if question_info['question_videoId'] == paragraph_info['videoId'] and question_info['question_paragraph'] == paragraph_data['viewIndex']:
@@ -822,7 +3133,7 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
             final_result.append(video_data)
         return final_result
     
-    def process_subfolder(subfolder_path):
+    def process_subfolder(subfolder_path, inventory = None):
         # Get the folder name from the subfolder path
         folder_name = os.path.basename(subfolder_path)
     
@@ -832,7 +3143,8 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         questions_file_path = os.path.join(subfolder_path, f"{folder_name} Updated Questions.json")
     
         # Check if all required JSON files exist
-        if os.path.exists(script_file_path) and os.path.exists(transcriptions_file_path) and os.path.exists(questions_file_path):
+        exists = inventory.exists if inventory is not None else os.path.exists
+        if exists(script_file_path) and exists(transcriptions_file_path) and exists(questions_file_path):
             # Load the JSON files
             with open(script_file_path, "r") as script_file:
                 script_data = json.load(script_file)
@@ -842,9 +3154,12 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
     
             with open(questions_file_path, "r") as questions_file:
                 questions_data = json.load(questions_file)
+
+            word_timings_file_path = os.path.join(subfolder_path, f"{folder_name} WordTimings.npz")
+            course_word_timings = WordTimingStore.load(word_timings_file_path) if exists(word_timings_file_path) else None
     
             # Transform the data using the new logic
-            transformed_data = transform_data_to_desired_format(script_data, transcriptions_data, questions_data)
+            transformed_data = transform_data_to_desired_format(script_data, transcriptions_data, questions_data, word_timings = course_word_timings)
     
             # Define the output file path
             output_file_path = os.path.join(subfolder_path, f"{folder_name} Final.json")
@@ -852,24 +3167,77 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
             # Save the transformed data to a JSON file
             with open(output_file_path, "w", encoding="utf-8") as output_file:
                 json.dump(transformed_data, output_file, ensure_ascii=False, indent=4)
+            if inventory is not None:
+                inventory.add_file(output_file_path)
     
             print(f"Transformed data saved to: {output_file_path}")
+            return output_file_path
         else:
             print(f"Required JSON files not found in subfolder: {subfolder_path}")
+            return None
     
-    def final_matching(panel_master_path):
+    def prune_superseded_lectures(subfolder_path, sql_ids, inventory):
+        # Drop the lectures of renamed manifest rows from the course Transcriptions & WordTimings
+        if not sql_ids:
+            return
+        folder_name = os.path.basename(subfolder_path)
+
+        transcriptions_file_path = os.path.join(subfolder_path, f"{folder_name} Transcriptions.json")
+        if inventory.exists(transcriptions_file_path):
+            with open(transcriptions_file_path, "r", encoding="utf-8") as transcriptions_file:
+                course_transcription = LectureSegments.load_course(json.load(transcriptions_file))
+            kept = {int(sql_id): lecture for sql_id, lecture in course_transcription.items() if int(sql_id) not in sql_ids}
+            if len(kept) < len(course_transcription):
+                LectureSegments.save_course(transcriptions_file_path, kept)
+                inventory.add_file(transcriptions_file_path)
+                print(f"Dropped superseded lectures {sorted(sql_ids)} from {transcriptions_file_path}")
+
+        word_timings_file_path = os.path.join(subfolder_path, f"{folder_name} WordTimings.npz")
+        if inventory.exists(word_timings_file_path):
+            course_word_timings = WordTimingStore.load(word_timings_file_path)
+            dropped = [sql_id for sql_id in sql_ids if course_word_timings.lectures.pop(sql_id, None) is not None]
+            if dropped:
+                course_word_timings.save(word_timings_file_path)
+                inventory.add_file(word_timings_file_path)
+
+    def final_matching(panel_master_path, ledger_path = None):
         '''
         Step 10.02: Final NLP Matching for difflip
         ــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        -- ledger_path = the ManifestLedger of process_csv(); only the courses with pending rows are
+                         matched, and the rows pending when it started are marked as done once
+                         their Final.json is saved; lectures of renamed rows are dropped first.
+
+        Returns the folder names that got a Final.json, e.g. the courses= of merge_jsons().
         '''
     
+        inventory = load_inventory(panel_master_path)
+
+        ledger = ManifestLedger(ledger_path) if ledger_path is not None else None
+        pending_rows = ledger.pending_rows() if ledger is not None else {}
+        pending_courses = {course_name.lower(): course_name for course_name in pending_rows} if ledger is not None else None
+
         # Loop through all sub-folders in the root directory
-        for subfolder_name in os.listdir(panel_master_path):
+        matched_folders = []
+        for subfolder_name in inventory.listdir(panel_master_path):
             subfolder_path = os.path.join(panel_master_path, subfolder_name)
+            if pending_courses is not None and subfolder_name.lower() not in pending_courses:
+                continue
     
             # Check if the item is a directory
-            if os.path.isdir(subfolder_path):
-                process_subfolder(subfolder_path)
+            if not inventory.isdir(subfolder_path):
+                continue
+            if ledger is not None:
+                prune_superseded_lectures(subfolder_path, ledger.superseded_sql_ids(pending_courses[subfolder_name.lower()]), inventory)
+            if process_subfolder(subfolder_path, inventory) is not None:
+                matched_folders.append(subfolder_name)
+                if ledger is not None:
+                    course_name = pending_courses[subfolder_name.lower()]
+                    ledger.mark_done(course_name, pending_rows[course_name])
+
+        if ledger is not None:
+            print(f"Manifest ledger {ledger_path}: {ledger.status()}")
+        return matched_folders
     
     def format_paragraph_info(paragraph):
         '''
@@ -939,25 +3307,36 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
     def process_json_file(json_file_path):
         with open(json_file_path, "r", encoding='utf-8') as file:
             json_content = json.load(file)
-            transformed_content = transform_json_content(json_content)
+        # A Final.json converted by an earlier run already holds the {"videosScriptsInfo": [...]} dict
+        if isinstance(json_content, dict):
+            return
+        transformed_content = transform_json_content(json_content)
     
         with open(json_file_path, "w", encoding='utf-8') as output_file:
             json.dump(transformed_content, output_file, ensure_ascii=False, indent=4)
     
-    def process_all_json_files_in_folder(panel_master_path):
-        for root, dirs, files in os.walk(panel_master_path):
+    def process_all_json_files_in_folder(panel_master_path, courses = None):
+        # courses = only these course folders (e.g. what final_matching() returned); all by default
+        for root, dirs, files in load_inventory(panel_master_path).walk(panel_master_path):
+            if courses is not None and os.path.relpath(root, panel_master_path).split(os.sep)[0] not in courses:
+                continue
             for file in files:
                 if file.endswith("Final.json"):
                     json_file_path = os.path.join(root, file)
                     process_json_file(json_file_path)
     
-    def merge_jsons(panel_master_path, intermediate_path, post_request_json):
+    def merge_jsons(panel_master_path, intermediate_path, post_request_json, courses = None):
+        # courses = only these course folders (e.g. what final_matching() returned); all by default
+        inventory = load_inventory(panel_master_path)
+
         # Copy JSON files from subfolders to destination folder
-        for folder_name in os.listdir(panel_master_path):
+        for folder_name in inventory.listdir(panel_master_path):
             full_folder_path = os.path.join(panel_master_path, folder_name)
+            if courses is not None and folder_name not in courses:
+                continue
     
-            if os.path.isdir(full_folder_path):
-                for file_name in os.listdir(full_folder_path):
+            if inventory.isdir(full_folder_path):
+                for file_name in inventory.listdir(full_folder_path):
                     if file_name.endswith("Final.json"):
                         source_file_path = os.path.join(full_folder_path, file_name)
                         destination_file_path = os.path.join(intermediate_path, file_name)
@@ -969,7 +3348,7 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         merged_data = []
     
         for file in os.listdir(intermediate_path):
-            if file.endswith('Final.json'):
+            if file.endswith('Final.json') and (courses is None or file[:-len(" Final.json")] in courses):
                 with open(os.path.join(intermediate_path, file), 'r', encoding='utf-8') as json_file:
                     data = json.load(json_file)
                     for item in data['videosScriptsInfo']:
@@ -981,6 +3360,64 @@ def flow_processing(csv_src_path, processed_csv_path, panel_master_path, interme
         with open(post_request_json, 'w', encoding='utf-8') as output_file:
             json.dump(result_dict, output_file, ensure_ascii=False, indent=4)
 
+    def deliver_post_request(panel_master_path, endpoint, max_batch_bytes = 4 * 1024 * 1024, max_retries = 5, headers = None, courses = None):
+        '''
+        Step 13: Streaming the Final JSONs to the Backend in Compressed Batches
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Replaces uploading the merged post_request_json: the Final.json of each course is read on
+        its own and its videosScriptsInfo goes to the endpoint in gzip batches of at most
+        max_batch_bytes, so the whole catalogue is never held in memory or sent as one request.
+
+        -- courses = only deliver these course folders (e.g. what final_matching() returned).
+        '''
+
+        inventory = load_inventory(panel_master_path)
+
+        with CatalogueDelivery(endpoint, max_batch_bytes, max_retries, headers = headers) as delivery:
+            for folder_name in inventory.listdir(panel_master_path):
+                full_folder_path = os.path.join(panel_master_path, folder_name)
+                if not inventory.isdir(full_folder_path) or (courses is not None and folder_name not in courses):
+                    continue
+
+                for file_name in inventory.listdir(full_folder_path):
+                    if file_name.endswith("Final.json"):
+                        with open(os.path.join(full_folder_path, file_name), 'r', encoding='utf-8') as json_file:
+                            videos = json.load(json_file)['videosScriptsInfo']
+                        batch_count = delivery.deliver(folder_name, videos)
+                        print(f"Delivered {len(videos)} videos of {folder_name} in {batch_count} batches")
+
+            print(f"Delivery to {endpoint} completed: {delivery.stats}")
+        return delivery.stats
+
+    def close_scratch_workspace(scratch_path = "/content/scratch/panel_master"):
+        '''
+        Step 14: Flushing & Verifying the Scratch Workspace on the Drive Mount
+        ـــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــــ
+        Waits for the background syncer, re-checks every scratch file against the mount and
+        re-sends the ones that are missing or differ. Returns the paths that still do not match.
+        '''
+
+        inventory = load_inventory(scratch_path)
+        mirror = inventory.mirror
+        if mirror is None:
+            print(f"{scratch_path} is not an open scratch workspace")
+            return []
+
+        print(f"Flushing {scratch_path}: {mirror.flush()}")
+        repaired = mirror.verify(repair=True)
+        mismatches = mirror.verify(repair=False)
+        mirror.close()
+        inventory.mirror = None
+
+        for path, error in mirror.errors:
+            print(f"Failed to sync {path}: {error}")
+        print(f"Scratch workspace synced to {mirror.target_root}: {len(repaired)} files re-sent, {len(mismatches)} still differ")
+        return mismatches
+
+    # Every stage above, e.g. flow_processing(...).steps.transcribe_with_course_queue(...)
+    pipeline.steps = SimpleNamespace(**{name: step for name, step in locals().items() if callable(step)})
+    return pipeline
+
 def flow_debug(panel_master_path):
     """
     Check a folder for Excel (.xlsx) and Word (.docx) files for specific rules.
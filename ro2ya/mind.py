@@ -1,244 +1,1481 @@
+from contextlib import contextmanager
+from collections import deque
+from collections.abc import Mapping
 import pandas as pd
+import numpy as np
+import itertools
+import threading
+import tracemalloc
+import tempfile
+import cProfile
+import pstats
+import asyncio
+import queue
+import math
+import json
+import time
+import csv
+import io
 import os
 import sqlite3
 
-def mind(user_responses, database):
-    path = database
-    connection = sqlite3.connect(path)
+ASSESSMENT_TABLES = {
+    "PRS": "assessment_assets_PRS",
+    "VAK": "assessment_assets_VAK",
+    "EMQ": "assessment_assets_EMQ",
+    "TRS": "assessment_assets_TRS",
+    "CTD": "assessment_assets_CTD",
+    "CMF": "assessment_assets_CMF",
+    "QTM": "assessment_assets_QTM"}
 
-    try:
-        def read_table(table_name):
-            query = f"SELECT * FROM {table_name}"
-            df = pd.read_sql_query(query, connection)
-            return df
-
-        df_prs = read_table("assessment_assets_PRS")
-        df_vak = read_table("assessment_assets_VAK")
-        df_emq = read_table("assessment_assets_EMQ")
-        df_trs = read_table("assessment_assets_TRS")
-        df_ctd = read_table("assessment_assets_CTD")
-        df_cmf = read_table("assessment_assets_CMF")
-        df_qtm = read_table("assessment_assets_QTM")
-
-        scoring_methods = {
-        "A1": {1: 1, 2: 2, 3: 3, 4: 4},
-        "A2": {1: 4, 2: 3, 3: 2, 4: 1},
-        "A3": {1: 1, 2: 4, 3: 4, 4: 1},
-        "A4": {1: 4, 2: 1, 3: 1, 4: 4}}
-
-        traits = ["EI", "SN", "TF", "JP"]
-
-        trait_results = {trait: [] for trait in traits}
-        trait_letters = {}
-
-        personality = {}
-
-        for trait in traits:
-            y_indices = set(df_prs[df_prs[trait] == "Y"]["Idx"].tolist())
-            trait_responses = [response for idx, response in enumerate(user_responses) if str(float(idx + 1)) in y_indices]
-
-            count_1_or_2, count_3_or_4 = 0, 0
-            for i in trait_responses:
-                if i in (1, 2):
-                    count_1_or_2 += 1
-                else:
-                    count_3_or_4 += 1
+scoring_methods = {
+    "A1": {1: 1, 2: 2, 3: 3, 4: 4},
+    "A2": {1: 4, 2: 3, 3: 2, 4: 1},
+    "A3": {1: 1, 2: 4, 3: 4, 4: 1},
+    "A4": {1: 4, 2: 1, 3: 1, 4: 4}}
 
-            probability_e = count_1_or_2 / max(1, len(trait_responses))
-            probability_i = count_3_or_4 / max(1, len(trait_responses))
-            
-            personality[trait[0]] = round(probability_e, 2)
-            personality[trait[1]] = round(probability_i, 2)
+# SCORING_TABLE[method code, response] = points; code 0 is "not scored" and response 0 is unused
+METHOD_CODES = {method: code for code, method in enumerate(scoring_methods, start=1)}
+SCORING_TABLE = np.zeros((len(scoring_methods) + 1, 5), dtype=np.int64)
+for method, code in METHOD_CODES.items():
+    for response, points in scoring_methods[method].items():
+        SCORING_TABLE[code, response] = points
 
-            if probability_e > probability_i:
-                determined_trait = "E"
-            else:
-                determined_trait = "I"
+TRAITS = ["EI", "SN", "TF", "JP"]
+VAK_COLUMNS = ["VN", "KF", "KP", "AS", "KS"]
+EMQ_CATEGORIES = ["SelfAwarness", "ManagingEmotions", "MotivatingOneself", "Empathy", "SocialSkills"]
 
-            trait_letter = trait[0] if determined_trait == "E" else trait[1]
-            trait_letters[trait] = trait_letter
+roles = {
+    "RI": "Resource Investigator",
+    "CO": "Co-ordinator",
+    "PL": "Plant",
+    "SH": "Shaper",
+    "ME": "Monitor Evaluator",
+    "IMP": "Implementer",
+    "TW": "Teamworker",
+    "CF": "Completer Finisher",
+    "SP": "Specialist"
+}
 
-        personality_type = "".join([trait_letters[trait] for trait in traits])
-        personality["title"] = personality_type
-        
-        v_score, a_score, ks_score, kf_score, kp_score = 0, 0, 0, 0, 0
+def determine_trait_level(score):
+    if score > 15:
+        return "balanced"
+    elif 10 <= score <= 15:
+        return "rebalanced"
+    else:
+        return "unbalanced"
 
-        for idx, response in enumerate(user_responses):
+def determine_skill_level(score):
+    if score >= 30:
+        return "Strong Skill"
+    elif 25 <= score < 30:
+        return "Needs Attention"
+    else:
+        return "Development Priority"
 
-            vn_value, kf_value, kp_value, as_value, ks_value = df_vak.loc[idx, ["VN", "KF", "KP", "AS", "KS"]]
+def determine_aspect_level(score, num_skills):
+    max_score = 36 if num_skills == 3 else 48
+    percentage = (score / max_score) * 100
+    if percentage >= 81:
+        return "Advanced", percentage
+    elif 58 <= percentage < 81:
+        return "Intermediate", percentage
+    else:
+        return "Beginner", percentage
 
-            if response in [1, 2]:
-                v_score += scoring_methods.get(vn_value, {}).get(response, 0)
-                kf_score += scoring_methods.get(kf_value, {}).get(response, 0)
-                kp_score += scoring_methods.get(kp_value, {}).get(response, 0)
-            elif response in [3, 4]:
-                a_score += scoring_methods.get(as_value, {}).get(response, 0)
-                ks_score += scoring_methods.get(ks_value, {}).get(response, 0)
+def determine_space_level(score, num_aspects):
+    max_score = {3: 108, 4: 144, 5: 180}
+    percentage = (score / max_score[num_aspects]) * 100
+    if percentage >= 72:
+        return "Advanced", percentage
+    elif 54 <= percentage < 72:
+        return "Intermediate", percentage
+    else:
+        return "Beginner", percentage
 
-        Visual, Auditory, Kinesthetic = v_score, a_score, ks_score + kf_score + kp_score
+# The sections of a mind() result, the tables each one is scored from and the keys it fills in
+SECTIONS = ("PRS", "VAK", "EMQ", "TRS", "QTM", "CTD")
+SECTION_TABLES = {"PRS": ("PRS",), "VAK": ("VAK",), "EMQ": ("EMQ",), "TRS": ("TRS",), "QTM": ("QTM",), "CTD": ("CTD", "CMF")}
+SECTION_KEYS = {
+    "PRS": ("Personality_Type",),
+    "VAK": ("vak",),
+    "EMQ": ("Emotional_Intelligance",),
+    "TRS": ("Roles",),
+    "QTM": ("Traits",),
+    "CTD": ("Space", "Aspect", "Skill")}
 
-        type = "Visual" if Auditory<Visual>Kinesthetic else "Auditory" if Visual<Auditory>Kinesthetic else "Kinesthetic"
+def mind_sections(sections = None):
+    # None means every section; the result always follows the SECTIONS order
+    if sections is None:
+        return SECTIONS
+    if isinstance(sections, str):
+        sections = [sections]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown mind() sections {sorted(unknown)}; expected some of {list(SECTIONS)}.")
+    return tuple(section for section in SECTIONS if section in sections)
 
-        vak = {
-            "type": type,
-            "visual": Visual,
-            "auditory": Auditory,
-            "kinesthetic": Kinesthetic
-        }
-        
-        scores_emq = {"SelfAwarness": 0, "ManagingEmotions": 0, "MotivatingOneself": 0, "Empathy": 0, "SocialSkills": 0}
-        for idx, row in df_emq.iterrows():
-            response = user_responses[idx]
+def read_assessment_tables(database, connection = None, sections = None):
+    if connection is not None:
+        tables = [table for section in mind_sections(sections) for table in SECTION_TABLES[section]]
+        return {table: pd.read_sql_query(f"SELECT * FROM {ASSESSMENT_TABLES[table]}", connection) for table in tables}
+
+    connection = sqlite3.connect(database)
+    try:
+        return read_assessment_tables(database, connection, sections)
+    finally:
+        connection.close()
+
+class SQLiteReadPool:
+    '''
+    A small pool of read-only SQLite connections that can be shared between threads.
+    '''
+
+    def __init__(self, database, size = 2):
+        self.database = database
+        self.connections = queue.Queue()
+        for _ in range(size):
+            uri = f"file:{os.path.abspath(database)}?mode=ro"
+            self.connections.put(sqlite3.connect(uri, uri=True, check_same_thread=False))
+
+    @contextmanager
+    def connection(self):
+        connection = self.connections.get()
+        try:
+            yield connection
+        finally:
+            self.connections.put(connection)
 
-            for category in scores_emq.keys():
-                scoring_method = row[category]
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+
+def method_codes(df, columns, strict):
+    '''
+    Encode the scoring-method cells of the given columns as an int8 (questions x columns) array.
+    Strict columns fail on unknown methods like mind() always did; the others score them as 0.
+    '''
+
+    codes = np.zeros((len(df), len(columns)), dtype=np.int8)
+    for j, column in enumerate(columns):
+        for i, scoring_method in enumerate(df[column].tolist()):
+            if strict:
                 if pd.notna(scoring_method) and scoring_method != "":
-                    scores_emq[category] += scoring_methods[scoring_method][response]
+                    codes[i, j] = METHOD_CODES[scoring_method]
+            elif isinstance(scoring_method, str):
+                codes[i, j] = METHOD_CODES.get(scoring_method, 0)
+    return codes
 
+def dense_points(codes):
+    # POINTS[response - 1, question, column] = the points that response earns in that cell
+    return np.stack([SCORING_TABLE[codes, response] for response in range(1, 5)]).astype(np.float64)
 
-        ei = {
-            "SelfAwarness": scores_emq["SelfAwarness"],
-            "ManagingEmotions": scores_emq["ManagingEmotions"],
-            "MotivatingOneself": scores_emq["MotivatingOneself"],
-            "Empathy": scores_emq["Empathy"],
-            "SocialSkills": scores_emq["SocialSkills"]
-        }
+def sparse_rows(points):
+    # [(columns the question scores, (4 x len(columns)) points of each response), ...] per question
+    rows = []
+    for question in range(points.shape[1]):
+        columns = np.flatnonzero(points[:, question, :].any(axis=0))
+        rows.append((columns, np.rint(points[:, question, columns]).astype(np.int64)))
+    return rows
+
+class MindScorer:
+    '''
+    The seven assessment_assets tables of one database compiled once into lookup arrays, so
+    that scoring a respondent is plain arithmetic. The scorer re-compiles itself whenever the
+    database file changes on disk.
+
+    -- database = the path of the SQLite database holding the assessment_assets tables.
+    -- pool     = an optional SQLiteReadPool to read the tables through instead of a fresh connection.
+    -- sections = the SECTIONS to compile (all by default); only their tables are read.
+    '''
+
+    def __init__(self, database, pool = None, bundle = None, sections = None):
+        self.database = database
+        self.pool = pool
+        self.bundle = bundle
+        # A bundle always holds every section
+        self.sections = mind_sections(None if bundle is not None else sections)
+        self.signature = None
+        self.lock = threading.Lock()
+        self.refresh()
+
+    @classmethod
+    def from_bundle(cls, path):
+        '''
+        A scorer over the read-only memory map of a bundle written by export_mind_bundle(), so
+        every process that loads the same bundle shares one copy of the scoring arrays.
+        '''
+
+        return cls(read_mind_bundle(path, arrays=False)["database"], bundle=path)
+
+    def database_signature(self):
+        # Writes to a WAL-mode database land in the -wal file until they are checkpointed
+        source = self.database if self.bundle is None else self.bundle
+        signature = []
+        for path in (source, source + "-wal"):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(signature)
+
+    def refresh(self):
+        signature = self.database_signature()
+        if signature != self.signature:
+            with self.lock:
+                if signature != self.signature:
+                    if self.bundle is not None:
+                        self.load_bundle(read_mind_bundle(self.bundle))
+                    elif self.pool is None:
+                        self.compile(read_assessment_tables(self.database, sections=self.sections))
+                    else:
+                        with self.pool.connection() as connection:
+                            self.compile(read_assessment_tables(self.database, connection, self.sections))
+                    self.signature = signature
+        return self
+
+    def compile(self, tables):
+        sections = self.sections
+
+        if "PRS" in sections:
+            # PRS: the 0-based response positions whose str(float(position + 1)) is a "Y" Idx of the trait
+            df_prs = tables["PRS"]
+            prs_positions = {}
+            for trait in TRAITS:
+                positions = set()
+                for value in df_prs[df_prs[trait] == "Y"]["Idx"].tolist():
+                    if not isinstance(value, str):
+                        continue
+                    try:
+                        number = float(value)
+                    except ValueError:
+                        continue
+                    if number.is_integer() and number >= 1 and str(float(int(number))) == value:
+                        positions.add(int(number) - 1)
+                prs_positions[trait] = np.array(sorted(positions), dtype=np.int64)
+            self.prs_positions = prs_positions
 
-        roles = {
-            "RI": "Resource Investigator",
-            "CO": "Co-ordinator",
-            "PL": "Plant",
-            "SH": "Shaper",
-            "ME": "Monitor Evaluator",
-            "IMP": "Implementer",
-            "TW": "Teamworker",
-            "CF": "Completer Finisher",
-            "SP": "Specialist"
+        if "VAK" in sections:
+            vak_points = dense_points(method_codes(tables["VAK"], VAK_COLUMNS, strict=False))
+            # VN, KF & KP only score responses 1-2 while AS & KS only score responses 3-4
+            vak_points[0:2, :, 3:5] = 0
+            vak_points[2:4, :, 0:3] = 0
+            self.vak_points = vak_points
+
+        if "EMQ" in sections:
+            self.emq_points = dense_points(method_codes(tables["EMQ"], EMQ_CATEGORIES, strict=True))
+
+        if "TRS" in sections:
+            self.trs_points = dense_points(method_codes(tables["TRS"], list(roles.keys()), strict=True))
+
+        if "QTM" in sections:
+            df_qtm = tables["QTM"]
+            self.qtm_columns = [trait for trait in df_qtm.columns if trait != "Idx"]
+            self.qtm_points = dense_points(method_codes(df_qtm, self.qtm_columns, strict=False))
+
+        if "CTD" in sections:
+            df_ctd, df_cmf = tables["CTD"], tables["CMF"]
+            ctd_columns = [col for col in df_ctd.columns if col != "Idx"]
+
+            hierarchical_mapping = {}
+            for _, row in df_cmf.iterrows():
+                space, aspect, skill = row
+                if space not in hierarchical_mapping:
+                    hierarchical_mapping[space] = {}
+                if aspect not in hierarchical_mapping[space]:
+                    hierarchical_mapping[space][aspect] = []
+                hierarchical_mapping[space][aspect].append(skill)
+            hierarchical_mapping.pop('Space', None)
+
+            # CMF: one column per (space, aspect) in the aggregation order of the original loops,
+            # counting a skill as often as it is listed, and one column per space over its aspects
+            ctd_column_index = {skill: j for j, skill in enumerate(ctd_columns)}
+            cmf_spaces, cmf_aspects = [], []
+            aspect_matrix = np.zeros((len(ctd_columns), sum(len(aspects) for aspects in hierarchical_mapping.values())), dtype=np.int64)
+            space_matrix = np.zeros((aspect_matrix.shape[1], len(hierarchical_mapping)), dtype=np.int64)
+            for s, (space, aspects) in enumerate(hierarchical_mapping.items()):
+                cmf_spaces.append((space, len(aspects)))
+                for aspect, skills_list in aspects.items():
+                    a = len(cmf_aspects)
+                    skill_columns = {}
+                    for skill in skills_list:
+                        if skill in ctd_column_index:
+                            aspect_matrix[ctd_column_index[skill], a] += 1
+                            skill_columns[skill] = ctd_column_index[skill]
+                    cmf_aspects.append((aspect, len(skills_list), list(skill_columns.items())))
+                    space_matrix[a, s] = 1
+
+            self.ctd_columns = ctd_columns
+            self.ctd_points = dense_points(method_codes(df_ctd, ctd_columns, strict=False))
+            self.hierarchical_mapping = hierarchical_mapping
+            self.cmf_spaces = cmf_spaces
+            self.cmf_aspects = cmf_aspects
+            self.aspect_matrix = aspect_matrix
+            self.space_matrix = space_matrix
+
+        self.derive()
+
+    def derive(self):
+        # Per question, only the columns it can score, for the incremental MindSession updates
+        self.sparse_points = {section: sparse_rows(points) for section, points in self.section_points().items()}
+        self.prs_traits = {}
+        if "PRS" in self.sections:
+            for t, trait in enumerate(TRAITS):
+                for position in self.prs_positions[trait].tolist():
+                    self.prs_traits.setdefault(position, []).append(t)
+
+        # The length of a full response list: the VAK table's, or the longest compiled section's
+        if "VAK" in self.sections:
+            self.questions = self.vak_points.shape[1]
+        else:
+            self.questions = max([points.shape[1] for points in self.section_points().values()] + [position + 1 for position in self.prs_traits] + [0])
+
+    def bundle_contents(self):
+        # (arrays, metadata) of the compiled tables, as written by export_mind_bundle()
+        arrays = {f"prs_{trait}": self.prs_positions[trait] for trait in TRAITS}
+        arrays.update({f"{section.lower()}_points": points for section, points in self.section_points().items()})
+        arrays["aspect_matrix"] = self.aspect_matrix
+        arrays["space_matrix"] = self.space_matrix
+
+        metadata = {
+            "ctd_columns": self.ctd_columns,
+            "qtm_columns": self.qtm_columns,
+            # Pairs rather than objects so non-string names survive the JSON round trip
+            "hierarchical_mapping": [[space, list(aspects.items())] for space, aspects in self.hierarchical_mapping.items()],
+            "cmf_spaces": self.cmf_spaces,
+            "cmf_aspects": self.cmf_aspects,
         }
+        return arrays, metadata
 
-        scores_trs = {role: 0 for role in roles.keys()}
+    def load_bundle(self, bundle):
+        arrays, metadata = bundle["arrays"], bundle["metadata"]
+        self.prs_positions = {trait: arrays[f"prs_{trait}"] for trait in TRAITS}
+        self.vak_points = arrays["vak_points"]
+        self.emq_points = arrays["emq_points"]
+        self.trs_points = arrays["trs_points"]
+        self.ctd_points = arrays["ctd_points"]
+        self.qtm_points = arrays["qtm_points"]
+        self.aspect_matrix = arrays["aspect_matrix"]
+        self.space_matrix = arrays["space_matrix"]
+        self.ctd_columns = metadata["ctd_columns"]
+        self.qtm_columns = metadata["qtm_columns"]
+        self.hierarchical_mapping = {space: dict(aspects) for space, aspects in metadata["hierarchical_mapping"]}
+        self.cmf_spaces = [tuple(space) for space in metadata["cmf_spaces"]]
+        self.cmf_aspects = [(aspect, num_skills, [tuple(column) for column in skill_columns]) for aspect, num_skills, skill_columns in metadata["cmf_aspects"]]
+        self.derive()
 
-        for idx, row in df_trs.iterrows():
-            response = user_responses[idx]
+    def section_points(self):
+        return {section: getattr(self, f"{section.lower()}_points") for section in SECTIONS if section != "PRS" and section in self.sections}
 
-            for role in scores_trs.keys():
-                scoring_method = row[role]
-                if pd.notna(scoring_method) and scoring_method != "":
-                    scores_trs[role] += scoring_methods[scoring_method][response]
+    def section_scores(self, points, responses):
+        '''
+        Vectorised iterrows() loop of one table: row i is scored with response column i, so the
+        (users x columns) scores are one (user x question) one-hot matrix product per response value.
+        '''
 
-        rls = scores_trs
+        questions = points.shape[1]
+        if responses.shape[1] < questions:
+            raise IndexError(f"{responses.shape[1]} responses given, {questions} expected")
+        responses = responses[:, :questions]
 
-        scores_ctd = {col: 0 for col in df_ctd.columns if col != "Idx"}
+        scores = np.zeros((len(responses), points.shape[2]))
+        for response in range(1, 5):
+            scores += (responses == response).astype(np.float64) @ points[response - 1]
+        return np.rint(scores).astype(np.int64)
 
-        for idx, row in df_ctd.iterrows():
-            response = user_responses[idx]
+    def response_matrix(self, response_matrix):
+        # Only whole numbers are responses (2.0 is 2, as for the original dict lookups); 2.5, "2" or None are not
+        responses = np.asarray(response_matrix)
+        if responses.dtype.kind == "f" and np.all(responses == np.floor(responses)):
+            responses = responses.astype(np.int64)
+        if responses.dtype.kind not in "iu":
+            raise ValueError("Every response must be an integer: one of 1, 2, 3 or 4.")
+        responses = responses.astype(np.int64, copy=False)
+        if responses.ndim == 1:
+            responses = responses[None, :]
+        if np.any((responses < 1) | (responses > 4)):
+            raise ValueError("Every response must be one of 1, 2, 3 or 4.")
+        return responses
 
-            for skill, scoring_method in row.items():
-                if pd.notna(scoring_method) and scoring_method != "" and scoring_method in scoring_methods:
-                    scores_ctd[skill] += scoring_methods[scoring_method][response]
+    def score_prs(self, responses):
+        # (users x traits x [E, I]) probabilities over the trait questions that were answered
+        prs = np.zeros((len(responses), len(TRAITS), 2))
+        for t, trait in enumerate(TRAITS):
+            positions = self.prs_positions[trait]
+            positions = positions[positions < responses.shape[1]]
+            count_1_or_2 = np.count_nonzero(responses[:, positions] <= 2, axis=1)
+            prs[:, t, 0] = count_1_or_2 / max(1, len(positions))
+            prs[:, t, 1] = (len(positions) - count_1_or_2) / max(1, len(positions))
+        return prs
 
-        scores_qtm = {trait: 0 for trait in df_qtm.columns if trait != "Idx"}
+    def score_vak(self, responses):
+        # (users x [visual, auditory, kinesthetic])
+        questions = responses.shape[1]
+        if questions > self.vak_points.shape[1]:
+            raise KeyError(self.vak_points.shape[1])
+        vak_columns = self.section_scores(self.vak_points[:, :questions], responses)
+        return np.stack([vak_columns[:, 0], vak_columns[:, 3], vak_columns[:, 1] + vak_columns[:, 2] + vak_columns[:, 4]], axis=1)
 
-        for idx, row in df_qtm.iterrows():
-            response = user_responses[idx]
+    def score_ctd(self, responses):
+        # (users x skills), (users x CMF aspects) and (users x CMF spaces)
+        ctd = self.section_scores(self.ctd_points, responses)
+        aspect = ctd @ self.aspect_matrix
+        return ctd, aspect, aspect @ self.space_matrix
 
-            for trait, scoring_method in row.items():
-                if pd.notna(scoring_method) and scoring_method != "" and scoring_method in scoring_methods:
-                    scores_qtm[trait] += scoring_methods[scoring_method][response]
+    def section_arrays(self, section, responses):
+        if section not in self.sections:
+            raise ValueError(f"The {section} section was not compiled into this scorer.")
+        if section == "PRS":
+            return {"PRS": self.score_prs(responses)}
+        if section == "VAK":
+            return {"VAK": self.score_vak(responses)}
+        if section == "CTD":
+            ctd, aspect, space = self.score_ctd(responses)
+            return {"CTD": ctd, "Aspect": aspect, "Space": space}
+        return {section: self.section_scores(getattr(self, f"{section.lower()}_points"), responses)}
 
-        def determine_trait_level(score):
-            if score > 15:
-                return "balanced"
-            elif 10 <= score <= 15:
-                return "rebalanced"
-            else:
-                return "unbalanced"
+    def score_arrays(self, response_matrix, sections = None):
+        '''
+        Score a (users x questions) response matrix and return the sections (every compiled one by
+        default) as NumPy arrays: PRS (users x traits x [E, I] probabilities), VAK (users x [visual,
+        auditory, kinesthetic]), EMQ, TRS, QTM and CTD (users x columns), Aspect (users x CMF
+        aspects) and Space (users x spaces).
+        '''
+
+        responses = self.response_matrix(response_matrix)
+        # CTD first, as it always was, so a short response list fails the same way
+        sections = self.sections if sections is None else mind_sections(sections)
+        arrays = {}
+        for section in sorted(sections, key=lambda section: section != "CTD"):
+            arrays.update(self.section_arrays(section, responses))
+        return arrays
+
+    def section_json(self, section, arrays, user):
+        # The keys of one section of the mind() result of a user
+        if section == "PRS":
+            personality = {}
+            trait_letters = {}
+            for t, trait in enumerate(TRAITS):
+                probability_e, probability_i = float(arrays["PRS"][user, t, 0]), float(arrays["PRS"][user, t, 1])
+                personality[trait[0]] = round(probability_e, 2)
+                personality[trait[1]] = round(probability_i, 2)
+                trait_letters[trait] = trait[0] if probability_e > probability_i else trait[1]
+            personality["title"] = "".join([trait_letters[trait] for trait in TRAITS])
+            return {"Personality_Type": personality}
+
+        if section == "VAK":
+            Visual, Auditory, Kinesthetic = (int(score) for score in arrays["VAK"][user])
+
+            vak_type = "Visual" if Auditory<Visual>Kinesthetic else "Auditory" if Visual<Auditory>Kinesthetic else "Kinesthetic"
 
-        traits = {}
-        for trait, score in scores_qtm.items():
-            traits[trait] = {"score":score, "level": determine_trait_level(score)}
+            vak = {
+                "type": vak_type,
+                "visual": Visual,
+                "auditory": Auditory,
+                "kinesthetic": Kinesthetic
+            }
+            return {"vak": vak}
+
+        if section == "EMQ":
+            return {"Emotional_Intelligance": dict(zip(EMQ_CATEGORIES, arrays["EMQ"][user].tolist()))}
+
+        if section == "TRS":
+            return {"Roles": dict(zip(roles.keys(), arrays["TRS"][user].tolist()))}
+
+        if section == "QTM":
+            traits = {}
+            for trait, score in zip(self.qtm_columns, arrays["QTM"][user].tolist()):
+                traits[trait] = {"score":score, "level": determine_trait_level(score)}
+            return {"Traits": traits}
 
         # The CTD Section
 
-        def determine_skill_level(score):
-            if score >= 30:
-                return "Strong Skill"
-            elif 25 <= score < 30:
-                return "Needs Attention"
-            else:
-                return "Development Priority"
-
-        def determine_aspect_level(score, num_skills):
-            max_score = 36 if num_skills == 3 else 48
-            percentage = (score / max_score) * 100
-            if percentage >= 81:
-                return "Advanced", percentage
-            elif 58 <= percentage < 81:
-                return "Intermediate", percentage
-            else:
-                return "Beginner", percentage
-
-        def determine_space_level(score, num_aspects):
-            max_score = {3: 108, 4: 144, 5: 180}
-            percentage = (score / max_score[num_aspects]) * 100
-            if percentage >= 72:
-                return "Advanced", percentage
-            elif 54 <= percentage < 72:
-                return "Intermediate", percentage
-            else:
-                return "Beginner", percentage
-            
-        hierarchical_mapping = {}
-        for _, row in df_cmf.iterrows():
-            space, aspect, skill = row
-            if space not in hierarchical_mapping:
-                hierarchical_mapping[space] = {}
-            if aspect not in hierarchical_mapping[space]:
-                hierarchical_mapping[space][aspect] = []
-            hierarchical_mapping[space][aspect].append(skill)
-        hierarchical_mapping.pop('Space', None)
-
-        scores = {col: 0 for col in df_ctd.columns if col != "Idx"}
-        for idx, row in df_ctd.iterrows():
-            response = user_responses[idx]
-            for skill, scoring_method in row.items():
-                if pd.isna(scoring_method) or scoring_method not in scoring_methods:
-                    continue
-                scores[skill] += scoring_methods[scoring_method][response]
-
-        # Aggregate scores for each aspect and space
+        scores = arrays["CTD"][user].tolist()
+        aspect_totals = arrays["Aspect"][user].tolist()
+        space_totals = arrays["Space"][user].tolist()
+
         space_scores = {}
         aspect_scores = {}
         skill_scores = {}
-        for space, aspects in hierarchical_mapping.items():
-            space_score = 0
-            space_data = {}
-            for aspect, skills_list in aspects.items():
-                aspect_score = sum(scores[skill] for skill in skills_list if skill in scores)
-                space_score += aspect_score
-                level, percentage = determine_aspect_level(aspect_score, len(skills_list))
-                skills_data = {skill: (scores[skill], determine_skill_level(scores[skill])) for skill in skills_list if
-                            skill in scores}
-                space_data[aspect] = {"Score": aspect_score, "Level": level, "Percentage": percentage, "Skills": skills_data}
-                aspect_scores[aspect] = {"level": level, "percentage": round(percentage, 2)}
-                for skill, skill_data in skills_data.items():
-                    skill_scores[skill] = {"score": skill_data[0], "level": skill_data[1]}
-            level, percentage = determine_space_level(space_score, len(aspects))
+        for (space, num_aspects), space_score in zip(self.cmf_spaces, space_totals):
+            level, percentage = determine_space_level(space_score, num_aspects)
             space_scores[space] = {"level": level, "percentage": round(percentage, 2)}
+        for (aspect, num_skills, skill_columns), aspect_score in zip(self.cmf_aspects, aspect_totals):
+            level, percentage = determine_aspect_level(aspect_score, num_skills)
+            aspect_scores[aspect] = {"level": level, "percentage": round(percentage, 2)}
+            for skill, column in skill_columns:
+                skill_scores[skill] = {"score": scores[column], "level": determine_skill_level(scores[column])}
 
+        return {"Space": space_scores, "Aspect": aspect_scores, "Skill": skill_scores}
 
-        assessment_json = {
-            "Personality_Type": personality,
-            "vak": vak,
-            "Emotional_Intelligance": ei,
-            "Roles":rls,
-            "Traits": traits,
-            "Space": space_scores,
-            "Aspect": aspect_scores,
-            "Skill": skill_scores,
-        }
+    def assessment_json(self, arrays, user):
+        # Every section scored into arrays, keyed in the order mind() has always used
+        assessment_json = {}
+        for section in SECTIONS:
+            if section in arrays:
+                assessment_json.update(self.section_json(section, arrays, user))
+        return assessment_json
+
+    def score_batch(self, response_matrix, sections = None):
+        arrays = self.score_arrays(response_matrix, sections)
+        users = len(self.response_matrix(response_matrix)) if not arrays else len(next(iter(arrays.values())))
+        return [self.assessment_json(arrays, user) for user in range(users)]
+
+    def score(self, user_responses, sections = None):
+        return self.score_batch(np.asarray(user_responses).reshape(1, -1), sections)[0]
+
+    def lazy(self, user_responses, sections = None):
+        return MindAssessment(self, user_responses, sections)
+
+    def session(self):
+        return MindSession(self)
+
+class MindSession:
+    '''
+    Incremental scoring of one respondent whose answers arrive one at a time. Every answer only
+    touches the accumulators of the columns its question scores, and result() can be read at
+    any time; once every question is answered it equals mind() on the full response list.
+
+    Answers can come in any order and can be changed; unanswered questions score nothing.
+    '''
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.answers = {}
+        self.seed()
+
+    def seed(self):
+        self.signature = self.scorer.signature
+        self.sparse_points = self.scorer.sparse_points
+        self.prs_traits = self.scorer.prs_traits
+        self.questions = self.scorer.questions
+        self.totals = {section: np.zeros(points.shape[2], dtype=np.int64) for section, points in self.scorer.section_points().items()}
+        # prs_counts[trait] = [answers of 1 or 2, answered questions of the trait]
+        self.prs_counts = np.zeros((len(TRAITS), 2), dtype=np.int64)
+
+    def apply(self, position, response, sign):
+        for t in self.prs_traits.get(position, ()):
+            self.prs_counts[t, 0] += sign * (response <= 2)
+            self.prs_counts[t, 1] += sign
+        for section, rows in self.sparse_points.items():
+            if position < len(rows):
+                columns, points = rows[position]
+                self.totals[section][columns] += sign * points[response - 1]
+
+    def answer(self, position, response):
+        '''
+        Record the response (1-4) to the 0-based question position, replacing any earlier answer.
+        '''
+
+        if self.signature != self.scorer.signature:
+            self.replay()
+        # True == 1, but a boolean is no more a response here than in response_matrix()
+        if isinstance(response, (bool, np.bool_)) or response not in (1, 2, 3, 4):
+            raise ValueError("Every response must be one of 1, 2, 3 or 4.")
+        if not 0 <= position < self.questions:
+            raise IndexError(f"Question {position} is out of range for {self.questions} questions")
+
+        if position in self.answers:
+            self.apply(position, self.answers[position], -1)
+        self.answers[position] = int(response)
+        self.apply(position, int(response), 1)
+
+    def replay(self):
+        # The scorer was re-compiled from a changed database, so rebuild from the recorded answers
+        answers = self.answers
+        self.answers = {}
+        self.seed()
+        for position, response in answers.items():
+            self.answer(position, response)
+
+    def result(self):
+        if self.signature != self.scorer.signature:
+            self.replay()
+
+        sections = self.scorer.sections
+        arrays = {}
+        if "PRS" in sections:
+            counts = self.prs_counts
+            arrays["PRS"] = np.zeros((1, len(TRAITS), 2))
+            arrays["PRS"][0, :, 0] = counts[:, 0] / np.maximum(1, counts[:, 1])
+            arrays["PRS"][0, :, 1] = (counts[:, 1] - counts[:, 0]) / np.maximum(1, counts[:, 1])
+        if "VAK" in sections:
+            vak_columns = self.totals["VAK"]
+            arrays["VAK"] = np.array([[vak_columns[0], vak_columns[3], vak_columns[1] + vak_columns[2] + vak_columns[4]]])
+        for section in ("EMQ", "TRS", "QTM"):
+            if section in sections:
+                arrays[section] = self.totals[section][None, :]
+        if "CTD" in sections:
+            ctd = self.totals["CTD"][None, :]
+            aspect = ctd @ self.scorer.aspect_matrix
+            arrays.update({"CTD": ctd, "Aspect": aspect, "Space": aspect @ self.scorer.space_matrix})
+        return self.scorer.assessment_json(arrays, 0)
+
+    def progress(self):
+        return len(self.answers), self.questions
+
+class MindAssessment(Mapping):
+    '''
+    The mind() result of one respondent as a read-only mapping that scores each section the first
+    time one of its keys is read, so callers that only look at e.g. "vak" never pay for the CTD
+    skills. Only the requested sections are present; dict(result) gives the plain mind() dict.
+    '''
+
+    def __init__(self, scorer, user_responses, sections = None):
+        self.scorer = scorer
+        self.responses = scorer.response_matrix(np.asarray(user_responses).reshape(1, -1))
+        self.sections = scorer.sections if sections is None else mind_sections(sections)
+        missing = set(self.sections) - set(scorer.sections)
+        if missing:
+            raise ValueError(f"The {sorted(missing)} sections were not compiled into this scorer.")
+        self.section_of = {key: section for section in self.sections for key in SECTION_KEYS[section]}
+        self.scored = {}
+
+    def __getitem__(self, key):
+        section = self.section_of[key]
+        if section not in self.scored:
+            arrays = self.scorer.section_arrays(section, self.responses)
+            self.scored[section] = self.scorer.section_json(section, arrays, 0)
+        return self.scored[section][key]
+
+    def __iter__(self):
+        return iter(self.section_of)
+
+    def __len__(self):
+        return len(self.section_of)
+
+    def __repr__(self):
+        return f"MindAssessment(sections={list(self.sections)}, scored={list(self.scored)})"
+
+# Bundle file layout: magic, format version & header length, the JSON header, then every array
+# as raw C-order bytes at an aligned offset
+BUNDLE_MAGIC = b"RO2YAMND"
+BUNDLE_VERSION = 1
+BUNDLE_ALIGNMENT = 64
+
+def is_mind_bundle(path):
+    try:
+        with open(path, "rb") as file:
+            return file.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC
+    except OSError:
+        return False
+
+def export_mind_bundle(database, path = None):
+    '''
+    Compile the assessment_assets tables of the database into a single versioned bundle file
+    that workers memory-map read-only with MindScorer.from_bundle() (or pass to mind() in place
+    of the database). The file is replaced atomically, so running workers pick up a re-export
+    on their next refresh().
+
+    -- database = the path of the SQLite database holding the assessment_assets tables.
+    -- path     = where to write the bundle; defaults to the database path with a .mind suffix.
+    '''
+
+    if path is None:
+        path = os.path.splitext(database)[0] + ".mind"
+
+    scorer = MindScorer(database)
+    arrays, metadata = scorer.bundle_contents()
+
+    def aligned(offset):
+        return -(-offset // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+
+    # Offsets are relative to the aligned end of the header, so they do not depend on its length
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = aligned(offset + array.nbytes)
+
+    header = json.dumps({
+        "version": BUNDLE_VERSION,
+        "database": os.path.abspath(database),
+        "database_signature": scorer.signature,
+        "created": time.time(),
+        "arrays": layout,
+        "metadata": metadata,
+    }).encode("utf-8")
+    prefix = BUNDLE_MAGIC + np.array([BUNDLE_VERSION, len(header)], dtype="<u4").tobytes()
+    data_start = aligned(len(prefix) + len(header))
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(prefix + header)
+        for name, array in arrays.items():
+            file.seek(data_start + layout[name]["offset"])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(data_start + offset)
+    os.replace(temporary_path, path)
+    return path
+
+def read_mind_bundle(path, arrays = True):
+    '''
+    Read the header of a bundle and, unless arrays is False, map its arrays read-only. The
+    result holds the source "database" path, its "metadata" and the "arrays" by name.
+    '''
+
+    with open(path, "rb") as file:
+        prefix = file.read(len(BUNDLE_MAGIC) + 8)
+        if prefix[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a mind() scoring bundle.")
+        version, header_length = np.frombuffer(prefix[len(BUNDLE_MAGIC):], dtype="<u4").tolist()
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"{path} is a version {version} bundle, this ro2ya reads version {BUNDLE_VERSION}; re-export it.")
+        header = json.loads(file.read(header_length).decode("utf-8"))
+
+    bundle = {"database": header["database"], "metadata": header["metadata"], "arrays": None}
+    if arrays:
+        data_start = -(-(len(prefix) + header_length) // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+        mapped = np.memmap(path, dtype=np.uint8, mode="r")
+        bundle["arrays"] = {
+            name: np.ndarray(tuple(layout["shape"]), dtype=np.dtype(layout["dtype"]), buffer=mapped, offset=data_start + layout["offset"])
+            for name, layout in header["arrays"].items()}
+    return bundle
+
+# One compiled scorer per database (or bundle) file, shared by every mind() call
+scorers = {}
+scorers_lock = threading.Lock()
+
+def get_scorer(database, sections = None):
+    # A scorer compiled with fewer sections is cached apart; a full one serves any request
+    sections = mind_sections(sections)
+    full_key, key = (os.path.abspath(database), SECTIONS), (os.path.abspath(database), sections)
+    with scorers_lock:
+        if full_key in scorers:
+            key = full_key
+        elif key not in scorers:
+            if is_mind_bundle(database):
+                key = full_key
+                scorers[key] = MindScorer.from_bundle(database)
+            else:
+                scorers[key] = MindScorer(database, sections=sections)
+            return scorers[key]
+        scorer = scorers[key]
+    return scorer.refresh()
+
+def mind(user_responses, database, sections = None):
+    '''
+    Score one respondent. With sections (some of "PRS", "VAK", "EMQ", "TRS", "QTM" and "CTD")
+    only those tables are read and compiled, and the result is a MindAssessment that scores each
+    section when it is first read; without it the full mind() dict is returned as always.
+    '''
+
+    if sections is None:
+        return get_scorer(database).score(user_responses)
+    return get_scorer(database, sections).lazy(user_responses, sections)
+
+def mind_session(database):
+    return get_scorer(database).session()
+
+def mind_batch(response_matrix, database, sections = None):
+    '''
+    Score a whole cohort at once: response_matrix is (users x questions) and the result is the
+    list of mind() outputs in the same order, holding only the given sections if any.
+    '''
+
+    return get_scorer(database, sections).score_batch(response_matrix, sections)
+
+def flatten_assessment(assessment_json, prefix = ""):
+    '''
+    Flatten one mind() result into a single-level dict with one column per score, e.g.
+    "Personality_Type.E", "vak.type", "Traits.<trait>.score" or "Space.<space>.percentage".
+    '''
+
+    flat = {}
+    for key, value in assessment_json.items():
+        column = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_assessment(value, f"{column}."))
+        else:
+            flat[column] = value
+    return flat
 
+def export_results(results, path, user_ids = None, batch_size = 10000):
+    '''
+    Write mind() results as a flat table with one column per score: a Parquet file when path ends
+    with .parquet (needs pyarrow), a CSV file otherwise. results can be any iterable, it is
+    consumed batch_size rows at a time so large cohorts are never held in memory at once.
+
+    Both formats take their columns from the first result: a later result missing some of them
+    gets empty (CSV) or null (Parquet) cells, and one with a column the first did not have raises
+    a ValueError rather than being written without it.
+    '''
+
+    rows = (flatten_assessment(result) for result in results)
+    if user_ids is not None:
+        rows = (dict({"user_id": user_id}, **row) for user_id, row in zip(user_ids, rows))
+
+    columns = {}
+
+    def batches():
+        batch = []
+        for row in rows:
+            if not columns:
+                columns.update(dict.fromkeys(row))
+            extra = [column for column in row if column not in columns]
+            if extra:
+                raise ValueError(f"Result {written + len(batch)} has columns the first result did not have: {extra}")
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    written = 0
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for batch in batches():
+                if writer is None:
+                    table = pa.Table.from_pydict({column: [row.get(column) for row in batch] for column in columns})
+                    writer = pq.ParquetWriter(path, table.schema)
+                else:
+                    table = pa.Table.from_pylist(batch, schema=writer.schema)
+                writer.write_table(table)
+                written += len(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        return written
+
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = None
+        for batch in batches():
+            if writer is None:
+                writer = csv.DictWriter(csv_file, fieldnames=list(columns), restval="")
+                writer.writeheader()
+            writer.writerows(batch)
+            written += len(batch)
+    return written
+
+class MindResultSink:
+    '''
+    Bulk persistence of mind() results into SQLite: WAL mode, one executemany() transaction per
+    batch, results stored as JSON next to the respondent id (a re-scored respondent is replaced).
+    Results of mind(..., sections=) are stored with just their sections, their missing
+    personality_type / vak_type columns are NULL.
+
+    -- path   = the SQLite database to write to (created if missing).
+    -- table  = the results table.
+    '''
+
+    def __init__(self, path, table = "assessment_results"):
+        self.path = path
+        self.table = table
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "user_id TEXT PRIMARY KEY, personality_type TEXT, vak_type TEXT, scored_at REAL, result TEXT)"
+        )
+
+    def write_batch(self, user_ids, results):
+        scored_at = time.time()
+        # Results scored with sections= only hold some keys (NULL columns); a MindAssessment is read in full
+        rows = []
+        for user_id, result in zip(user_ids, results):
+            result = dict(result)
+            personality_type = result["Personality_Type"]["title"] if "Personality_Type" in result else None
+            vak_type = result["vak"]["type"] if "vak" in result else None
+            rows.append((str(user_id), personality_type, vak_type, scored_at, json.dumps(result, ensure_ascii=False)))
+        self.connection.execute("BEGIN")
+        try:
+            self.connection.executemany(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)", rows)
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+        return len(rows)
+
+    def results(self, batch_size = 10000):
+        cursor = self.connection.execute(f"SELECT user_id, result FROM {self.table} ORDER BY user_id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for user_id, result in rows:
+                yield user_id, json.loads(result)
+
+    def cohort_stats(self, batch_size = 10000, relative_accuracy = 0.01):
+        # The MindCohortStats of every stored result, read batch_size rows at a time
+        stats = MindCohortStats(relative_accuracy)
+        batch = []
+        for _, result in self.results(batch_size):
+            batch.append(result)
+            if len(batch) >= batch_size:
+                stats.add_batch(batch)
+                batch = []
+        stats.add_batch(batch)
+        return stats
+
+    def export(self, path, batch_size = 10000):
+        # Re-parse the stored JSON once so cohort analytics can work on a flat columnar file
+        ids, results = itertools.tee(self.results(batch_size))
+        return export_results((result for _, result in results), path, user_ids=(user_id for user_id, _ in ids), batch_size=batch_size)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ScoreSketch:
+    '''
+    Running moments and a mergeable quantile sketch of one numeric score column. Quantiles use
+    the DDSketch layout: a value v > 0 is counted in bucket ceil(log_gamma(v)), negatives in a
+    mirrored set of buckets and zeros on their own, so any quantile is within relative_accuracy
+    of the true one, memory only grows with the log of the value range, and two sketches (e.g.
+    of two worker processes) merge by adding their counts.
+    '''
+
+    ZERO_BAND = 1e-9
+
+    def __init__(self, relative_accuracy = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+
+    def key(self, magnitude):
+        return int(math.ceil(math.log(magnitude) / self.log_gamma))
+
+    def merge_moments(self, count, mean, m2, low, high):
+        # Chan et al.'s pairwise update, so batches and whole sketches combine the same way
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        mean = values.mean()
+        self.merge_moments(len(values), float(mean), float(((values - mean) ** 2).sum()), float(values.min()), float(values.max()))
+
+        self.zeros += int(np.count_nonzero(np.abs(values) <= self.ZERO_BAND))
+        for buckets, magnitudes in ((self.positive, values[values > self.ZERO_BAND]), (self.negative, -values[values < -self.ZERO_BAND])):
+            if len(magnitudes):
+                keys, counts = np.unique(np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64), return_counts=True)
+                for key, count in zip(keys.tolist(), counts.tolist()):
+                    buckets[key] = buckets.get(key, 0) + count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Cannot merge sketches of relative accuracy {self.relative_accuracy} and {other.relative_accuracy}.")
+        self.merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+        self.zeros += other.zeros
+        for buckets, other_buckets in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_buckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+        return self
+
+    @property
+    def std(self):
+        # Population standard deviation of every value seen
+        return math.sqrt(self.m2 / self.count) if self.count else math.nan
+
+    def bucket_value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        buckets = [(-self.bucket_value(key), count) for key, count in sorted(self.negative.items(), reverse=True)]
+        buckets.append((0.0, self.zeros))
+        buckets += [(self.bucket_value(key), count) for key, count in sorted(self.positive.items())]
+        for value, count in buckets:
+            seen += count
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentile_rank(self, value):
+        # Share of the cohort below value (counting half of its own bucket), in percent
+        if not self.count:
+            return math.nan
+        if value > self.ZERO_BAND:
+            key = self.key(value)
+            below = sum(self.negative.values()) + self.zeros + sum(count for bucket, count in self.positive.items() if bucket < key)
+            at = self.positive.get(key, 0)
+        elif value < -self.ZERO_BAND:
+            key = self.key(-value)
+            below = sum(count for bucket, count in self.negative.items() if bucket > key)
+            at = self.negative.get(key, 0)
+        else:
+            below, at = sum(self.negative.values()), self.zeros
+        return 100 * (below + at / 2) / self.count
+
+    def to_dict(self):
+        return {"relative_accuracy": self.relative_accuracy, "count": self.count, "mean": self.mean, "m2": self.m2,
+                "min": self.min if self.count else None, "max": self.max if self.count else None,
+                "positive": list(self.positive.items()), "negative": list(self.negative.items()), "zeros": self.zeros}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state["relative_accuracy"])
+        sketch.count, sketch.mean, sketch.m2 = state["count"], state["mean"], state["m2"]
+        if sketch.count:
+            sketch.min, sketch.max = state["min"], state["max"]
+        sketch.positive = {int(key): count for key, count in state["positive"]}
+        sketch.negative = {int(key): count for key, count in state["negative"]}
+        sketch.zeros = state["zeros"]
+        return sketch
+
+class MindCohortStats:
+    '''
+    Streaming cohort norms over mind() results, fed one batch at a time in constant memory:
+    every numeric column of flatten_assessment() (trait, skill & space scores, percentages,
+    probabilities) keeps a ScoreSketch, every text column (vak.type, Personality_Type.title,
+    the levels) keeps its type counts. Stats of several worker processes merge with merge(), or
+    through save() & load() files.
+
+    -- relative_accuracy = of the quantile sketches; 0.01 keeps percentiles within 1%.
+    '''
+
+    def __init__(self, relative_accuracy = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.users = 0
+        self.scores = {}
+        self.types = {}
+
+    def add_batch(self, results):
+        numeric, text = {}, {}
+        users = 0
+        for result in results:
+            for column, value in flatten_assessment(result).items():
+                if isinstance(value, str):
+                    text.setdefault(column, []).append(value)
+                elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+                    numeric.setdefault(column, []).append(value)
+            users += 1
+
+        for column, values in numeric.items():
+            if column not in self.scores:
+                self.scores[column] = ScoreSketch(self.relative_accuracy)
+            self.scores[column].add(values)
+        for column, values in text.items():
+            counts = self.types.setdefault(column, {})
+            for value in values:
+                counts[value] = counts.get(value, 0) + 1
+        self.users += users
+        return users
+
+    def add(self, result):
+        return self.add_batch([result])
+
+    def merge(self, other):
+        # Checked up front: columns only other has would otherwise be taken over at its accuracy
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Cannot merge cohort stats of relative accuracy {self.relative_accuracy} and {other.relative_accuracy}.")
+        self.users += other.users
+        for column, sketch in other.scores.items():
+            if column in self.scores:
+                self.scores[column].merge(sketch)
+            else:
+                self.scores[column] = ScoreSketch.from_dict(sketch.to_dict())
+        for column, counts in other.types.items():
+            merged = self.types.setdefault(column, {})
+            for value, count in counts.items():
+                merged[value] = merged.get(value, 0) + count
+        return self
+
+    def norms(self, percentiles = (5, 25, 50, 75, 95)):
+        '''
+        The cohort norms: per score column its count, mean, std, min, max and the given
+        percentiles (as "p50" etc.), and per text column the count of every value.
+        '''
+
+        scores = {}
+        for column, sketch in self.scores.items():
+            norms = {"count": sketch.count, "mean": sketch.mean, "std": sketch.std, "min": sketch.min, "max": sketch.max}
+            for percentile in percentiles:
+                norms[f"p{percentile:g}"] = sketch.quantile(percentile / 100)
+            scores[column] = norms
+        return {"users": self.users, "scores": scores, "types": {column: dict(counts) for column, counts in self.types.items()}}
+
+    def percentile_ranks(self, result):
+        # Where one mind() result stands in the cohort: flat score column -> percentile rank
+        return {column: self.scores[column].percentile_rank(value) for column, value in flatten_assessment(result).items()
+                if column in self.scores and not isinstance(value, (str, bool))}
+
+    def to_dict(self):
+        return {"relative_accuracy": self.relative_accuracy, "users": self.users,
+                "scores": {column: sketch.to_dict() for column, sketch in self.scores.items()},
+                "types": self.types}
+
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls(state["relative_accuracy"])
+        stats.users = state["users"]
+        stats.scores = {column: ScoreSketch.from_dict(sketch) for column, sketch in state["scores"].items()}
+        stats.types = {column: dict(counts) for column, counts in state["types"].items()}
+        return stats
+
+    def save(self, path):
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as stats_file:
+            json.dump(self.to_dict(), stats_file, ensure_ascii=False)
+        os.replace(temporary_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as stats_file:
+            return cls.from_dict(json.load(stats_file))
+
+class MindService:
+    '''
+    A long-running scoring service that keeps one compiled MindScorer warm behind a local
+    asyncio HTTP endpoint. Concurrent requests are queued and scored together in micro-batches
+    of up to max_batch users, waiting at most max_delay seconds for a batch to fill up.
+
+    -- POST /score  {"responses": [...]} or {"users": [[...], ...]}  -> {"result": ...} or {"results": [...]}
+    -- GET  /stats  -> request, user, batch and error counters with latency & throughput figures.
+
+    database can also be a bundle written by export_mind_bundle().
+    '''
+
+    def __init__(self, database, host = "127.0.0.1", port = 8765, max_batch = 256, max_delay = 0.005, pool_size = 2):
+        if is_mind_bundle(database):
+            self.pool = None
+            self.scorer = MindScorer.from_bundle(database)
+        else:
+            self.pool = SQLiteReadPool(database, pool_size)
+            self.scorer = MindScorer(database, self.pool)
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self.pending = None
+        self.loop = None
+        self.batcher_task = None
+        self.started = time.time()
+        self.counters = {"requests": 0, "users": 0, "batches": 0, "errors": 0}
+        self.latencies = deque(maxlen=10000)
+
+    async def score(self, response_matrix):
+        '''
+        Score a (users x questions) matrix through the micro-batcher; usable in-process too.
+        '''
+
+        if np.ndim(response_matrix) != 2:
+            raise ValueError("Expected a (users x questions) response matrix.")
+        # Validated like mind(): 2.5, "2" or None are rejected, not truncated or parsed
+        matrix = self.scorer.response_matrix(response_matrix)
+
+        started = time.perf_counter()
+        self.start_batcher()
+        future = asyncio.get_running_loop().create_future()
+        await self.pending.put((matrix, future))
+        try:
+            return await future
+        finally:
+            self.counters["requests"] += 1
+            self.latencies.append(time.perf_counter() - started)
+
+    def start_batcher(self):
+        # The queue & batcher task are made on first use in the running loop, so score() also works without serve()
+        loop = asyncio.get_running_loop()
+        if self.pending is None or self.loop is not loop:
+            self.loop = loop
+            self.pending = asyncio.Queue()
+            self.batcher_task = loop.create_task(self.batcher())
+
+    async def batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.pending.get()]
+            try:
+                await self.score_batch_items(loop, batch)
+            except Exception as e:
+                # Nothing may stop the batcher, or every later request would wait forever
+                for _, future in batch:
+                    self.resolve(future, None, e)
+
+    async def score_batch_items(self, loop, batch):
+        users = len(batch[0][0])
+        deadline = loop.time() + self.max_delay
+        while users < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.pending.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            users += len(item[0])
+
+        # Rows of different lengths cannot share a matrix, so each length is scored on its own
+        by_length = {}
+        for item in batch:
+            by_length.setdefault(item[0].shape[1], []).append(item)
+        for items in by_length.values():
+            await loop.run_in_executor(None, self.score_items, items)
+
+    def score_items(self, items):
+        try:
+            # A database caught mid-edit (locked, half-written, strict KeyError) fails this batch only
+            self.scorer.refresh()
+        except Exception as e:
+            for _, future in items:
+                self.resolve(future, None, e)
+            return
+        try:
+            results = self.scorer.score_batch(np.concatenate([matrix for matrix, _ in items]))
+        except Exception:
+            # Score the requests one by one so a bad request only fails itself
+            for matrix, future in items:
+                try:
+                    self.resolve(future, self.scorer.score_batch(matrix), None)
+                except Exception as e:
+                    self.resolve(future, None, e)
+            return
+        self.counters["batches"] += 1
+        start = 0
+        for matrix, future in items:
+            self.resolve(future, results[start:start + len(matrix)], None)
+            start += len(matrix)
+
+    def resolve(self, future, results, error):
+        loop = future.get_loop()
+        if error is not None:
+            self.counters["errors"] += 1
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_exception(error))
+        else:
+            self.counters["users"] += len(results)
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(results))
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        percentile = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3) if latencies else None
+        uptime = time.time() - self.started
+        return dict(self.counters,
+                    uptime_seconds=round(uptime, 3),
+                    users_per_second=round(self.counters["users"] / uptime, 3) if uptime else 0.0,
+                    latency_ms={"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99), "max": percentile(1.0)})
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self.route(method, path, body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/stats":
+            return "200 OK", self.stats()
+        if method != "POST" or path != "/score":
+            return "404 Not Found", {"error": f"No route for {method} {path}"}
+        try:
+            request = json.loads(body or b"{}")
+            if "users" in request:
+                return "200 OK", {"results": await self.score(request["users"])}
+            return "200 OK", {"result": (await self.score([request["responses"]]))[0]}
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            return "400 Bad Request", {"error": f"{type(e).__name__}: {e}"}
+
+    async def serve(self):
+        self.start_batcher()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Scoring {self.scorer.database} on http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.batcher_task.cancel()
+            self.pending = None
+            if self.pool is not None:
+                self.pool.close()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+def generate_assessment_database(path, questions = 60, spaces = 3, qtm_traits = 8, seed = 0):
+    '''
+    Write a synthetic SQLite database with the seven assessment_assets tables, for benchmarks.
+
+    -- questions   = the number of question rows in every table.
+    -- spaces      = the number of CMF spaces; each gets 3-5 aspects of 3 or 4 CTD skills.
+    -- qtm_traits  = the number of QTM trait columns.
+    '''
+
+    rng = np.random.default_rng(seed)
+    methods = list(scoring_methods.keys())
+
+    def method_cells(rows, columns, density):
+        cells = rng.choice(methods, size=(rows, columns)).astype(object)
+        cells[rng.random((rows, columns)) >= density] = None
+        return cells
+
+    def table(columns, cells):
+        idx = pd.DataFrame({"Idx": [str(float(i + 1)) for i in range(questions)]})
+        return pd.concat([idx, pd.DataFrame(cells, columns=columns)], axis=1)
+
+    hierarchy = [("Space", "Aspect", "Skill")]
+    skills = []
+    for s in range(spaces):
+        for a in range(int(rng.integers(3, 6))):
+            for _ in range(int(rng.choice([3, 4]))):
+                skills.append(f"Skill{len(skills) + 1}")
+                hierarchy.append((f"Space{s + 1}", f"Aspect{s + 1}.{a + 1}", skills[-1]))
+
+    tables = {
+        "PRS": table(TRAITS, rng.choice(["Y", "N"], size=(questions, len(TRAITS)))),
+        "VAK": table(VAK_COLUMNS, method_cells(questions, len(VAK_COLUMNS), 0.3)),
+        "EMQ": table(EMQ_CATEGORIES, method_cells(questions, len(EMQ_CATEGORIES), 0.2)),
+        "TRS": table(list(roles.keys()), method_cells(questions, len(roles), 0.15)),
+        "CTD": table(skills, method_cells(questions, len(skills), 0.1)),
+        "CMF": pd.DataFrame(hierarchy, columns=["Space", "Aspect", "Skill"]),
+        "QTM": table([f"Trait{i + 1}" for i in range(qtm_traits)], method_cells(questions, qtm_traits, 0.2)),
+    }
+
+    connection = sqlite3.connect(path)
+    try:
+        for section, df in tables.items():
+            df.to_sql(ASSESSMENT_TABLES[section], connection, if_exists="replace", index=False)
     finally:
         connection.close()
+    return path
+
+def random_responses(users, questions, seed = 0):
+    return np.random.default_rng(seed).integers(1, 5, size=(users, questions))
+
+def benchmark_mind(database = None, questions = 60, users = 10000, single_runs = 1000, seed = 0):
+    '''
+    Time mind() on a (synthetic by default) database: the cold compile, the warm single-user
+    latency and the batch throughput of the vectorised scorer.
+    '''
+
+    if database is None:
+        database = generate_assessment_database(os.path.join(tempfile.mkdtemp(), "assessment_bench.db"), questions, seed=seed)
+
+    started = time.perf_counter()
+    scorer = MindScorer(database)
+    compile_seconds = time.perf_counter() - started
+
+    questions = scorer.questions
+    responses = random_responses(max(users, single_runs), questions, seed)
+
+    latencies = []
+    for user in range(single_runs):
+        started = time.perf_counter()
+        scorer.score(responses[user])
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    started = time.perf_counter()
+    scorer.score_arrays(responses[:users])
+    arrays_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scorer.score_batch(responses[:users])
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        "database": database,
+        "questions": questions,
+        "compile_ms": round(compile_seconds * 1000, 3),
+        "single_user_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 4),
+            "p50": round(latencies[len(latencies) // 2] * 1000, 4),
+            "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 4),
+        },
+        "batch_users": users,
+        "arrays_users_per_second": round(users / arrays_seconds, 1),
+        "batch_users_per_second": round(users / batch_seconds, 1),
+    }
+
+def profile_mind(database = None, questions = 60, users = 10000, seed = 0, top = 10):
+    '''
+    Time, cProfile and tracemalloc each mind() section (PRS, VAK, EMQ, TRS, CTD/CMF, QTM and the
+    final JSON building) over a batch of random respondents. Every section maps to its seconds,
+    its peak traced memory in bytes and the top cumulative cProfile entries as text.
+    '''
+
+    if database is None:
+        database = generate_assessment_database(os.path.join(tempfile.mkdtemp(), "assessment_bench.db"), questions, seed=seed)
+
+    scorer = MindScorer(database)
+    responses = scorer.response_matrix(random_responses(users, scorer.questions, seed))
+    arrays = scorer.score_arrays(responses)
+
+    sections = {
+        "PRS": lambda: scorer.score_prs(responses),
+        "VAK": lambda: scorer.score_vak(responses),
+        "EMQ": lambda: scorer.section_scores(scorer.emq_points, responses),
+        "TRS": lambda: scorer.section_scores(scorer.trs_points, responses),
+        "CTD/CMF": lambda: scorer.score_ctd(responses),
+        "QTM": lambda: scorer.section_scores(scorer.qtm_points, responses),
+        "JSON": lambda: [scorer.assessment_json(arrays, user) for user in range(users)],
+    }
+
+    report = {}
+    for section, run in sections.items():
+        started = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - started
+
+        # Profiled & traced separately so their overhead does not leak into the timing
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+        run()
+        profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(top)
+        report[section] = {"seconds": round(seconds, 6), "peak_bytes": peak, "profile": stream.getvalue()}
+
+    return report
 
-    return assessment_json
+if __name__ == "__main__":
+    print(json.dumps(benchmark_mind(), indent=4))
+    for section, figures in profile_mind().items():
+        print(f"{section}: {figures['seconds'] * 1000:.3f} ms, peak {figures['peak_bytes'] / 1024:.1f} KiB")
@@ -0,0 +1,837 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from types import SimpleNamespace
+from xml.etree import ElementTree
+
+import pytest
+
+import ro2ya.flow as flow
+
+from ro2ya.flow import AudioBlobStore, CatalogueDelivery, CatalogueStandInServer, CourseLeaseQueue, FlowManifest, FlowPipeline, LectureSegments, ManifestLedger, PanelInventory, PromptStats, ScratchMirror, StreamingDocxWriter, TranscriptionScheduler, WordTimingStore, flow_processing
+
+
+def write_manifest(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=["Id", "Name", "Mp3", "Course_Name"])
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+@pytest.fixture
+def panel_master(tmp_path):
+    path = tmp_path / "panel_master"
+    path.mkdir()
+    return str(path)
+
+
+class RecordingSteps:
+    '''The flow_processing() stages a FlowPipeline job calls, recording each call instead.'''
+
+    def __init__(self, fail_courses = ()):
+        self.calls = []
+        self.fail_courses = set(fail_courses)
+
+    def process_csv(self, csv_src_path, processed_csv_path):
+        self.calls.append(("process_csv", csv_src_path))
+
+    def create_course_folders(self, processed_csv_path, panel_master_path):
+        self.calls.append(("create_course_folders", processed_csv_path))
+
+    def download_and_rename_mp3(self, processed_csv_path, panel_master_path, dedupe = False):
+        self.calls.append(("download_and_rename_mp3", dedupe))
+
+    def transcribe_course(self, model, paragraph, manifest, inventory, panel_master_path, folder_name, *options):
+        if folder_name in self.fail_courses:
+            raise RuntimeError(f"{folder_name} failed")
+        self.calls.append(("transcribe_course", folder_name, model))
+        return True
+
+    def wait_for_alt_transcriptions(self):
+        self.calls.append(("wait_for_alt_transcriptions",))
+
+    def load_audio_store(self, panel_master_path):
+        return None
+
+
+def make_pipeline(tmp_path, panel_master, steps):
+    reference_path = tmp_path / "reference.txt"
+    reference_path.write_text("مرحبا\nبكم", encoding="utf-8")
+    loaded = []
+
+    def model_loader(model_size, num_workers):
+        loaded.append((model_size, num_workers))
+        return object()
+
+    processed_csv_path = write_manifest(str(tmp_path / "processed.csv"), [
+        {"Id": "101", "Name": "01-Intro", "Mp3": "a/01.mp3", "Course_Name": "Algebra"},
+        {"Id": "102", "Name": "01-Intro", "Mp3": "b/01.mp3", "Course_Name": "Physics"},
+    ])
+    pipeline = FlowPipeline(panel_master, processed_csv_path, steps, str(reference_path), model_loader)
+    return pipeline, loaded
+
+
+def test_pipeline_serves_spool_jobs_with_one_model(tmp_path, panel_master):
+    for course in ("Algebra", "Physics"):
+        os.mkdir(os.path.join(panel_master, course))
+    steps = RecordingSteps()
+    pipeline, loaded = make_pipeline(tmp_path, panel_master, steps)
+
+    jobs_path = tmp_path / "jobs"
+    jobs_path.mkdir()
+    (jobs_path / "01.json").write_text(json.dumps({"manifest": "upload.csv"}), encoding="utf-8")
+    (jobs_path / "02.json").write_text(json.dumps({"course": "Physics"}), encoding="utf-8")
+
+    pipeline.serve(str(jobs_path), poll_seconds=0.01, idle_exit_seconds=0.1)
+
+    assert loaded == [("large-v2", 1)]
+    assert sorted(os.listdir(jobs_path)) == ["01.json.done", "02.json.done"]
+    transcribed = [call for call in steps.calls if call[0] == "transcribe_course"]
+    assert sorted(call[1] for call in transcribed) == ["Algebra", "Physics", "Physics"]
+    assert len({id(call[2]) for call in transcribed}) == 1
+    assert ("process_csv", "upload.csv") in steps.calls
+
+
+def test_pipeline_marks_failed_jobs_and_keeps_serving(tmp_path, panel_master):
+    for course in ("Algebra", "Physics"):
+        os.mkdir(os.path.join(panel_master, course))
+    steps = RecordingSteps(fail_courses=["Algebra"])
+    pipeline, loaded = make_pipeline(tmp_path, panel_master, steps)
+
+    jobs_path = tmp_path / "jobs"
+    jobs_path.mkdir()
+    (jobs_path / "01.json").write_text(json.dumps({"course": "Algebra"}), encoding="utf-8")
+    (jobs_path / "02.json").write_text(json.dumps({"course": "Physics"}), encoding="utf-8")
+
+    pipeline.serve(str(jobs_path), poll_seconds=0.01, idle_exit_seconds=0.1)
+
+    assert sorted(os.listdir(jobs_path)) == ["01.json.failed", "02.json.done"]
+    assert "RuntimeError: Algebra failed" in (jobs_path / "01.json.failed").read_text(encoding="utf-8")
+    assert loaded == [("large-v2", 1)]
+
+
+def test_pipeline_refuses_to_ask_on_the_console(tmp_path, panel_master):
+    pipeline, loaded = make_pipeline(tmp_path, panel_master, RecordingSteps())
+    with pytest.raises(ValueError):
+        pipeline.serve(str(tmp_path / "jobs"), idle_exit_seconds=0, below_threshold="ask")
+    assert loaded == []
+
+
+def test_pipeline_reparses_a_rewritten_manifest(tmp_path, panel_master):
+    pipeline, _ = make_pipeline(tmp_path, panel_master, RecordingSteps())
+    manifest = pipeline.load_manifest(pipeline.processed_csv_path)
+    assert pipeline.load_manifest(pipeline.processed_csv_path) is manifest
+
+    write_manifest(pipeline.processed_csv_path, [{"Id": "7", "Name": "03-Waves", "Mp3": "c/03.mp3", "Course_Name": "Physics"}])
+    assert pipeline.load_manifest(pipeline.processed_csv_path).video_id("Physics", 3) == 7
+
+
+def test_flow_processing_returns_its_pipeline_and_stages(tmp_path, panel_master):
+    processed_csv_path = write_manifest(str(tmp_path / "processed.csv"), [])
+    pipeline = flow_processing("source.csv", processed_csv_path, panel_master, str(tmp_path / "intermediate"), str(tmp_path / "post.json"))
+    assert isinstance(pipeline, FlowPipeline)
+    for stage in ("process_csv", "download_and_rename_mp3", "transcribe_course", "transcribe_with_course_queue", "transcribe_longest_first", "deliver_post_request", "open_scratch_workspace"):
+        assert callable(getattr(pipeline.steps, stage))
+    assert pipeline.steps.load_inventory(panel_master) is pipeline.load_inventory(panel_master)
+
+
+def test_process_csv_feeds_the_following_stages(tmp_path, panel_master):
+    processed_csv_path = write_manifest(str(tmp_path / "processed.csv"), [])
+    pipeline = flow_processing("source.csv", processed_csv_path, panel_master, str(tmp_path / "intermediate"), str(tmp_path / "post.json"))
+    assert pipeline.load_manifest(processed_csv_path).courses() == []
+
+    csv_src_path = str(tmp_path / "source.csv")
+    with open(csv_src_path, "w", newline="", encoding="utf-8") as csv_file:
+        csv_file.write("Id,Name,Mp3\n1,01-Intro,https://cdn/linear_algebra\n2,01-Waves,https://cdn/physics\n")
+    pipeline.steps.process_csv(csv_src_path, processed_csv_path)
+    pipeline.steps.create_course_folders(processed_csv_path, panel_master)
+
+    assert not os.path.exists(csv_src_path)
+    assert sorted(pipeline.load_manifest(processed_csv_path).courses()) == ["Linear Algebra", "Physics"]
+    assert os.path.isdir(os.path.join(panel_master, "Linear Algebra")) and os.path.isdir(os.path.join(panel_master, "Physics"))
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeSession:
+    '''Serves fixed bytes per URL and counts the requests.'''
+
+    def __init__(self, contents):
+        self.contents = contents
+        self.requested = []
+
+    def get(self, url, stream = False):
+        self.requested.append(url)
+        return FakeResponse(self.contents[url])
+
+
+class Progress:
+    def update(self, count):
+        pass
+
+
+def test_audio_store_downloads_each_url_and_content_once(tmp_path):
+    session = FakeSession({"a/01.mp3": b"lecture one", "b/01.mp3": b"lecture one", "c/02.mp3": b"lecture two"})
+    store = AudioBlobStore(str(tmp_path / "store"), session)
+
+    first = store.fetch("a/01.mp3")
+    assert store.fetch("a/01.mp3") == first
+    assert store.fetch("b/01.mp3") == first
+    assert store.fetch("c/02.mp3") != first
+
+    assert session.requested == ["a/01.mp3", "b/01.mp3", "c/02.mp3"]
+    assert store.stats["downloaded"] == 2 and store.stats["same_url"] == 1 and store.stats["same_bytes"] == 1
+    assert os.listdir(tmp_path / "store" / "tmp") == []
+
+
+def test_audio_store_links_courses_to_one_blob(tmp_path):
+    store = AudioBlobStore(str(tmp_path / "store"), FakeSession({"a/01.mp3": b"lecture one"}))
+    checksum = store.fetch("a/01.mp3")
+    for course in ("Algebra", "Physics"):
+        (tmp_path / course).mkdir()
+        store.link(checksum, str(tmp_path / course / f"01-{course}.mp3"))
+
+    assert os.stat(store.blob_path(checksum)).st_nlink == 3
+    assert store.checksum_for(str(tmp_path / "Physics" / "01-Physics.mp3")) == checksum
+    assert store.stats["hardlinked"] == 2
+
+    store.save_transcription(checksum, [{"start": 0.0, "end": 1.5, "text": "hello"}])
+    assert store.load_transcription(checksum) == [{"start": 0.0, "end": 1.5, "text": "hello"}]
+
+    store.forget(str(tmp_path / "Physics" / "01-Physics.mp3"))
+    assert store.checksum_for(str(tmp_path / "Physics" / "01-Physics.mp3")) is None
+
+
+def test_audio_store_counts_links_that_fell_back_to_copies(tmp_path, monkeypatch):
+    store = AudioBlobStore(str(tmp_path / "store"), FakeSession({"a/01.mp3": b"lecture one"}))
+    checksum = store.fetch("a/01.mp3")
+
+    def no_links(*args):
+        raise OSError("links are not supported here")
+
+    monkeypatch.setattr(os, "link", no_links)
+    monkeypatch.setattr(os, "symlink", no_links)
+    mp3_drive_path = store.link(checksum, str(tmp_path / "01-Algebra.mp3"))
+
+    assert store.stats["copied"] == 1 and store.stats["hardlinked"] == 0
+    with open(mp3_drive_path, "rb") as mp3_file:
+        assert mp3_file.read() == b"lecture one"
+
+
+def test_plain_download_replaces_a_linked_course_file(tmp_path, panel_master):
+    processed_csv_path = write_manifest(str(tmp_path / "processed.csv"), [])
+    pipeline = flow_processing("source.csv", processed_csv_path, panel_master, str(tmp_path / "intermediate"), str(tmp_path / "post.json"))
+    session = FakeSession({"a/01.mp3": b"first upload"})
+    pipeline.session.get = session.get
+    course_path = os.path.join(panel_master, "Algebra")
+    os.mkdir(course_path)
+
+    # A dedupe run links the course file to its blob
+    store = pipeline.steps.load_audio_store(panel_master)
+    checksum = store.fetch("a/01.mp3")
+    mp3_drive_path = store.link(checksum, os.path.join(course_path, "01-Algebra.mp3"))
+
+    # A later run without dedupe downloads new bytes for the same lecture
+    session.contents["a/01.mp3"] = b"re-recorded upload"
+    assert pipeline.steps.download_mp3("a/01.mp3", course_path, "01-Intro", "Algebra", Progress()) == mp3_drive_path
+
+    with open(mp3_drive_path, "rb") as mp3_file:
+        assert mp3_file.read() == b"re-recorded upload"
+    with open(store.blob_path(checksum), "rb") as blob_file:
+        assert blob_file.read() == b"first upload"
+    assert store.checksum_for(mp3_drive_path) is None
+
+
+REFERENCE_TEXT = "ازيك عامل ايه النهارده"
+
+
+class FakeWhisperModel:
+    '''Transcribes every lecture as the reference text; lectures whose path holds a fail marker raise.'''
+
+    def __init__(self, *args, fail_marker = "Broken", **kwargs):
+        self.fail_marker = fail_marker
+        self.transcribed = []
+
+    def transcribe(self, audio, **options):
+        if self.fail_marker in str(audio):
+            raise RuntimeError(f"cannot decode {os.path.basename(str(audio))}")
+        self.transcribed.append(str(audio))
+        words = [SimpleNamespace(start=float(i), end=float(i) + 0.5, word=f" {word}") for i, word in enumerate(REFERENCE_TEXT.split())]
+        return iter([SimpleNamespace(start=0.0, end=float(len(words)), text=REFERENCE_TEXT, words=words)]), None
+
+
+@pytest.fixture
+def flow_pipeline(tmp_path, panel_master, monkeypatch):
+    '''A flow_processing() pipeline over panel_master with the Whisper model and audio decoding faked.'''
+
+    monkeypatch.setattr(flow, "WhisperModel", FakeWhisperModel)
+    monkeypatch.setattr(flow, "decode_audio", lambda path, sampling_rate = 16000: path)
+    reference_path = tmp_path / "reference.txt"
+    reference_path.write_text(REFERENCE_TEXT, encoding="utf-8")
+
+    processed_csv_path = write_manifest(str(tmp_path / "processed.csv"), [
+        {"Id": str(100 + i), "Name": f"0{i}-Lecture", "Mp3": f"{course}/0{i}.mp3", "Course_Name": course}
+        for course in ("Algebra", "Broken") for i in (1, 2)
+    ])
+    pipeline = flow_processing("source.csv", processed_csv_path, panel_master, str(tmp_path / "intermediate"), str(tmp_path / "post.json"))
+    pipeline.reference_path = str(reference_path)
+    return pipeline
+
+
+def add_course(panel_master, course, lectures = 2):
+    os.mkdir(os.path.join(panel_master, course))
+    for i in range(1, lectures + 1):
+        with open(os.path.join(panel_master, course, f"0{i}-{course}.mp3"), "wb") as mp3_file:
+            mp3_file.write(b"ID3")
+
+
+def test_course_queue_reclaims_an_expired_lease(tmp_path):
+    queue_db_path = str(tmp_path / "queue.sqlite3")
+    first = CourseLeaseQueue(queue_db_path, "first", lease_seconds=0.2)
+    second = CourseLeaseQueue(queue_db_path, "second", lease_seconds=60)
+    first.add_courses(["Algebra", "Physics"])
+
+    claimed = first.claim()
+    other = second.claim()
+    assert {claimed, other} == {"Algebra", "Physics"}
+    assert second.claim() is None
+
+    # The first worker stops heartbeating; its course goes to the second one
+    time.sleep(0.3)
+    assert second.claim() == claimed
+    assert not first.heartbeat(claimed)
+    first.release(claimed)
+    assert second.status() == {"leased": 2}
+
+    second.release(claimed)
+    second.release(other)
+    assert second.status() == {"done": 2}
+
+
+def test_course_queue_keeps_a_held_lease_alive(tmp_path):
+    queue_db_path = str(tmp_path / "queue.sqlite3")
+    holder = CourseLeaseQueue(queue_db_path, "holder", lease_seconds=0.2, heartbeat_seconds=0.05)
+    other = CourseLeaseQueue(queue_db_path, "other")
+    holder.add_courses(["Algebra"])
+
+    with holder.hold(holder.claim()) as lease_lost:
+        time.sleep(0.4)
+        assert other.claim() is None
+        assert not lease_lost.is_set()
+    assert other.status() == {"done": 1}
+
+
+def test_course_queue_requeues_done_courses_and_fails_after_max_attempts(tmp_path):
+    queue = CourseLeaseQueue(str(tmp_path / "queue.sqlite3"), "worker", max_attempts=2)
+    queue.add_courses(["Algebra"])
+
+    for attempt in range(2):
+        with pytest.raises(RuntimeError):
+            with queue.hold(queue.claim()):
+                raise RuntimeError("disk full")
+        assert queue.status() == ({"pending": 1} if attempt == 0 else {"failed": 1})
+    assert queue.errors() == {"Algebra": "RuntimeError: disk full"}
+    assert queue.claim() is None
+
+    queue.add_courses(["Algebra"])
+    assert queue.status() == {"failed": 1}
+
+    with sqlite3.connect(str(tmp_path / "queue.sqlite3")) as connection:
+        connection.execute("UPDATE course_queue SET status = 'done'")
+    queue.add_courses(["Algebra"])
+    assert queue.status() == {"pending": 1}
+
+
+def test_course_queue_workers_survive_a_failing_course(tmp_path, panel_master, flow_pipeline):
+    add_course(panel_master, "Algebra")
+    add_course(panel_master, "Broken")
+    queue_db_path = str(tmp_path / "queue.sqlite3")
+
+    for worker_id in ("first", "second"):
+        flow_pipeline.steps.transcribe_with_course_queue(panel_master, flow_pipeline.processed_csv_path, queue_db_path, worker_id, alt_docx = "off")
+
+    queue = CourseLeaseQueue(queue_db_path)
+    assert queue.status() == {"done": 1, "failed": 1}
+    assert "cannot decode" in queue.errors()["Broken"]
+    assert os.path.exists(os.path.join(panel_master, "Algebra", "Algebra Transcriptions.json"))
+    assert sorted(os.listdir(os.path.join(panel_master, "Algebra", "lectures_folder"))) == ["01-Algebra.mp3", "02-Algebra.mp3"]
+    assert os.path.exists(os.path.join(panel_master, "Broken", "01-Broken.mp3"))
+
+
+def catalogue_videos(course, count):
+    return [{"videoId": f"{course}-{i}", "paragraphInfo": [{"paragraphDetails": "كلام " * (i % 7 + 1)}]} for i in range(count)]
+
+
+def test_catalogue_batches_stay_within_max_batch_bytes():
+    videos = catalogue_videos("Algebra", 60)
+    with CatalogueStandInServer() as stand_in, CatalogueDelivery(stand_in.url, max_batch_bytes=1024) as delivery:
+        batch_count = delivery.deliver("Algebra", videos)
+
+    assert batch_count == len(stand_in.payload_sizes) > 1
+    assert max(stand_in.payload_sizes) <= 1024
+    assert stand_in.videos == videos
+    assert delivery.stats["compressed_bytes"] < delivery.stats["bytes"] == sum(stand_in.payload_sizes)
+
+
+def test_catalogue_retries_503_with_backoff():
+    videos = catalogue_videos("Physics", 5)
+    with CatalogueStandInServer(fail_first=2) as stand_in, CatalogueDelivery(stand_in.url, backoff_seconds=0.05) as delivery:
+        started = time.perf_counter()
+        delivery.deliver("Physics", videos)
+        elapsed = time.perf_counter() - started
+
+    assert delivery.stats["retries"] == 2
+    assert elapsed >= 0.05 + 0.1
+    assert stand_in.requests == 3 and stand_in.videos == videos
+
+
+def test_catalogue_gives_up_after_max_retries():
+    with CatalogueStandInServer(fail_first=10) as stand_in, CatalogueDelivery(stand_in.url, max_retries=2, backoff_seconds=0.01) as delivery:
+        with pytest.raises(flow.requests.HTTPError):
+            delivery.deliver("Physics", catalogue_videos("Physics", 3))
+    assert stand_in.requests == 3 and stand_in.videos == []
+
+
+def test_catalogue_replays_are_deduplicated_by_idempotency_key():
+    videos = catalogue_videos("Algebra", 40)
+    with CatalogueStandInServer() as stand_in:
+        for _ in range(2):
+            with CatalogueDelivery(stand_in.url, max_batch_bytes=2048) as delivery:
+                batch_count = delivery.deliver("Algebra", videos)
+
+    assert stand_in.requests == 2 * batch_count
+    assert len(stand_in.keys) == batch_count
+    assert stand_in.videos == videos
+
+
+def test_deliver_post_request_streams_every_final_json(tmp_path, panel_master, flow_pipeline):
+    delivered = {}
+    for course in ("Algebra", "Physics"):
+        os.mkdir(os.path.join(panel_master, course))
+        delivered[course] = catalogue_videos(course, 12)
+        with open(os.path.join(panel_master, course, f"{course} Final.json"), "w", encoding="utf-8") as final_file:
+            json.dump({"videosScriptsInfo": delivered[course]}, final_file, ensure_ascii=False)
+
+    with CatalogueStandInServer(fail_first=1) as stand_in:
+        stats = flow_pipeline.steps.deliver_post_request(panel_master, stand_in.url, max_batch_bytes=1024, courses=["Physics"])
+        assert stand_in.videos == delivered["Physics"]
+        stats = flow_pipeline.steps.deliver_post_request(panel_master, stand_in.url, max_batch_bytes=1024)
+
+    assert sorted(video["videoId"] for video in stand_in.videos) == sorted(video["videoId"] for videos in delivered.values() for video in videos)
+    assert stats["courses"] == 2
+
+
+def test_scheduler_projects_longest_first(tmp_path):
+    durations = {"a.mp3": 300.0, "b.mp3": 600.0, "c.mp3": 100.0, "d.mp3": 300.0, "e.mp3": 200.0}
+    scheduler = TranscriptionScheduler(str(tmp_path / "runs.jsonl"), realtime_factor=0.1)
+    scheduler.probe_duration = durations.get
+
+    ordered, estimates, projected_seconds = scheduler.schedule(list(durations), workers=2)
+
+    assert ordered[0] == "b.mp3" and ordered[-1] == "c.mp3"
+    assert [estimates[mp3_path][1] for mp3_path in ordered] == pytest.approx([60.0, 30.0, 30.0, 20.0, 10.0])
+    # Greedy longest-first on two workers: 60 + 20 against 30 + 30 + 10
+    assert projected_seconds == pytest.approx(80.0)
+    assert scheduler.schedule(list(durations), workers=1)[2] == pytest.approx(150.0)
+
+
+def test_scheduler_learns_from_its_run_report(tmp_path):
+    report_path = str(tmp_path / "runs.jsonl")
+    scheduler = TranscriptionScheduler(report_path, realtime_factor=0.1)
+    scheduler.record("a.mp3", "Algebra", 100.0, 50.0)
+    scheduler.record("b.mp3", "Algebra", 300.0, 90.0)
+
+    later = TranscriptionScheduler(report_path, realtime_factor=0.1)
+    assert later.realtime_factor() == pytest.approx(140.0 / 400.0)
+    # A file seen before takes as long as it did; one with other audio (re-uploaded) is estimated afresh
+    assert later.estimate("a.mp3", 100.0) == pytest.approx(50.0)
+    assert later.estimate("b.mp3", 200.0) == pytest.approx(70.0)
+    assert later.estimate("c.mp3", 40.0) == pytest.approx(14.0)
+
+
+def test_scheduler_probes_the_duration_from_ffmpeg_headers(monkeypatch):
+    monkeypatch.setattr(flow.ffmpeg, "get_ffmpeg_exe", lambda: "ffmpeg", raising=False)
+    monkeypatch.setattr(flow.subprocess, "run", lambda *args, **kwargs: SimpleNamespace(stderr="Input #0, mp3\n  Duration: 01:02:03.50, start: 0.025056, bitrate: 64 kb/s"))
+    assert TranscriptionScheduler.probe_duration("lecture.mp3") == pytest.approx(3723.5)
+
+    monkeypatch.setattr(flow.subprocess, "run", lambda *args, **kwargs: SimpleNamespace(stderr="lecture.mp3: Invalid data found"))
+    assert TranscriptionScheduler.probe_duration("lecture.mp3") == 0.0
+
+
+def test_transcribe_longest_first_finalises_every_course(tmp_path, panel_master, flow_pipeline, monkeypatch):
+    add_course(panel_master, "Algebra", lectures=3)
+    add_course(panel_master, "Broken")
+    monkeypatch.setattr(TranscriptionScheduler, "probe_duration", classmethod(lambda cls, mp3_path: 60.0 * int(os.path.basename(mp3_path)[:2])))
+    report_path = str(tmp_path / "runs.jsonl")
+
+    flow_pipeline.steps.transcribe_longest_first(panel_master, flow_pipeline.processed_csv_path, transcription_workers=2, alt_docx="off", report_path=report_path)
+
+    with open(os.path.join(panel_master, "Algebra", "Algebra Transcriptions.json"), encoding="utf-8") as json_file:
+        assert sorted(json.load(json_file)) == ["1", "2", "3"]
+    assert sorted(os.listdir(os.path.join(panel_master, "Algebra", "lectures_folder"))) == ["01-Algebra.mp3", "02-Algebra.mp3", "03-Algebra.mp3"]
+    assert not os.path.exists(os.path.join(panel_master, "Broken", "Broken Transcriptions.json"))
+    assert sorted(TranscriptionScheduler(report_path).reports) == sorted(os.path.join(panel_master, "Algebra", f"0{i}-Algebra.mp3") for i in (1, 2, 3))
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    (tmp_path / "scratch").mkdir()
+    (tmp_path / "mount").mkdir()
+    mirror = ScratchMirror(str(tmp_path / "scratch"), str(tmp_path / "mount"), batch_seconds=0.05)
+    yield mirror
+    mirror.close()
+
+
+def test_scratch_mirror_replays_writes_moves_and_removals(tmp_path, mirror):
+    scratch, mount = tmp_path / "scratch", tmp_path / "mount"
+    (scratch / "Algebra").mkdir()
+    (scratch / "Algebra" / "01-Algebra.mp3").write_bytes(b"ID3 first")
+    (scratch / "Algebra" / "notes.txt").write_text("draft")
+    for path in ("Algebra", "Algebra/01-Algebra.mp3", "Algebra/notes.txt"):
+        mirror.publish(str(scratch / path))
+    (scratch / "Algebra" / "notes.txt").write_text("final")
+    mirror.publish(str(scratch / "Algebra" / "notes.txt"))
+    mirror.flush()
+    assert (mount / "Algebra" / "notes.txt").read_text() == "final"
+
+    (scratch / "Algebra" / "lectures_folder").mkdir()
+    os.replace(scratch / "Algebra" / "01-Algebra.mp3", scratch / "Algebra" / "lectures_folder" / "01-Algebra.mp3")
+    mirror.publish_move(str(scratch / "Algebra" / "01-Algebra.mp3"), str(scratch / "Algebra" / "lectures_folder" / "01-Algebra.mp3"))
+    (scratch / "Algebra" / "notes.txt").unlink()
+    mirror.publish_remove(str(scratch / "Algebra" / "notes.txt"))
+    stats = mirror.flush()
+
+    assert (mount / "Algebra" / "lectures_folder" / "01-Algebra.mp3").read_bytes() == b"ID3 first"
+    assert not (mount / "Algebra" / "01-Algebra.mp3").exists()
+    assert not (mount / "Algebra" / "notes.txt").exists()
+    assert (stats["copied"], stats["moved"], stats["removed"], stats["errors"]) == (2, 1, 1, 0)
+    assert mirror.verify(repair=False) == []
+
+
+def test_scratch_mirror_verify_finds_and_repairs_stale_copies(tmp_path, mirror):
+    scratch, mount = tmp_path / "scratch", tmp_path / "mount"
+    for name in ("missing.json", "stale.json", "tampered.json"):
+        (scratch / name).write_text("new")
+    # Same size but an older time, and same size & time but other contents
+    (mount / "stale.json").write_text("old")
+    os.utime(mount / "stale.json", (time.time() - 60, time.time() - 60))
+    (mount / "tampered.json").write_text("bad")
+    stat = os.stat(scratch / "tampered.json")
+    os.utime(mount / "tampered.json", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert sorted(os.path.basename(path) for path in mirror.verify(repair=False)) == ["missing.json", "stale.json"]
+    assert sorted(os.path.basename(path) for path in mirror.verify(repair=False, checksum=True)) == ["missing.json", "stale.json", "tampered.json"]
+
+    mirror.verify(repair=True, checksum=True)
+    assert [(mount / name).read_text() for name in ("missing.json", "stale.json", "tampered.json")] == ["new"] * 3
+    assert mirror.verify(repair=False, checksum=True) == []
+
+
+def test_scratch_workspace_keeps_shared_state_on_the_mount(tmp_path, panel_master, flow_pipeline):
+    add_course(panel_master, "Algebra")
+    with open(os.path.join(panel_master, "prompt_stats.json"), "w", encoding="utf-8") as stats_file:
+        json.dump({}, stats_file)
+    steps = flow_pipeline.steps
+    scratch_path = steps.open_scratch_workspace(panel_master, str(tmp_path / "scratch"), batch_seconds=0.05)
+
+    assert os.path.isfile(os.path.join(scratch_path, "Algebra", "01-Algebra.mp3"))
+    assert not os.path.exists(os.path.join(scratch_path, "prompt_stats.json"))
+    assert steps.load_prompt_stats(scratch_path).stats_path == os.path.join(panel_master, "prompt_stats.json")
+
+    steps.transcribe_with_course_queue(scratch_path, flow_pipeline.processed_csv_path, worker_id="scratch", alt_docx="off")
+    assert os.path.isfile(os.path.join(panel_master, "course_queue.sqlite3"))
+    assert not os.path.exists(os.path.join(scratch_path, "course_queue.sqlite3"))
+
+    assert steps.close_scratch_workspace(scratch_path) == []
+    assert os.path.isfile(os.path.join(panel_master, "Algebra", "Algebra Transcriptions.json"))
+    assert sorted(os.listdir(os.path.join(panel_master, "Algebra", "lectures_folder"))) == ["01-Algebra.mp3", "02-Algebra.mp3"]
+    assert not os.path.exists(os.path.join(panel_master, "Algebra", "01-Algebra.mp3"))
+
+
+def test_manifest_indexes_rows_by_course_and_lecture_number(tmp_path):
+    manifest = FlowManifest(write_manifest(str(tmp_path / "processed.csv"), [
+        {"Id": "11", "Name": "01-Intro", "Mp3": "a/01.mp3", "Course_Name": "Algebra"},
+        {"Id": "12.0", "Name": "02-Vectors", "Mp3": "a/02.mp3", "Course_Name": "Algebra"},
+        {"Id": "13", "Name": "02-Vectors (re-upload)", "Mp3": "a/02b.mp3", "Course_Name": "Algebra"},
+        {"Id": "", "Name": "01-Waves", "Mp3": "p/01.mp3", "Course_Name": "Physics"},
+    ]))
+
+    assert manifest.columns == ["Id", "Name", "Mp3", "Course_Name"]
+    assert manifest.courses() == ["Algebra", "Physics"]
+    assert [row["Mp3"] for row in manifest.rows_for_course("Algebra")] == ["a/01.mp3", "a/02.mp3", "a/02b.mp3"]
+    assert manifest.rows_for_course("Chemistry") == []
+
+    assert manifest.video_id("Algebra", 1) == 11
+    # The first row of a lecture number wins, and whole-number floats are read as ids
+    assert manifest.video_id("Algebra", "2") == 12
+    assert manifest.has_video("Physics", 1) and manifest.video_id("Physics", 1) is None
+    assert not manifest.has_video("Physics", 2) and manifest.video_id("Physics", 2) is None
+
+
+class RecordingMirror:
+    def __init__(self):
+        self.operations = []
+
+    def publish(self, path):
+        self.operations.append(("copy", path))
+
+    def publish_move(self, src, dst):
+        self.operations.append(("move", src, dst))
+
+    def publish_remove(self, path):
+        self.operations.append(("remove", path))
+
+
+def test_inventory_answers_from_its_snapshot(tmp_path, panel_master):
+    add_course(panel_master, "Algebra")
+    inventory = PanelInventory(panel_master)
+    algebra = os.path.join(panel_master, "Algebra")
+
+    assert inventory.isdir(algebra) and inventory.isfile(os.path.join(algebra, "01-Algebra.mp3"))
+    assert sorted(inventory.listdir(algebra)) == ["01-Algebra.mp3", "02-Algebra.mp3"]
+    # Changes behind the snapshot are only seen after a refresh
+    add_course(panel_master, "Physics")
+    assert not inventory.exists(os.path.join(panel_master, "Physics"))
+    inventory.refresh(panel_master)
+    assert sorted(inventory.listdir(panel_master)) == ["Algebra", "Physics"]
+
+    with pytest.raises(FileNotFoundError):
+        inventory.listdir(os.path.join(panel_master, "Chemistry"))
+    # Paths outside panel_master go to the file system
+    assert inventory.exists(str(tmp_path)) and not inventory.isdir(str(tmp_path / "elsewhere"))
+
+
+def test_inventory_records_writes_moves_and_removals(panel_master):
+    add_course(panel_master, "Algebra")
+    inventory = PanelInventory(panel_master)
+    inventory.mirror = RecordingMirror()
+    algebra = os.path.join(panel_master, "Algebra")
+    lectures_folder = os.path.join(algebra, "lectures_folder")
+
+    inventory.add_file(os.path.join(algebra, "Algebra Transcriptions.json"))
+    inventory.add_dir(lectures_folder)
+    inventory.move(os.path.join(algebra, "01-Algebra.mp3"), lectures_folder)
+    inventory.move(algebra, os.path.join(panel_master, "Linear Algebra"))
+    inventory.remove(os.path.join(panel_master, "Linear Algebra", "02-Algebra.mp3"))
+
+    assert [root for root, dirs, files in inventory.walk(panel_master)] == [panel_master, os.path.join(panel_master, "Linear Algebra"), os.path.join(panel_master, "Linear Algebra", "lectures_folder")]
+    assert sorted(inventory.listdir(os.path.join(panel_master, "Linear Algebra"))) == ["Algebra Transcriptions.json", "lectures_folder"]
+    assert inventory.listdir(os.path.join(panel_master, "Linear Algebra", "lectures_folder")) == ["01-Algebra.mp3"]
+    assert not inventory.exists(algebra)
+    assert inventory.mirror.operations == [
+        ("copy", os.path.join(algebra, "Algebra Transcriptions.json")),
+        ("copy", lectures_folder),
+        ("move", os.path.join(algebra, "01-Algebra.mp3"), os.path.join(lectures_folder, "01-Algebra.mp3")),
+        ("move", algebra, os.path.join(panel_master, "Linear Algebra")),
+        ("remove", os.path.join(panel_master, "Linear Algebra", "02-Algebra.mp3")),
+    ]
+
+
+def spoken_segments(text, start = 0.0):
+    words = text.split()
+    return [{"start": start, "end": start + len(words), "text": text,
+             "words": [(start + i, start + i + 0.8, f" {word}") for i, word in enumerate(words)]}]
+
+
+def test_word_timings_round_trip_and_merge(tmp_path):
+    store = WordTimingStore()
+    store.add_lecture(1, spoken_segments("Hello, world hello") + spoken_segments("again", 10))
+    store.add_lecture("2", [{"start": 0, "end": 1, "text": "", "words": None}])
+
+    assert store.vocabulary == ["hello", "world", "again"]
+    assert store.lectures[1][0].tolist() == [0, 1, 0, 2]
+    assert store.lectures[1][3].tolist() == [0, 3]
+    assert store.has_lecture("1") and not store.has_lecture(2) and not store.has_lecture(3)
+
+    path = str(tmp_path / "word_timings.bin")
+    store.save(path)
+    loaded = WordTimingStore.load(path)
+    assert loaded.vocabulary == store.vocabulary
+    assert [array.tolist() for array in loaded.lectures[1]] == [array.tolist() for array in store.lectures[1]]
+
+    other = WordTimingStore()
+    other.add_lecture(1, spoken_segments("replaced"))
+    other.add_lecture(3, spoken_segments("again world new"))
+    loaded.merge(other)
+    # Lectures already in the store are kept; the others are re-mapped onto its vocabulary
+    assert [loaded.vocabulary[token] for token in loaded.lectures[1][0]] == ["hello", "world", "hello", "again"]
+    assert [loaded.vocabulary[token] for token in loaded.lectures[3][0]] == ["again", "world", "new"]
+
+
+def test_word_timings_align_script_paragraphs():
+    spoken = "um so today we talk about vectors a vector has a size and a direction er next we add two vectors head to tail"
+    store = WordTimingStore()
+    store.add_lecture(7, spoken_segments(spoken, 100))
+    words = spoken.split()
+    paragraphs = ["Today we talk about vectors.", "A vector has a size and a direction.", "Nothing here was said.", "Next, we add two vectors head to tail!"]
+
+    alignments = store.align_paragraphs(7, paragraphs)
+
+    assert alignments[0] == ("Today we", "about vectors.", 100 + words.index("today"), int(100 + words.index("vectors") + 0.8))
+    assert alignments[1][:2] == ("A vector", "a direction.") and alignments[1][2] == 100 + words.index("a")
+    assert alignments[2] is None
+    assert alignments[3][:2] == ("Next, we", "to tail!") and alignments[3][3] == int(100 + len(words) - 1 + 0.8)
+
+
+def test_lecture_segments_round_trip_through_transcriptions_json(tmp_path):
+    lecture = LectureSegments.from_segments(1, 101, [{"start": 0.4, "end": 5.9, "text": " ازيك"}, {"start": 5.9, "end": 9.2, "text": " عامل ايه"}])
+    lecture.extend(LectureSegments(1).extend([(9, 12, " النهارده")]))
+    assert len(lecture) == 3
+    assert list(lecture) == [(0, 5, " ازيك"), (5, 9, " عامل ايه"), (9, 12, " النهارده")]
+
+    path = str(tmp_path / "Algebra Transcriptions.json")
+    LectureSegments.save_course(path, {1: lecture, 2: LectureSegments(2, 102)})
+    with open(path, encoding="utf-8") as json_file:
+        course = LectureSegments.load_course(json.load(json_file))
+
+    assert sorted(course) == ["1", "2"]
+    assert (course["1"].sql_id, course["1"].video_id, list(course["1"])) == (1, 101, list(lecture))
+    assert (course["2"].video_id, len(course["2"])) == (102, 0)
+
+
+def test_lecture_segments_load_the_legacy_per_segment_format():
+    legacy = {"3": [{"videoId": 103, "paragraphInfo": {"startSecond": 0, "endSecond": 4, "paragraphDetails": " اهلا"}},
+                    {"videoId": 103, "paragraphInfo": {"startSecond": 4, "endSecond": 8, "paragraphDetails": " بيكم"}}],
+              "4": []}
+    loaded = LectureSegments(5, 105)
+
+    course = LectureSegments.load_course({**legacy, "5": loaded})
+
+    assert (course["3"].sql_id, course["3"].video_id, list(course["3"])) == (3, 103, [(0, 4, " اهلا"), (4, 8, " بيكم")])
+    assert course["4"].video_id is None and len(course["4"]) == 0
+    assert course["5"] is loaded
+
+
+def test_ledger_yields_only_the_delta_of_each_drop(tmp_path):
+    ledger = ManifestLedger(str(tmp_path / "ledger.sqlite3"))
+    first_drop = [
+        {"Id": 11, "Name": "01-Intro", "Mp3": "a/01.mp3", "Course_Name": "Algebra"},
+        {"Id": 12, "Name": "02-Vectors", "Mp3": "a/02.mp3", "Course_Name": "Algebra"},
+        {"Id": 21, "Name": "01-Waves", "Mp3": "p/01.mp3", "Course_Name": "Physics"},
+    ]
+    assert ledger.delta(first_drop) == first_drop
+    # Rows not processed yet come back with the next drop
+    assert ledger.delta(first_drop[:1]) == first_drop[:1]
+
+    pending = ledger.pending_rows()
+    assert {course: [name for name, _ in rows] for course, rows in pending.items()} == {"Algebra": ["01-Intro", "02-Vectors"], "Physics": ["01-Waves"]}
+    assert ledger.mark_done("Algebra", pending["Algebra"]) == 2
+    assert ledger.status() == {"done": 2, "pending": 1}
+
+    second_drop = [
+        {"Id": 11, "Name": "01-Intro", "Mp3": "a/01.mp3", "Course_Name": "Algebra"},
+        {"Id": 12, "Name": "02-Vectors", "Mp3": "a/02-fixed.mp3", "Course_Name": "Algebra"},
+        {"Id": 13.0, "Name": "03-Matrices", "Mp3": "a/03.mp3", "Course_Name": "Algebra"},
+    ]
+    assert ledger.delta(second_drop) == second_drop[1:]
+
+
+def test_ledger_keeps_rows_a_newer_drop_made_pending(tmp_path):
+    ledger = ManifestLedger(str(tmp_path / "ledger.sqlite3"))
+    rows = [{"Id": 11, "Name": "01-Intro", "Mp3": "a/01.mp3", "Course_Name": "Algebra"}]
+    ledger.delta(rows)
+    snapshot = ledger.pending_rows()["Algebra"]
+
+    # The course is re-queued by a newer drop while the old snapshot is still being processed
+    time.sleep(0.01)
+    ledger.delta([{**rows[0], "Mp3": "a/01-fixed.mp3"}])
+    assert ledger.mark_done("Algebra", snapshot) == 0
+    assert ledger.status() == {"pending": 1}
+
+
+def test_ledger_supersedes_the_lecture_number_of_a_renamed_row(tmp_path):
+    ledger = ManifestLedger(str(tmp_path / "ledger.sqlite3"))
+    ledger.delta([{"Id": 11, "Name": "01-Intro", "Mp3": "a/01.mp3", "Course_Name": "Algebra"},
+                  {"Id": 12, "Name": "02-Vectors", "Mp3": "a/02.mp3", "Course_Name": "Algebra"}])
+    ledger.mark_done("Algebra", ledger.pending_rows()["Algebra"])
+
+    renamed = {"Id": 12, "Name": "05-Vectors", "Mp3": "a/02.mp3", "Course_Name": "Algebra"}
+    assert ledger.delta([renamed]) == [renamed]
+    assert ledger.superseded_sql_ids("Algebra") == {2}
+    assert ledger.superseded_sql_ids("Physics") == set()
+
+    # A lecture number that is used again is no longer superseded
+    ledger.delta([{"Id": 14, "Name": "02-Matrices", "Mp3": "a/04.mp3", "Course_Name": "Algebra"}])
+    assert ledger.superseded_sql_ids("Algebra") == set()
+
+
+def test_prompt_stats_rank_by_shrunk_pass_rates(tmp_path):
+    stats = PromptStats(str(tmp_path / "prompt_stats.json"), course_weight=5)
+    prompts = ["formal", "dialect", "mixed"]
+    assert stats.ranked("Algebra", prompts) == prompts
+
+    for _ in range(20):
+        stats.record("Physics", "dialect", True)
+        stats.record("Physics", "formal", False)
+    # Algebra has no counts of its own yet, so it follows the overall rates
+    assert stats.ranked("Algebra", prompts) == ["dialect", "mixed", "formal"]
+
+    # Two Algebra failures are not enough to outweigh twenty overall passes...
+    stats.record("Algebra", "dialect", False)
+    stats.record("Algebra", "dialect", False)
+    assert stats.ranked("Algebra", prompts)[0] == "dialect"
+    # ...but many are
+    for _ in range(20):
+        stats.record("Algebra", "dialect", False)
+    assert stats.ranked("Algebra", prompts) == ["mixed", "dialect", "formal"]
+
+    reloaded = PromptStats(stats.stats_path)
+    assert reloaded.counts[None]["dialect"] == [42, 20]
+    assert reloaded.counts["Algebra"]["dialect"] == [22, 0]
+
+
+def test_prompt_stats_of_concurrent_workers_are_merged(tmp_path):
+    stats_path = str(tmp_path / "prompt_stats.json")
+    workers = [PromptStats(stats_path) for _ in range(4)]
+
+    def record(worker):
+        for i in range(25):
+            worker.record("Algebra", "dialect", i % 5 == 0)
+
+    threads = [threading.Thread(target=record, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(stats_path, encoding="utf-8") as stats_file:
+        stored = json.load(stats_file)
+    assert stored["overall"]["dialect"] == [100, 20]
+    assert stored["courses"]["Algebra"]["dialect"] == [100, 20]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_streamed_docx_holds_every_paragraph_as_text(tmp_path):
+    docx_path = str(tmp_path / "Algebra AltTranscriptions.docx")
+    paragraphs = ["Lecture 01", "ازيك <عامل> ايه & النهارده", "  leading spaces", "bell\x07 removed"]
+    with StreamingDocxWriter(docx_path) as writer:
+        for paragraph in paragraphs:
+            writer.add_paragraph(paragraph)
+
+    with zipfile.ZipFile(docx_path) as package:
+        assert {"[Content_Types].xml", "_rels/.rels", "word/_rels/document.xml.rels", "word/styles.xml", "word/document.xml"} <= set(package.namelist())
+        document = ElementTree.fromstring(package.read("word/document.xml"))
+    namespace = {"w": StreamingDocxWriter.W_NAMESPACE}
+    texts = [paragraph.findtext("w:r/w:t", namespaces=namespace) for paragraph in document.iterfind("w:body/w:p", namespace)]
+    assert texts == ["Lecture 01", "ازيك <عامل> ايه & النهارده", "  leading spaces", "bell removed"]
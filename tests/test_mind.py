@@ -0,0 +1,147 @@
+import asyncio
+import json
+import math
+import os
+
+import numpy as np
+import pytest
+
+from ro2ya.mind import MindCohortStats, MindService, generate_assessment_database, mind, mind_batch, mind_session
+
+from mind_baseline import mind as baseline_mind
+
+
+def assert_same_result(result, expected, path = "result"):
+    if isinstance(expected, dict):
+        assert sorted(result.keys()) == sorted(expected.keys()), path
+        for key in expected:
+            assert_same_result(result[key], expected[key], f"{path}.{key}")
+    elif isinstance(expected, float):
+        assert math.isclose(result, expected, rel_tol=1e-9, abs_tol=1e-12), path
+    else:
+        assert result == expected, path
+
+
+@pytest.fixture(scope="module", params=[(40, 3, 6, 0), (60, 3, 8, 1), (90, 4, 8, 2)], ids=lambda params: f"q{params[0]}-seed{params[3]}")
+def database(request, tmp_path_factory):
+    questions, spaces, qtm_traits, seed = request.param
+    path = os.path.join(tmp_path_factory.mktemp("mind"), "assessment.db")
+    generate_assessment_database(path, questions=questions, spaces=spaces, qtm_traits=qtm_traits, seed=seed)
+    return path, questions, seed
+
+
+def random_responses(questions, seed, respondents = 25):
+    return np.random.default_rng(seed).integers(1, 5, size=(respondents, questions)).tolist()
+
+
+def test_mind_matches_baseline(database):
+    path, questions, seed = database
+    for responses in random_responses(questions, seed):
+        assert_same_result(dict(mind(responses, path)), baseline_mind(responses, path))
+
+
+def test_mind_batch_matches_baseline(database):
+    path, questions, seed = database
+    cohort = random_responses(questions, seed + 100)
+    for responses, result in zip(cohort, mind_batch(cohort, path)):
+        assert_same_result(dict(result), baseline_mind(responses, path))
+
+
+def test_mind_accepts_whole_number_floats(database):
+    path, questions, seed = database
+    responses = random_responses(questions, seed, respondents=1)[0]
+    assert_same_result(dict(mind([float(response) for response in responses], path)), baseline_mind(responses, path))
+
+
+@pytest.mark.parametrize("bad_response", [2.5, "2", None, 0, 5])
+def test_mind_rejects_invalid_responses(database, bad_response):
+    path, questions, seed = database
+    responses = random_responses(questions, seed, respondents=1)[0]
+    responses[questions // 2] = bad_response
+    with pytest.raises(ValueError):
+        mind(responses, path)
+
+
+def test_session_matches_baseline_in_any_order(database):
+    path, questions, seed = database
+    responses = random_responses(questions, seed, respondents=1)[0]
+    session = mind_session(path)
+    for position in reversed(range(questions)):
+        session.answer(position, 5 - responses[position])
+    for position in np.random.default_rng(seed).permutation(questions):
+        session.answer(int(position), responses[position])
+    assert_same_result(dict(session.result()), baseline_mind(responses, path))
+
+
+@pytest.mark.parametrize("bad_response", [True, False, np.True_, 2.5, "2", None, 0, 5])
+def test_session_rejects_invalid_responses(database, bad_response):
+    path, questions, seed = database
+    session = mind_session(path)
+    session.answer(0, 1)
+    with pytest.raises(ValueError):
+        session.answer(1, bad_response)
+    assert session.answers == {0: 1}
+
+
+def test_cohort_stats_merge_like_one_pass(database, tmp_path):
+    path, questions, seed = database
+    results = mind_batch(random_responses(questions, seed, respondents=40), path)
+    whole = MindCohortStats()
+    whole.add_batch(results)
+
+    first, second = MindCohortStats(), MindCohortStats()
+    first.add_batch(results[:15])
+    second.add_batch(results[15:])
+    merged = MindCohortStats.load(first.merge(second).save(str(tmp_path / "cohort.json")))
+
+    norms, expected = merged.norms(), whole.norms()
+    assert norms["users"] == expected["users"] == 40
+    assert norms["types"] == expected["types"]
+    assert sorted(norms["scores"]) == sorted(expected["scores"])
+    for column, column_norms in expected["scores"].items():
+        assert norms["scores"][column]["count"] == column_norms["count"]
+        assert norms["scores"][column]["p50"] == pytest.approx(column_norms["p50"])
+        assert norms["scores"][column]["mean"] == pytest.approx(column_norms["mean"])
+
+
+def test_cohort_stats_refuse_to_merge_other_accuracies(database):
+    path, questions, seed = database
+    results = mind_batch(random_responses(questions, seed, respondents=5), path)
+    stats, coarse = MindCohortStats(), MindCohortStats(relative_accuracy=0.05)
+    coarse.add_batch(results)
+
+    # stats has no columns yet, so nothing but the accuracy check can catch the mismatch
+    with pytest.raises(ValueError):
+        stats.merge(coarse)
+    assert (stats.users, stats.scores, stats.types) == (0, {}, {})
+
+
+@pytest.fixture
+def service(database):
+    service = MindService(database[0])
+    yield service
+    service.pool.close()
+
+
+def test_service_scores_like_mind(database, service):
+    path, questions, seed = database
+    cohort = random_responses(questions, seed, respondents=3)
+
+    async def score():
+        return await asyncio.gather(*(service.score([responses]) for responses in cohort))
+
+    for responses, results in zip(cohort, asyncio.run(score())):
+        assert_same_result(dict(results[0]), baseline_mind(responses, path))
+
+
+@pytest.mark.parametrize("bad_response", [2.5, "2", None, 0])
+def test_service_answers_invalid_responses_with_400(database, service, bad_response):
+    path, questions, seed = database
+    responses = random_responses(questions, seed, respondents=1)[0]
+    responses[questions // 2] = bad_response
+
+    with pytest.raises(ValueError):
+        asyncio.run(service.score([responses]))
+    status, payload = asyncio.run(service.route("POST", "/score", json.dumps({"responses": responses}).encode("utf-8")))
+    assert status == "400 Bad Request"
+    assert payload["error"].startswith("ValueError")